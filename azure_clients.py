@@ -0,0 +1,141 @@
+import logging
+import threading
+import time
+from urllib.parse import urlsplit, unquote
+from azure.core import MatchConditions
+from azure.core.exceptions import (ClientAuthenticationError, ResourceExistsError, ResourceModifiedError,
+                                   ServiceRequestError)
+from azure.storage.blob import BlobClient, BlobServiceClient, ContainerClient
+from azure.confidentialledger.client import ConfidentialLedgerClient
+from azure.confidentialledger.certificate import ConfidentialLedgerCertificateClient
+from azure.identity import ManagedIdentityCredential
+
+# --- CONFIGURATION ---
+LEDGER_CLIENT_TTL_SECONDS = 60 * 60  # Re-fetch the ledger identity certificate hourly
+DOWNLOAD_CHUNK_BYTES = 4 * 1024**2   # download_blob_to writes blobs in chunks of this size
+
+
+class AzureBackend:
+    """
+    Blob download and ledger append with clients cached for the lifetime of
+    the worker process. The credential keeps its own token cache and renews
+    tokens before they expire; blob service clients are shared per storage
+    account so their connection pool is reused; the ledger identity
+    certificate and ledger client are rebuilt after LEDGER_CLIENT_TTL_SECONDS
+    or after a failed append.
+    """
+
+    def __init__(self, ledger_endpoint, identity_client_id, ledger_ttl=LEDGER_CLIENT_TTL_SECONDS,
+                 download_chunk_bytes=DOWNLOAD_CHUNK_BYTES):
+        self.ledger_endpoint = ledger_endpoint
+        self.identity_client_id = identity_client_id
+        self.ledger_ttl = ledger_ttl
+        self.download_chunk_bytes = download_chunk_bytes
+        self._lock = threading.Lock()
+        self._credential = None
+        self._blob_services = {}
+        self._ledger_client = None
+        self._ledger_expires = 0.0
+
+    @property
+    def credential(self):
+        with self._lock:
+            if self._credential is None:
+                self._credential = ManagedIdentityCredential(client_id=self.identity_client_id)
+            return self._credential
+
+    def _blob_service(self, account_url):
+        credential = self.credential
+        with self._lock:
+            service = self._blob_services.get(account_url)
+            if service is None:
+                service = BlobServiceClient(account_url, credential=credential,
+                                            max_single_get_size=self.download_chunk_bytes,
+                                            max_chunk_get_size=self.download_chunk_bytes)
+                self._blob_services[account_url] = service
+        return service
+
+    def blob_client(self, blob_url):
+        parts = urlsplit(blob_url)
+        if parts.query:
+            # SAS URLs carry their own credential
+            return BlobClient.from_blob_url(blob_url, max_single_get_size=self.download_chunk_bytes,
+                                            max_chunk_get_size=self.download_chunk_bytes)
+        container, _, blob_name = parts.path.lstrip('/').partition('/')
+        service = self._blob_service(f"{parts.scheme}://{parts.netloc}")
+        return service.get_blob_client(container=container, blob=unquote(blob_name))
+
+    def container_client(self, container_url):
+        parts = urlsplit(container_url)
+        if parts.query:
+            return ContainerClient.from_container_url(container_url)
+        service = self._blob_service(f"{parts.scheme}://{parts.netloc}")
+        return service.get_container_client(parts.path.strip('/'))
+
+    def download_blob(self, blob_url):
+        return self.blob_client(blob_url).download_blob().readall()
+
+    def blob_etag(self, blob_url):
+        return self.blob_client(blob_url).get_blob_properties().etag
+
+    def download_blob_to(self, blob_url, stream, etag=None):
+        """
+        Streams the blob into stream.write() in download_chunk_bytes chunks
+        and returns the etag of what was downloaded. With etag, fails if the
+        blob has changed since.
+        """
+        blob_client = self.blob_client(blob_url)
+        conditions = {'etag': etag, 'match_condition': MatchConditions.IfNotModified} if etag else {}
+        downloader = blob_client.download_blob(**conditions)
+        for chunk in downloader.chunks():
+            stream.write(chunk)
+        return downloader.properties.etag
+
+    def upload_blob(self, blob_url, data, overwrite=True, etag=None):
+        """
+        With overwrite=False the upload fails if the blob exists; with etag it
+        fails unless the blob still has that etag. Either failure raises
+        FileExistsError so callers need not import the Azure exceptions.
+        """
+        conditions = {'etag': etag, 'match_condition': MatchConditions.IfNotModified} if etag else {}
+        try:
+            self.blob_client(blob_url).upload_blob(data, overwrite=overwrite, **conditions)
+        except (ResourceExistsError, ResourceModifiedError) as e:
+            raise FileExistsError(f"{blob_url}: {e}") from e
+
+    def list_blobs(self, container_url, prefix=''):
+        return sorted(blob.name for blob in self.container_client(container_url).list_blobs(name_starts_with=prefix))
+
+    def ledger_client(self):
+        credential = self.credential
+        with self._lock:
+            if self._ledger_client is None or time.monotonic() >= self._ledger_expires:
+                logging.info("Fetching ledger identity certificate...")
+                cert_client = ConfidentialLedgerCertificateClient(credential)
+                ledger_cert = cert_client.get_ledger_identity(ledger_id=self.ledger_endpoint.split('.')[0])
+                self._ledger_client = ConfidentialLedgerClient(endpoint=self.ledger_endpoint, credential=credential,
+                                                               ledger_certificate=ledger_cert)
+                self._ledger_expires = time.monotonic() + self.ledger_ttl
+            return self._ledger_client
+
+    def invalidate_ledger_client(self):
+        with self._lock:
+            self._ledger_client = None
+
+    def append_ledger_entry(self, entry):
+        """
+        Appends an entry and returns its transaction id. Retries once with
+        fresh clients, but only after errors that mean the entry was not
+        appended: a rejected or unobtainable credential, or a connection that
+        failed before the request was sent. Anything else (e.g. a timeout
+        waiting for the response) is raised, since retrying could append the
+        entry twice.
+        """
+        try:
+            result = self.ledger_client().append_entry(entry=entry)
+        except (ClientAuthenticationError, ServiceRequestError) as e:
+            logging.warning(f"Ledger append failed before reaching the ledger ({e}); "
+                            f"refreshing ledger client and retrying.")
+            self.invalidate_ledger_client()
+            result = self.ledger_client().append_entry(entry=entry)
+        return result['transaction_id']
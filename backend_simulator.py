@@ -1,9 +1,15 @@
+import argparse
+import asyncio
 import json
 import time
 import random
 import math
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
+import numpy as np
+from prediction_store import PredictionStore
+from prediction_stream import serve, STREAM_HOST, STREAM_PORT
+from profiling import profiled
 
 # --- Configuration ---
 # You can tweak these values to change the simulation
@@ -12,7 +18,8 @@ DAILY_VARIATION = 500       # How much consumption fluctuates during the day
 NOISE_LEVEL = 50            # Random noise to make it look real
 MAX_ERROR_PERCENT = 8.0     # Maximum % error for the prediction
 SECONDS_BETWEEN_FILES = 5   # Generate a new file every 5 seconds
-NUMBER_OF_FILES = 50        # Generate 50 files in total
+NUMBER_OF_FILES = 50        # Generate 50 predictions in total
+OUTPUT_DIR = "public/frontend_data"
 
 # Federated Learning Configuration
 FEDERATED_NODES = [
@@ -23,88 +30,292 @@ FEDERATED_NODES = [
     {"id": "node_central", "name": "Central Mangalore Node", "weight": 0.15}
 ]
 
+# Bulk (load-test) mode configuration
+BULK_CHUNK_STEPS = 1024     # Timesteps generated per vectorized chunk
+NODE_ACCURACY_RANGE = (85, 98)
+NODE_VARIATION = 0.1        # ±10% variation per node
+MODEL_PATCH_VERSIONS = 6    # model_version is 2.1.0 - 2.1.5
+
 # --- Main Simulation ---
 
+@profiled('simulator.make_prediction')
+def make_prediction(i):
+    """Simulates the i-th prediction record, with its federated node breakdown."""
+    # Simulate time passing to create a daily cycle
+    # Each step is like an hour passing for the sine wave
+    time_step = i 
+    daily_cycle = math.sin(2 * math.pi * time_step / 24) # 24-hour cycle
+
+    # 1. Calculate the "Actual" value
+    noise = random.uniform(-NOISE_LEVEL, NOISE_LEVEL)
+    actual_value = BASE_CONSUMPTION_KW + (daily_cycle * DAILY_VARIATION) + noise
+
+    # 2. Calculate a realistic "Predicted" value
+    error_multiplier = 1 + random.uniform(-MAX_ERROR_PERCENT / 100, MAX_ERROR_PERCENT / 100)
+    predicted_value = actual_value * error_multiplier
+    
+    # Ensure predictions are non-negative
+    actual_value = max(0, actual_value)
+    predicted_value = max(0, predicted_value)
+
+    # 3. Calculate metrics
+    error_percent = abs(predicted_value - actual_value) / (actual_value + 1e-9) * 100
+    status = "✅ Success" if error_percent < 5 else "⚠️ Warning"
+
+    # 4. Generate federated learning node contributions
+    node_contributions = []
+    total_weighted_prediction = 0
+    
+    for node in FEDERATED_NODES:
+        # Each node generates its own local prediction with some variation
+        node_variation = random.uniform(-0.1, 0.1)  # ±10% variation per node
+        node_prediction = predicted_value * (1 + node_variation)
+        node_accuracy = random.uniform(85, 98)  # Node accuracy between 85-98%
+        
+        node_data = {
+            "node_id": node["id"],
+            "node_name": node["name"],
+            "local_prediction_kw": round(node_prediction, 2),
+            "node_weight": node["weight"],
+            "accuracy_score": round(node_accuracy, 2),
+            "contribution": round(node_prediction * node["weight"], 2)
+        }
+        node_contributions.append(node_data)
+        total_weighted_prediction += node_data["contribution"]
+
+    # 5. Create the JSON payload with federated learning data
+    prediction_data = {
+        "timestamp_utc": datetime.utcnow().isoformat() + "Z",
+        "prediction_id": f"pred_{int(time.time())}_{i}",
+        "actual_24h_sum_kw": round(actual_value, 2),
+        "predicted_24h_sum_kw": round(predicted_value, 2),
+        "federated_prediction_kw": round(total_weighted_prediction, 2),
+        "error_percent": round(error_percent, 2),
+        "federated_error_percent": round(abs(total_weighted_prediction - actual_value) / (actual_value + 1e-9) * 100, 2),
+        "status": status,
+        "model_version": f"2.1.{random.randint(0, 5)}",
+        "federated_nodes": node_contributions,
+        "aggregation_method": "weighted_average",
+        "total_nodes": len(FEDERATED_NODES)
+    }
+    return prediction_data
+
+
 def generate_predictions():
-    output_dir = "public/frontend_data"
+    output_dir = OUTPUT_DIR
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
         print(f"Created directory: {output_dir}")
+    # latest.json manifest + append-only NDJSON history
+    store = PredictionStore(output_dir)
 
     print("Starting backend simulation...")
-    print(f"Generating {NUMBER_OF_FILES} prediction files every {SECONDS_BETWEEN_FILES} seconds.")
+    print(f"Generating {NUMBER_OF_FILES} predictions every {SECONDS_BETWEEN_FILES} seconds.")
     print("Press Ctrl+C to stop.")
 
     for i in range(NUMBER_OF_FILES):
-        # Simulate time passing to create a daily cycle
-        # Each step is like an hour passing for the sine wave
-        time_step = i 
-        daily_cycle = math.sin(2 * math.pi * time_step / 24) # 24-hour cycle
-
-        # 1. Calculate the "Actual" value
-        noise = random.uniform(-NOISE_LEVEL, NOISE_LEVEL)
-        actual_value = BASE_CONSUMPTION_KW + (daily_cycle * DAILY_VARIATION) + noise
-
-        # 2. Calculate a realistic "Predicted" value
-        error_multiplier = 1 + random.uniform(-MAX_ERROR_PERCENT / 100, MAX_ERROR_PERCENT / 100)
-        predicted_value = actual_value * error_multiplier
-        
-        # Ensure predictions are non-negative
-        actual_value = max(0, actual_value)
-        predicted_value = max(0, predicted_value)
+        prediction_data = make_prediction(i)
 
-        # 3. Calculate metrics
-        error_percent = abs(predicted_value - actual_value) / (actual_value + 1e-9) * 100
-        status = "✅ Success" if error_percent < 5 else "⚠️ Warning"
+        # Append to the history and atomically publish the new manifest
+        store.append(prediction_data)
 
-        # 4. Generate federated learning node contributions
-        node_contributions = []
-        total_weighted_prediction = 0
-        
-        for node in FEDERATED_NODES:
-            # Each node generates its own local prediction with some variation
-            node_variation = random.uniform(-0.1, 0.1)  # ±10% variation per node
-            node_prediction = predicted_value * (1 + node_variation)
-            node_accuracy = random.uniform(85, 98)  # Node accuracy between 85-98%
-            
-            node_data = {
-                "node_id": node["id"],
-                "node_name": node["name"],
-                "local_prediction_kw": round(node_prediction, 2),
-                "node_weight": node["weight"],
-                "accuracy_score": round(node_accuracy, 2),
-                "contribution": round(node_prediction * node["weight"], 2)
-            }
-            node_contributions.append(node_data)
-            total_weighted_prediction += node_data["contribution"]
-
-        # 5. Create the JSON payload with federated learning data
-        prediction_data = {
-            "timestamp_utc": datetime.utcnow().isoformat() + "Z",
-            "prediction_id": f"pred_{int(time.time())}_{i}",
-            "actual_24h_sum_kw": round(actual_value, 2),
-            "predicted_24h_sum_kw": round(predicted_value, 2),
-            "federated_prediction_kw": round(total_weighted_prediction, 2),
-            "error_percent": round(error_percent, 2),
-            "federated_error_percent": round(abs(total_weighted_prediction - actual_value) / (actual_value + 1e-9) * 100, 2),
-            "status": status,
-            "model_version": f"2.1.{random.randint(0, 5)}",
-            "federated_nodes": node_contributions,
+        print(f"Generated {prediction_data['prediction_id']} -> Predicted: {prediction_data['predicted_24h_sum_kw']:.2f} kW")
+
+        # Wait before generating the next prediction
+        time.sleep(SECONDS_BETWEEN_FILES)
+
+    store.close()
+    print("\nSimulation finished.")
+
+
+async def stream_predictions(count, interval_seconds):
+    """Async generator of count simulated records (forever when count is None), interval_seconds apart."""
+    i = 0
+    while count is None or i < count:
+        if i:
+            await asyncio.sleep(interval_seconds)
+        yield make_prediction(i)
+        i += 1
+
+
+def run_server(host, port, interval_seconds, count, store_dir=OUTPUT_DIR):
+    """Pushes live predictions to dashboard clients over Server-Sent Events (see prediction_stream)."""
+    store = PredictionStore(store_dir) if store_dir else None
+    try:
+        asyncio.run(serve(stream_predictions(count, interval_seconds), host, port, store))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
+# --- Bulk Simulation ---
+
+def generate_node_registry(num_nodes, seed=0):
+    """
+    Returns (ids, names, weights) for num_nodes federated nodes. The five
+    configured FEDERATED_NODES are used as-is when num_nodes == 5; larger
+    registries get generated ids and random weights normalized to sum to 1.
+    """
+    if num_nodes == len(FEDERATED_NODES):
+        return ([n["id"] for n in FEDERATED_NODES], [n["name"] for n in FEDERATED_NODES],
+                np.array([n["weight"] for n in FEDERATED_NODES]))
+    rng = np.random.default_rng(seed)
+    weights = rng.uniform(0.5, 1.5, num_nodes)
+    weights /= weights.sum()
+    ids = [f"node_{i:05d}" for i in range(num_nodes)]
+    names = [f"Mangalore Node {i:05d}" for i in range(num_nodes)]
+    return ids, names, weights
+
+
+@profiled('simulator.simulate_chunk')
+def simulate_chunk(rng, start_step, num_steps, node_weights):
+    """
+    Vectorized version of one generate_predictions() iteration for
+    num_steps timesteps x len(node_weights) nodes. Returns a dict of arrays.
+    """
+    t = np.arange(start_step, start_step + num_steps)
+    daily_cycle = np.sin(2 * np.pi * t / 24)
+
+    actual = BASE_CONSUMPTION_KW + daily_cycle * DAILY_VARIATION + rng.uniform(-NOISE_LEVEL, NOISE_LEVEL, num_steps)
+    error_multiplier = 1 + rng.uniform(-MAX_ERROR_PERCENT / 100, MAX_ERROR_PERCENT / 100, num_steps)
+    predicted = np.maximum(0, actual * error_multiplier)
+    actual = np.maximum(0, actual)
+    error_percent = np.abs(predicted - actual) / (actual + 1e-9) * 100
+
+    num_nodes = len(node_weights)
+    node_prediction = predicted[:, None] * (1 + rng.uniform(-NODE_VARIATION, NODE_VARIATION, (num_steps, num_nodes)))
+    node_accuracy = rng.uniform(*NODE_ACCURACY_RANGE, (num_steps, num_nodes))
+    contribution = np.round(node_prediction * node_weights, 2)
+    federated = contribution.sum(axis=1)
+
+    return {
+        "step": t,
+        "actual": actual,
+        "predicted": predicted,
+        "error_percent": error_percent,
+        "federated": federated,
+        "federated_error_percent": np.abs(federated - actual) / (actual + 1e-9) * 100,
+        "model_patch": rng.integers(0, MODEL_PATCH_VERSIONS, num_steps),
+        "node_prediction": node_prediction,
+        "node_accuracy": node_accuracy,
+        "contribution": contribution,
+    }
+
+
+def chunk_records(chunk, run_id, start_time, node_ids, node_names, node_weights, step_seconds=3600):
+    """Turns a simulated chunk into prediction records with the same schema as the JSON files."""
+    # One bulk .tolist() per array is far cheaper than converting scalars one by one
+    actual = np.round(chunk["actual"], 2).tolist()
+    predicted = np.round(chunk["predicted"], 2).tolist()
+    federated = np.round(chunk["federated"], 2).tolist()
+    error_percent = np.round(chunk["error_percent"], 2).tolist()
+    federated_error = np.round(chunk["federated_error_percent"], 2).tolist()
+    patches = chunk["model_patch"].tolist()
+    node_prediction = np.round(chunk["node_prediction"], 2).tolist()
+    node_accuracy = np.round(chunk["node_accuracy"], 2).tolist()
+    contribution = chunk["contribution"].tolist()
+    weights = node_weights.tolist()
+    num_nodes = len(node_ids)
+
+    for row, step in enumerate(chunk["step"].tolist()):
+        preds, accs, contribs = node_prediction[row], node_accuracy[row], contribution[row]
+        yield {
+            "timestamp_utc": (start_time + timedelta(seconds=step * step_seconds)).isoformat() + "Z",
+            "prediction_id": f"pred_{run_id}_{step}",
+            "actual_24h_sum_kw": actual[row],
+            "predicted_24h_sum_kw": predicted[row],
+            "federated_prediction_kw": federated[row],
+            "error_percent": error_percent[row],
+            "federated_error_percent": federated_error[row],
+            "status": "✅ Success" if error_percent[row] < 5 else "⚠️ Warning",
+            "model_version": f"2.1.{patches[row]}",
+            "federated_nodes": [{
+                "node_id": node_ids[n],
+                "node_name": node_names[n],
+                "local_prediction_kw": preds[n],
+                "node_weight": weights[n],
+                "accuracy_score": accs[n],
+                "contribution": contribs[n],
+            } for n in range(num_nodes)],
             "aggregation_method": "weighted_average",
-            "total_nodes": len(FEDERATED_NODES)
+            "total_nodes": num_nodes,
         }
 
-        # 5. Save to a JSON file
-        file_path = os.path.join(output_dir, f"prediction_{i+1:03d}.json")
-        with open(file_path, 'w') as f:
-            json.dump(prediction_data, f, indent=2)
 
-        print(f"Generated {file_path} -> Predicted: {predicted_value:.2f} kW")
+def generate_bulk(num_nodes, num_steps, pace_seconds=0.0, seed=None, chunk_steps=BULK_CHUNK_STEPS):
+    """
+    Yields num_steps prediction records for num_nodes nodes, generated in
+    vectorized chunks. pace_seconds is the target gap between records:
+    SECONDS_BETWEEN_FILES for real time, 0 for unthrottled.
+    """
+    rng = np.random.default_rng(seed)
+    node_ids, node_names, node_weights = generate_node_registry(num_nodes, seed=0 if seed is None else seed)
+    run_id = int(time.time())
+    start_time = datetime.utcnow()
+    started = time.perf_counter()
 
-        # Wait before generating the next file
-        time.sleep(SECONDS_BETWEEN_FILES)
+    emitted = 0
+    for start_step in range(0, num_steps, chunk_steps):
+        chunk = simulate_chunk(rng, start_step, min(chunk_steps, num_steps - start_step), node_weights)
+        for record in chunk_records(chunk, run_id, start_time, node_ids, node_names, node_weights):
+            if pace_seconds:
+                delay = started + emitted * pace_seconds - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            emitted += 1
+            yield record
+
+
+@profiled('simulator.run_bulk')
+def run_bulk(num_nodes, num_steps, pace_seconds, out_path, seed=None, store_dir=None, manifest_every=1000):
+    """
+    Writes bulk records as NDJSON to out_path, and/or to a PredictionStore in
+    store_dir (manifest refreshed every manifest_every records), or just
+    counts them, and reports throughput.
+    """
+    print(f"Bulk simulation: {num_nodes} nodes x {num_steps} timesteps, pace {pace_seconds}s")
+    started = time.perf_counter()
+    count = 0
+    out = open(out_path, "w", encoding="utf-8") if out_path else None
+    store = PredictionStore(store_dir, manifest_every=manifest_every) if store_dir else None
+    try:
+        for record in generate_bulk(num_nodes, num_steps, pace_seconds, seed):
+            if out is not None:
+                out.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+                out.write("\n")
+            if store is not None:
+                store.append(record)
+            count += 1
+    finally:
+        if out is not None:
+            out.close()
+        if store is not None:
+            store.close()
+    elapsed = time.perf_counter() - started
+    print(f"Generated {count} records ({count * num_nodes} node predictions) in {elapsed:.2f}s: "
+          f"{count / elapsed * 60:,.0f} records/min, {count * num_nodes / elapsed * 60:,.0f} node predictions/min")
 
-    print("\nSimulation finished.")
 
 if __name__ == "__main__":
-    generate_predictions()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="FedGrid prediction simulator.")
+    parser.add_argument("--bulk", action="store_true", help="Vectorized load-test mode")
+    parser.add_argument("--nodes", type=int, default=len(FEDERATED_NODES))
+    parser.add_argument("--steps", type=int, default=100_000)
+    parser.add_argument("--pace", type=float, default=0.0,
+                        help=f"Seconds between records ({SECONDS_BETWEEN_FILES} = real time, 0 = unthrottled)")
+    parser.add_argument("--out", default=None, help="NDJSON output path (default: generate and discard)")
+    parser.add_argument("--store", default=None,
+                        help=f"Also publish to a latest.json + NDJSON history store in this directory (e.g. {OUTPUT_DIR})")
+    parser.add_argument("--manifest-every", type=int, default=1000, help="Records between manifest rewrites in bulk mode")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--serve", action="store_true", help="Push live predictions over Server-Sent Events")
+    parser.add_argument("--host", default=STREAM_HOST)
+    parser.add_argument("--port", type=int, default=STREAM_PORT)
+    parser.add_argument("--interval", type=float, default=SECONDS_BETWEEN_FILES, help="Seconds between served predictions")
+    parser.add_argument("--count", type=int, default=None, help="Predictions to serve (default: unlimited)")
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args.host, args.port, args.interval, args.count, args.store or OUTPUT_DIR)
+    elif args.bulk:
+        run_bulk(args.nodes, args.steps, args.pace, args.out, args.seed, args.store, args.manifest_every)
+    else:
+        generate_predictions()
\ No newline at end of file
@@ -0,0 +1,285 @@
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+from profiling import peak_rss_bytes
+
+# --- CONFIGURATION ---
+REPORT_PATH = 'benchmark_report.json'
+REPEATS = 5
+TOLERANCE = 0.2      # Fail when throughput drops more than 20% below the baseline
+N_FEATURES = 20      # Roughly the width of the engineered feature matrix
+WINDOW = 24
+STUDENT_SHAPE = (32, 16, 8, 1)
+ROBUST_CLIENTS = (10, 100, 1000)
+# (method, selection) pairs benchmarked by robust_aggregation at each client count
+ROBUST_VARIANTS = (('mean', 'partition'), ('median', 'partition'), ('median', 'sort'),
+                   ('trimmed_mean', 'partition'), ('trimmed_mean', 'sort'), ('multi_krum', 'partition'))
+
+BENCHMARKS = {}
+
+
+def benchmark(name, unit):
+    """
+    Registers a benchmark. The decorated factory takes (scale, rng), does
+    its setup, and returns (run, items): run() is the timed callable and
+    items the number of units it processes per call.
+    """
+    def decorator(factory):
+        BENCHMARKS[name] = {'factory': factory, 'unit': unit}
+        return factory
+    return decorator
+
+
+def synthetic_student(n_inputs, rng, shape=STUDENT_SHAPE):
+    """Random float32 W1..b4 for the 32 -> 16 -> 8 -> 1 student."""
+    weights = {}
+    for i, (fan_in, fan_out) in enumerate(zip((n_inputs,) + shape[:-1], shape), start=1):
+        weights[f"W{i}"] = (rng.normal(size=(fan_in, fan_out)) / np.sqrt(fan_in)).astype(np.float32)
+        weights[f"b{i}"] = np.zeros(fan_out, dtype=np.float32)
+    return weights
+
+
+@benchmark('windowing', 'rows')
+def bench_windowing(scale, rng):
+    """Step 3 + 5: strided windows and the window-weighted RobustScaler fit."""
+    from windowing import sliding_windows, fit_window_robust_scaler
+    X = rng.normal(size=(int(20_000 * scale), N_FEATURES))
+    split1 = int(len(X) * 0.7)
+
+    def run():
+        windows = sliding_windows(X, window=WINDOW)
+        scaler = fit_window_robust_scaler(X, split1, window=WINDOW)
+        return windows.shape, scaler.center_
+    return run, len(X)
+
+
+@benchmark('calibration', 'samples')
+def bench_calibration(scale, rng):
+    """Steps 8-9: rolling-median calibration and global boost."""
+    from calibration import MedianCalibrator
+    y_true = rng.gamma(4.0, 250.0, size=int(20_000 * scale))
+    y_pred = y_true * rng.uniform(0.7, 1.2, size=len(y_true))
+
+    def run():
+        return MedianCalibrator().calibrate(y_true, y_pred)
+    return run, len(y_true)
+
+
+@benchmark('mlp_inference', 'windows')
+def bench_mlp_inference(scale, rng):
+    """NumPy student forward pass on scaled, flattened windows."""
+    from mlp_inference import MLPStudent
+    n_inputs = WINDOW * N_FEATURES
+    weights_path = os.path.join(tempfile.mkdtemp(prefix='fedgrid-bench-'), 'student.npz')
+    np.savez(weights_path, **synthetic_student(n_inputs, rng))
+    student = MLPStudent(weights_path)
+    X_flat = rng.normal(size=(int(50_000 * scale), n_inputs)).astype(np.float32)
+
+    def run():
+        return student.predict_scaled(X_flat)
+    return run, len(X_flat)
+
+
+@benchmark('aggregation', 'client updates')
+def bench_aggregation(scale, rng):
+    """Streaming FedAvg over one round of synthetic client updates."""
+    from fedavg import FedAvgAggregator
+    base = synthetic_student(WINDOW * N_FEATURES, rng)
+    updates = [{k: v + rng.normal(scale=0.01, size=v.shape).astype(np.float32) for k, v in base.items()}
+               for _ in range(max(2, int(100 * scale)))]
+
+    def run():
+        aggregator = FedAvgAggregator(min_clients=len(updates) + 1)
+        for i, update in enumerate(updates):
+            aggregator.add(update, sample_weight=1.0 + i % 3, client_id=f"client-{i}")
+        return aggregator.close()
+    return run, len(updates)
+
+
+@benchmark('simulator', 'node predictions')
+def bench_simulator(scale, rng):
+    """Vectorized bulk prediction records (backend_simulator --bulk, unthrottled)."""
+    from backend_simulator import generate_bulk
+    num_nodes, num_steps = 100, int(2_000 * scale)
+
+    def run():
+        return sum(1 for _ in generate_bulk(num_nodes, num_steps, seed=0))
+    return run, num_nodes * num_steps
+
+
+@benchmark('online_predictor', 'meter readings')
+def bench_online_predictor(scale, rng):
+    """One hourly tick of the streaming per-meter predictor, after every meter is warmed up."""
+    from online_predictor import OnlinePredictor, engineered_columns, MAX_LAG
+    raw_cols = ['Fans:Electricity [kW](Hourly)', 'InteriorLights:Electricity [kW](Hourly)', 'Gas:Facility [kW](Hourly)']
+    feature_cols = raw_cols + engineered_columns()
+    tmp_dir = tempfile.mkdtemp(prefix='fedgrid-bench-')
+    weights_path, scalers_path = os.path.join(tmp_dir, 'student.npz'), os.path.join(tmp_dir, 'scalers.npz')
+    np.savez(weights_path, **synthetic_student(WINDOW * len(feature_cols), rng))
+    np.savez(scalers_path, x_center=np.zeros(len(feature_cols)), x_scale=np.ones(len(feature_cols)),
+             y_min=0.0, y_scale=0.1, window_size=WINDOW, feature_cols=np.array(feature_cols))
+
+    n_meters = int(2_000 * scale)
+    predictor = OnlinePredictor(weights_path, scalers_path, capacity=n_meters)
+    meter_ids = [f"meter-{i:05d}" for i in range(n_meters)]
+    for i, meter_id in enumerate(meter_ids):
+        predictor.add_meter(meter_id, position=i % 168)
+    readings = rng.gamma(4.0, 10.0, size=(WINDOW + MAX_LAG + 8, n_meters, len(raw_cols) + 1))
+    for step in readings:
+        predictor.update(meter_ids, step)
+
+    def run():
+        return predictor.update(meter_ids, readings[-1])
+    return run, n_meters
+
+
+_client_files = {}
+
+
+def synthetic_client_files(n_clients, n_inputs, rng, byzantine_fraction=0.1):
+    """
+    Uncompressed W1..b4 npz files for n_clients clients around one model,
+    the first 10% of them poisoned with large noise. Cached per size, so
+    every robust aggregation variant reads the same files.
+    """
+    key = (n_clients, n_inputs)
+    if key not in _client_files:
+        tmp_dir = tempfile.mkdtemp(prefix='fedgrid-bench-clients-')
+        base = synthetic_student(n_inputs, rng)
+        paths = []
+        for i in range(n_clients):
+            noise = 5.0 if i < byzantine_fraction * n_clients else 0.01
+            path = os.path.join(tmp_dir, f"client-{i:04d}.npz")
+            np.savez(path, **{k: v + rng.normal(scale=noise, size=v.shape).astype(np.float32) for k, v in base.items()})
+            paths.append(path)
+        _client_files[key] = paths
+    return _client_files[key]
+
+
+def robust_benchmark(method, selection, n_clients):
+    """Registers robust_aggregation `method` over n_clients memory-mapped client files."""
+    def factory(scale, rng):
+        from robust_aggregation import robust_aggregate, open_updates
+        updates = open_updates(synthetic_client_files(n_clients, max(1, int(WINDOW * N_FEATURES * scale)), rng))
+
+        def run():
+            return robust_aggregate(updates, method, selection)
+        return run, n_clients
+    factory.__doc__ = f"robust_aggregation {method} ({selection}) over {n_clients} client npz files."
+    return benchmark(f"robust_{method}_{selection}_{n_clients}", 'client updates')(factory)
+
+
+for _method, _selection in ROBUST_VARIANTS:
+    for _n_clients in ROBUST_CLIENTS:
+        robust_benchmark(_method, _selection, _n_clients)
+
+
+def run_benchmark(name, scale=1.0, repeats=REPEATS, seed=0):
+    """Times one registered benchmark: one untimed warm-up, then repeats runs."""
+    spec = BENCHMARKS[name]
+    run, items = spec['factory'](scale, np.random.default_rng(seed))
+    run()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    median = float(np.median(timings))
+    return {
+        'unit': spec['unit'],
+        'scale': scale,
+        'items': items,
+        'repeats': repeats,
+        'min_seconds': min(timings),
+        'median_seconds': median,
+        'throughput_per_second': items / median,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def run_benchmarks(names=None, scale=1.0, repeats=REPEATS):
+    results = {}
+    for name in names or BENCHMARKS:
+        print(f"[{name}] scale {scale}, {repeats} repeats...")
+        results[name] = run_benchmark(name, scale, repeats)
+    return {
+        'created_unix': time.time(),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'scale': scale,
+        'results': results,
+    }
+
+
+def check_regressions(report, baseline, tolerance=TOLERANCE):
+    """
+    Names of benchmarks whose throughput fell below (1 - tolerance) x the
+    baseline's. Benchmarks missing from either side, or run at a different
+    scale or item count, are not compared: items alone does not pin the size
+    (the robust_* benchmarks count clients whatever the layer size).
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None or base['items'] != result['items']:
+            continue
+        # Reports written before scale was stored per result only have it at the top level
+        if base.get('scale', baseline.get('scale')) != result.get('scale', report.get('scale')):
+            continue
+        if result['throughput_per_second'] < (1 - tolerance) * base['throughput_per_second']:
+            regressions.append(name)
+    return regressions
+
+
+def print_benchmark_report(report, baseline=None):
+    width = max([len('Benchmark')] + [len(name) for name in report['results']]) + 2
+    print(f"{'Benchmark':<{width}}{'Items':>10}{'Min s':>10}{'Median s':>10}{'Items/s':>14}{'vs base':>9}{'Peak RSS MB':>13}")
+    for name, r in report['results'].items():
+        base = (baseline or {}).get('results', {}).get(name)
+        ratio = f"{r['throughput_per_second'] / base['throughput_per_second']:>8.2f}x" if base else f"{'-':>9}"
+        print(f"{name:<{width}}{r['items']:>10}{r['min_seconds']:>10.4f}{r['median_seconds']:>10.4f}"
+              f"{r['throughput_per_second']:>14,.0f}{ratio}{r['peak_rss_bytes'] / 2**20:>13.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Synthetic FedGrid benchmarks with regression thresholds.")
+    parser.add_argument("names", nargs="*", metavar="NAME",
+                        help="Benchmarks to run, as names or glob patterns such as 'robust_*_100' (default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier on every benchmark's problem size")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--out", default=REPORT_PATH, help="JSON report path")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare throughput against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--save-baseline", default=None, help="Also write this run as the new baseline")
+    args = parser.parse_args()
+    unknown = [pattern for pattern in args.names if not fnmatch.filter(BENCHMARKS, pattern)]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}; available: {', '.join(BENCHMARKS)}")
+    names = [name for name in BENCHMARKS if any(fnmatch.fnmatchcase(name, p) for p in args.names)]
+
+    report = run_benchmarks(names, args.scale, args.repeats)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_benchmark_report(report, baseline)
+
+    for path in filter(None, (args.out, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"Report: {args.out}")
+
+    if baseline is not None:
+        regressions = check_regressions(report, baseline, args.tolerance)
+        if regressions:
+            print(f"REGRESSION (> {args.tolerance:.0%} slower than baseline): {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%}")
@@ -0,0 +1,192 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+# --- CONFIGURATION ---
+BLOB_CACHE_DIR = os.path.join(tempfile.gettempdir(), "fedgrid_blob_cache")
+BLOB_CACHE_MAX_BYTES = 512 * 1024**2  # Evict least recently used blobs above 512 MB
+PROCESSED_TTL_SECONDS = 24 * 60 * 60  # IoT Hub's default retention: redeliveries come within a day
+
+CachedBlob = namedtuple('CachedBlob', ['path', 'sha256', 'size', 'etag', 'hit'])
+
+
+class HashingWriter:
+    """File wrapper that hashes and counts everything written through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+
+class BlobCache:
+    """
+    On-disk cache of downloaded blobs. Each blob version (URL + etag) maps
+    to a content-addressed file named by its SHA-256, so the per-round and
+    "latest" copies of a global model share one file. Downloads stream into
+    a temporary file in chunks and are renamed into place once complete.
+    Files are evicted least recently used first once the cache grows past
+    max_bytes.
+
+    The SQLite index also remembers which blob versions a notification has
+    already been processed for, so redelivered IoT Hub messages are
+    answered from the index without downloading anything.
+
+    `backend` is any object with blob_etag(url) and
+    download_blob_to(url, stream, etag=None) -> etag, which writes the blob
+    to stream in chunks (azure_clients.AzureBackend, or
+    local_backend.LocalBackend in tests).
+    """
+
+    def __init__(self, root=BLOB_CACHE_DIR, max_bytes=BLOB_CACHE_MAX_BYTES, processed_ttl=PROCESSED_TTL_SECONDS,
+                 clock=time.time):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.processed_ttl = processed_ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._inflight = {}  # claimed (kind, blob_url, etag) -> Event set when the claim is released
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(root, 'index.sqlite'), check_same_thread=False)
+        # The files are the source of truth and a lost index row only costs a re-download, so skip per-commit fsyncs
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS blobs (
+                blob_url TEXT, etag TEXT, sha256 TEXT, PRIMARY KEY (blob_url, etag))""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS blobs_sha256 ON blobs (sha256)")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS objects (
+                sha256 TEXT PRIMARY KEY, size INTEGER, last_used REAL)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS processed (
+                blob_url TEXT, etag TEXT, result TEXT, processed_at REAL, PRIMARY KEY (blob_url, etag))""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS processed_at ON processed (processed_at)")
+
+    def _object_path(self, sha256):
+        return os.path.join(self.root, 'objects', sha256)
+
+    @contextmanager
+    def _claim(self, key):
+        """
+        Exclusive claim on one blob version. self._lock is only held to
+        register the claim; a concurrent claim of the same key waits for
+        this one to be released, claims of other keys do not wait at all.
+        """
+        while True:
+            with self._lock:
+                event = self._inflight.get(key)
+                if event is None:
+                    event = self._inflight[key] = threading.Event()
+                    break
+            event.wait()
+        try:
+            yield
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            event.set()
+
+    def _lookup(self, blob_url, etag):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT b.sha256, o.size FROM blobs b JOIN objects o ON b.sha256 = o.sha256 "
+                "WHERE b.blob_url = ? AND b.etag = ?", (blob_url, etag)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(self._object_path(row[0])):
+                self._db.execute("DELETE FROM objects WHERE sha256 = ?", (row[0],))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE objects SET last_used = ? WHERE sha256 = ?", (self.clock(), row[0]))
+            self._db.commit()
+            return row
+
+    def fetch(self, backend, blob_url, etag=None):
+        """
+        Returns a CachedBlob for the current version of blob_url, downloading
+        it only on a miss. Pass the etag if the caller already has it.
+        """
+        etag = etag or backend.blob_etag(blob_url)
+        with self._claim(('fetch', blob_url, etag)):
+            row = self._lookup(blob_url, etag)
+            if row is not None:
+                return CachedBlob(self._object_path(row[0]), row[0], row[1], etag, True)
+
+            tmp_path = os.path.join(self.root, 'objects', f".tmp-{uuid.uuid4().hex}")
+            try:
+                with open(tmp_path, 'wb') as f:
+                    writer = HashingWriter(f)
+                    # Conditional on the etag, so the file always matches the version it is stored under
+                    etag = backend.download_blob_to(blob_url, writer, etag=etag)
+                sha256 = writer.digest.hexdigest()
+                os.replace(tmp_path, self._object_path(sha256))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            with self._lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?)", (sha256, writer.size, self.clock()))
+                self._db.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (blob_url, etag, sha256))
+        self.evict(keep=sha256)
+        return CachedBlob(self._object_path(sha256), sha256, writer.size, etag, False)
+
+    def evict(self, keep=None):
+        """Removes least recently used blob files until the cache fits in max_bytes."""
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for sha256, size in self._db.execute("SELECT sha256, size FROM objects ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                if sha256 == keep:
+                    continue
+                with self._db:
+                    self._db.execute("DELETE FROM objects WHERE sha256 = ?", (sha256,))
+                    self._db.execute("DELETE FROM blobs WHERE sha256 = ?", (sha256,))
+                try:
+                    os.remove(self._object_path(sha256))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                logging.info(f"Evicted cached blob {sha256[:12]} ({size} bytes)")
+
+    @contextmanager
+    def notification(self, blob_url, etag):
+        """
+        Dedup guard for one blob version. Yields a dict whose 'result' is the
+        earlier result if a notification for this version was already
+        processed; set 'result' inside the block to record a new one.
+        Concurrent duplicates wait for the first to finish; notifications
+        for other blobs proceed in parallel.
+        """
+        with self._claim(('notification', blob_url, etag)):
+            with self._lock:
+                row = self._db.execute("SELECT result FROM processed WHERE blob_url = ? AND etag = ?",
+                                       (blob_url, etag)).fetchone()
+            seen = {'result': row[0] if row else None}
+            previous = seen['result']
+            yield seen
+            if seen['result'] is not None and seen['result'] != previous:
+                now = self.clock()
+                with self._lock, self._db:
+                    self._db.execute("INSERT OR REPLACE INTO processed VALUES (?, ?, ?, ?)",
+                                     (blob_url, etag, str(seen['result']), now))
+                    self._db.execute("DELETE FROM processed WHERE processed_at < ?", (now - self.processed_ttl,))
+
+    def stats(self):
+        with self._lock:
+            objects, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects").fetchone()
+            processed = self._db.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+        return {'objects': objects, 'bytes': size, 'processed': processed}
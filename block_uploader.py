@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CONFIGURATION ---
+BLOCK_SIZE = 4 * 1024 * 1024  # Bytes per staged block
+BLOCK_WORKERS = 8             # Parallel block uploads per file
+BLOCK_RETRIES = 3             # Attempts per block before the upload gives up
+RETRY_BACKOFF_SECONDS = 0.5
+
+
+def file_sha256(path, chunk_bytes=BLOCK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_bytes), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_blob_name(file_path, sha256):
+    """
+    Blob name derived from the file content, so re-running an interrupted
+    upload targets the same blob and can reuse its staged blocks.
+    """
+    return f"{os.path.basename(file_path).split('.')[0]}-{sha256[:32]}.npz"
+
+
+def default_upload_id(file_path):
+    """Stable per local file, so a rerun resumes its own staged blocks."""
+    return hashlib.sha256(os.path.abspath(file_path).encode('utf-8')).hexdigest()[:16]
+
+
+def block_id(index):
+    # All block ids of a blob must have the same length
+    return f"{index:08d}"
+
+
+class AzureBlockTarget:
+    """
+    Block staging against Azure Blob Storage. One BlobServiceClient (and
+    so one connection pool) is shared by every upload through this target,
+    and each container is checked or created only once per process.
+    """
+
+    def __init__(self, storage_conn_str, max_connections=64):
+        from azure.storage.blob import BlobServiceClient
+        self.service = BlobServiceClient.from_connection_string(
+            storage_conn_str, connection_pool_maxsize=max_connections)
+        self._containers = set()
+        self._lock = threading.Lock()
+
+    def ensure_container(self, container):
+        from azure.core.exceptions import ResourceExistsError
+        with self._lock:
+            if container in self._containers:
+                return
+            container_client = self.service.get_container_client(container)
+            if not container_client.exists():
+                try:
+                    container_client.create_container()
+                    print(f"Container '{container}' created.")
+                except ResourceExistsError:
+                    pass
+            self._containers.add(container)
+
+    # upload_id is ignored: Azure keeps one uncommitted block list per blob, and
+    # content-addressed names mean concurrent uploads of a blob stage identical blocks
+
+    def staged_blocks(self, container, blob_name, upload_id=None):
+        """Uncommitted blocks already on the server: {block_id: size}."""
+        from azure.core.exceptions import ResourceNotFoundError
+        blob_client = self.service.get_blob_client(container=container, blob=blob_name)
+        try:
+            _, uncommitted = blob_client.get_block_list('uncommitted')
+        except ResourceNotFoundError:
+            return {}
+        return {block.id: block.size for block in uncommitted}
+
+    def stage_block(self, container, blob_name, block, data, upload_id=None):
+        self.service.get_blob_client(container=container, blob=blob_name).stage_block(block, data, length=len(data))
+
+    def commit_blocks(self, container, blob_name, block_ids, upload_id=None):
+        from azure.storage.blob import BlobBlock
+        blob_client = self.service.get_blob_client(container=container, blob=blob_name)
+        blob_client.commit_block_list([BlobBlock(block_id=b) for b in block_ids])
+        return blob_client.url
+
+
+class BlockUploader:
+    """
+    Uploads a file as fixed-size blocks staged in parallel, then commits the
+    block list. Blocks already staged by an earlier, interrupted attempt
+    (same content-derived blob name, same size) are skipped, so an upload
+    resumes where a dropped connection left it. Failed blocks are retried
+    with backoff. `target` is AzureBlockTarget or local_backend.LocalBlobStore.
+    Identical files from different devices map to the same blob name, so
+    each upload passes an upload_id (the device id, or a hash of the local
+    path) under which a target that stages blocks itself keeps them apart.
+    """
+
+    def __init__(self, target, block_size=BLOCK_SIZE, workers=BLOCK_WORKERS, retries=BLOCK_RETRIES):
+        self.target = target
+        self.block_size = block_size
+        self.retries = retries
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def _stage_with_retry(self, container, blob_name, block, file_path, offset, length, upload_id):
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        for attempt in range(self.retries):
+            try:
+                self.target.stage_block(container, blob_name, block, data, upload_id=upload_id)
+                return len(data)
+            except Exception:
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+
+    def upload(self, container, file_path, blob_name=None, upload_id=None):
+        """Uploads file_path and returns (blob_url, bytes_sent_this_attempt)."""
+        self.target.ensure_container(container)
+        if blob_name is None:
+            blob_name = content_blob_name(file_path, file_sha256(file_path))
+        upload_id = upload_id or default_upload_id(file_path)
+
+        size = os.path.getsize(file_path)
+        blocks = [(block_id(i), offset, min(self.block_size, size - offset))
+                  for i, offset in enumerate(range(0, size, self.block_size))] or [(block_id(0), 0, 0)]
+        staged = self.target.staged_blocks(container, blob_name, upload_id=upload_id)
+
+        futures = [self._pool.submit(self._stage_with_retry, container, blob_name, block, file_path, offset, length,
+                                     upload_id)
+                   for block, offset, length in blocks if staged.get(block) != length]
+        sent = sum(f.result() for f in futures)
+        url = self.target.commit_blocks(container, blob_name, [block for block, _, _ in blocks], upload_id=upload_id)
+        return url, sent
+
+    def close(self):
+        self._pool.shutdown(wait=True)
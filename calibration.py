@@ -0,0 +1,175 @@
+import bisect
+import heapq
+from collections import deque
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# --- CONFIGURATION ---
+CALIBRATION_WINDOW = 50       # Look back this many samples (window holds up to 51)
+MIN_HISTORY = 20              # Only calibrate once the window has more than 20 samples
+LOCAL_CLIP = (0.90, 1.80)     # Allow 40% boost
+FALLBACK_CLIP = (1.0, 2.0)    # Used when the model is systematically underpredicting
+GLOBAL_CLIP = (1.0, 1.5)
+FALLBACK_THRESHOLD = 0.9      # median_pred < 0.9 * median_true triggers the fallback
+FINAL_CLIP_FACTOR = 1.5       # Final predictions are capped at 1.5x the largest actual
+EPSILON = 1e-6
+
+
+class SlidingMedian:
+    """
+    Median of the last `size` values. The window is kept sorted with bisect,
+    so each update is an O(log w) search plus a short memmove for the
+    50-element calibration window.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._order = deque()
+        self._sorted = []
+
+    def __len__(self):
+        return len(self._order)
+
+    def push(self, value):
+        if len(self._order) == self.size:
+            old = self._order.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, old)]
+        self._order.append(value)
+        bisect.insort(self._sorted, value)
+
+    def median(self):
+        n = len(self._sorted)
+        mid = n // 2
+        if n % 2:
+            return self._sorted[mid]
+        return (self._sorted[mid - 1] + self._sorted[mid]) / 2
+
+
+class RunningMedian:
+    """Median of every value seen so far, using a max-heap / min-heap pair."""
+
+    def __init__(self):
+        self._low = []   # max-heap (negated) of the smaller half
+        self._high = []  # min-heap of the larger half
+
+    def __len__(self):
+        return len(self._low) + len(self._high)
+
+    def push(self, value):
+        if self._low and value > -self._low[0]:
+            heapq.heappush(self._high, value)
+        else:
+            heapq.heappush(self._low, -value)
+        if len(self._low) > len(self._high) + 1:
+            heapq.heappush(self._high, -heapq.heappop(self._low))
+        elif len(self._high) > len(self._low):
+            heapq.heappush(self._low, -heapq.heappop(self._high))
+
+    def median(self):
+        if len(self._low) > len(self._high):
+            return -self._low[0]
+        return (-self._low[0] + self._high[0]) / 2
+
+
+class MedianCalibrator:
+    """
+    Step 8 calibration of student predictions, in batch and streaming form.
+
+    1. Rolling median: each prediction is scaled by
+       median(true) / median(pred) over the last window+1 samples
+       (including the current one), clipped to LOCAL_CLIP.
+    2. Global boost: median(true) / median(calibrated) over all samples,
+       clipped to FALLBACK_CLIP when the model underpredicts and to
+       GLOBAL_CLIP otherwise.
+    3. Final clip to [0, 1.5 * max(true)].
+
+    calibrate() runs the three steps vectorized over arrays. update()
+    runs step 1 one sample at a time and keeps the window state between
+    calls; global_boost_so_far() and finalize() apply steps 2-3 using the
+    running medians of everything seen so far.
+    """
+
+    def __init__(self, window=CALIBRATION_WINDOW, min_history=MIN_HISTORY):
+        self.window = window
+        self.min_history = min_history
+        self.reset()
+
+    def reset(self):
+        self._recent_true = SlidingMedian(self.window + 1)
+        self._recent_pred = SlidingMedian(self.window + 1)
+        self._all_true = RunningMedian()
+        self._all_calibrated = RunningMedian()
+        self._max_true = 0.0
+
+    # === Batch API ===
+
+    def rolling_calibrate(self, y_true, y_pred):
+        """Step 1 over whole arrays; identical to the per-sample loop."""
+        y_true = np.asarray(y_true, dtype=np.float64)
+        y_pred = np.asarray(y_pred, dtype=np.float64)
+        factors = np.ones(len(y_pred))
+
+        # Growing windows at the start: y[0:i+1] while i < window
+        for i in range(self.min_history, min(self.window, len(y_pred))):
+            factors[i] = np.median(y_true[:i + 1]) / (np.median(y_pred[:i + 1]) + EPSILON)
+
+        # Full windows: y[i-window:i+1] for every i >= window, all medians in one pass
+        full = self.window + 1
+        if len(y_pred) >= full and full > self.min_history:
+            med_true = np.median(sliding_window_view(y_true, full), axis=1)
+            med_pred = np.median(sliding_window_view(y_pred, full), axis=1)
+            factors[self.window:] = med_true / (med_pred + EPSILON)
+
+        factors[self.min_history:] = np.clip(factors[self.min_history:], *LOCAL_CLIP)
+        return y_pred * factors
+
+    @staticmethod
+    def global_boost(y_true, y_calibrated):
+        """Step 2: returns (factor, is_fallback)."""
+        median_true = np.median(y_true)
+        median_pred = np.median(y_calibrated)
+        return MedianCalibrator._boost(median_true, median_pred)
+
+    @staticmethod
+    def _boost(median_true, median_pred):
+        factor = median_true / (median_pred + EPSILON)
+        if median_pred < FALLBACK_THRESHOLD * median_true:
+            return np.clip(factor, *FALLBACK_CLIP), True
+        return np.clip(factor, *GLOBAL_CLIP), False
+
+    def calibrate(self, y_true, y_pred):
+        """All three steps. Returns (y_final, global_factor, is_fallback)."""
+        y_true = np.asarray(y_true, dtype=np.float64)
+        y_calibrated = self.rolling_calibrate(y_true, y_pred)
+        factor, is_fallback = self.global_boost(y_true, y_calibrated)
+        y_final = np.clip(y_calibrated * factor, 0, y_true.max() * FINAL_CLIP_FACTOR)
+        return y_final, factor, is_fallback
+
+    # === Streaming API ===
+
+    def update(self, true, pred):
+        """
+        Adds one (actual, predicted) pair and returns the rolling-median
+        calibrated prediction, matching rolling_calibrate() element by element.
+        """
+        true = float(true)
+        pred = float(pred)
+        self._recent_true.push(true)
+        self._recent_pred.push(pred)
+        if len(self._recent_true) > self.min_history:
+            local_factor = self._recent_true.median() / (self._recent_pred.median() + EPSILON)
+            pred = pred * np.clip(local_factor, *LOCAL_CLIP)
+
+        self._all_true.push(true)
+        self._all_calibrated.push(pred)
+        self._max_true = max(self._max_true, true)
+        return pred
+
+    def global_boost_so_far(self):
+        """Step 2 over every sample passed to update() so far."""
+        return self._boost(self._all_true.median(), self._all_calibrated.median())
+
+    def finalize(self, calibrated):
+        """Steps 2-3 for a value returned by update(), using the history so far."""
+        factor, _ = self.global_boost_so_far()
+        return np.clip(calibrated * factor, 0, self._max_true * FINAL_CLIP_FACTOR)
@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+from features import (TARGET_COL, add_features, feature_columns, header_feature_columns,
+                      stream_features_to_store, load_feature_store)
+from windowing import (WINDOW_SIZE, SPLIT_RATIOS, next_day_sum_target, create_sequences, split_points,
+                       fit_window_robust_scaler)
+from feature_cache import (ArrayCache, cache_key, robust_scaler_params, robust_scaler_from_params,
+                           minmax_scaler_params, minmax_scaler_from_params)
+
+
+def prepare_dataset(csv_path, window_size=WINDOW_SIZE, feature_store_dir=None):
+    """Steps 1-5: features, target, sequences, split and scaling."""
+    if feature_store_dir:
+        # === STEP 1: Feature Engineering (streaming) ===
+        print("Building feature store from CSV chunks...")
+        stream_features_to_store(csv_path, feature_store_dir)
+        X_raw, y_raw, feature_cols = load_feature_store(feature_store_dir)
+        print(f"Data shape after preprocessing: {X_raw.shape}")
+        print(f"Number of features: {len(feature_cols)}")
+    else:
+        print("Loading dataset...")
+        df = pd.read_csv(csv_path, on_bad_lines='skip')
+
+        # === STEP 1: Feature Engineering ===
+        print("Adding time-based and lag features...")
+        df = add_features(df)
+
+        # Drop index and unused
+        feature_cols = feature_columns(df)
+
+        # Fill and drop NaN
+        df = df.ffill().bfill().dropna()
+
+        print(f"Data shape after preprocessing: {df.shape}")
+        print(f"Number of features: {len(feature_cols)}")
+
+        X_raw = df[feature_cols].values
+        y_raw = df[TARGET_COL].values
+
+    # === STEP 2: Target Creation ===
+    # Target: sum of next 24 hours (cumulative sums, no Python loop)
+    y_seq = next_day_sum_target(y_raw)
+    X = X_raw[:-24]
+
+    print(f"Creating target: sum of next 24 hours...")
+    print(f"X shape: {X.shape}, y shape: {y_seq.shape}")
+
+    # === STEP 3: Sequence Creation ===
+    # X_seq is a read-only strided view over X: (n, window, features), no copies
+    X_seq, y_seq = create_sequences(X, y_seq, window=window_size)
+    print(f"Sequence shapes - Train: {X_seq.shape}, Val: {X_seq.shape}, Test: {X_seq.shape}")
+
+    # === STEP 4: Train/Val/Test Split ===
+    split1, split2 = split_points(len(X_seq))
+    y_train, y_val, y_test = y_seq[:split1], y_seq[split1:split2], y_seq[split2:]
+
+    # === STEP 5: Scaling ===
+    # Fit on the base rows weighted by window coverage (identical to fitting on the
+    # flattened training windows), then scale each base row once and re-window.
+    print("Scaling input features with RobustScaler...")
+    scaler_X = fit_window_robust_scaler(X, split1, window=window_size)
+    X_scaled = scaler_X.transform(np.asarray(X, dtype=np.float64))
+
+    print("Scaling target with log1p and MinMaxScaler...")
+    scaler_y = MinMaxScaler()
+    y_train_log = np.log1p(y_train).reshape(-1, 1)
+    y_val_log = np.log1p(y_val).reshape(-1, 1)
+    y_test_log = np.log1p(y_test).reshape(-1, 1)
+
+    scaler_y.fit(y_train_log)
+
+    # The scaled windows are views over X_scaled, so only the base matrix is stored
+    arrays = {
+        'features': X_raw,
+        'X_scaled': X_scaled,
+        'y_train': y_train, 'y_val': y_val, 'y_test': y_test,
+        'y_train_scaled': scaler_y.transform(y_train_log).flatten(),
+        'y_val_scaled': scaler_y.transform(y_val_log).flatten(),
+        'y_test_scaled': scaler_y.transform(y_test_log).flatten(),
+    }
+    arrays.update({f"scaler_X_{k}": v for k, v in robust_scaler_params(scaler_X).items()})
+    arrays.update({f"scaler_y_{k}": v for k, v in minmax_scaler_params(scaler_y).items()})
+    meta = {'feature_cols': feature_cols, 'split1': split1, 'split2': split2}
+    return arrays, meta
+
+
+def dataset_key(csv_path, window_size=WINDOW_SIZE, dataset_cache=None):
+    """ArrayCache key of the prepared dataset: CSV content plus preprocessing config."""
+    dataset_cache = dataset_cache or ArrayCache()
+    return cache_key(dataset_cache.csv_hash(csv_path), header_feature_columns(csv_path),
+                     window_size, SPLIT_RATIOS)
+
+
+def load_dataset(csv_path, window_size=WINDOW_SIZE, use_cache=True, feature_store_dir=None):
+    """
+    Steps 1-5 for csv_path as (arrays, meta). With use_cache the result is
+    read from (or written to) the content-addressed ArrayCache, and the
+    arrays come back memory-mapped.
+    """
+    if not use_cache:
+        return prepare_dataset(csv_path, window_size, feature_store_dir)
+
+    dataset_cache = ArrayCache()
+    key = dataset_key(csv_path, window_size, dataset_cache)
+    cached = dataset_cache.load(key)
+    if cached is None:
+        arrays, meta = prepare_dataset(csv_path, window_size, feature_store_dir)
+        dataset_cache.save(key, arrays, meta)
+        cached = dataset_cache.load(key)
+    else:
+        print(f"Loaded Steps 1-5 from cache entry {key[:12]}")
+    return cached
+
+
+def dataset_scalers(data):
+    """(scaler_X, scaler_y) rebuilt from the parameters stored by prepare_dataset."""
+    scaler_X = robust_scaler_from_params({k: data[f"scaler_X_{k}"] for k in ('center', 'scale')})
+    scaler_y = minmax_scaler_from_params({k: data[f"scaler_y_{k}"] for k in
+                                          ('min', 'scale', 'data_min', 'data_max', 'data_range', 'n_samples_seen')})
+    return scaler_X, scaler_y
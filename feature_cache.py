@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+from sklearn.preprocessing import RobustScaler, MinMaxScaler
+
+# --- CONFIGURATION ---
+CACHE_DIR = '.fedgrid_cache'
+CACHE_MAX_BYTES = 20 * 1024**3  # Evict least recently used entries above 20 GB
+HASH_CHUNK_BYTES = 1 << 20
+CACHE_VERSION = 1               # Bump when the cached layout or preprocessing changes
+
+
+def file_sha256(path, chunk_bytes=HASH_CHUNK_BYTES):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_bytes), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(csv_hash, feature_cols, window_size, split_ratios, extra=None):
+    """Content address for a prepared dataset: data hash plus preprocessing config."""
+    config = {
+        'version': CACHE_VERSION,
+        'csv_sha256': csv_hash,
+        'feature_cols': list(feature_cols),
+        'window_size': int(window_size),
+        'split_ratios': [float(r) for r in split_ratios],
+        'extra': extra,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+# === Scaler (de)serialization ===
+
+def robust_scaler_params(scaler):
+    return {'center': scaler.center_, 'scale': scaler.scale_}
+
+
+def robust_scaler_from_params(params):
+    scaler = RobustScaler()
+    scaler.center_ = np.asarray(params['center'])
+    scaler.scale_ = np.asarray(params['scale'])
+    scaler.n_features_in_ = len(scaler.center_)
+    return scaler
+
+
+def minmax_scaler_params(scaler):
+    return {'min': scaler.min_, 'scale': scaler.scale_, 'data_min': scaler.data_min_,
+            'data_max': scaler.data_max_, 'data_range': scaler.data_range_,
+            'n_samples_seen': np.asarray(scaler.n_samples_seen_)}
+
+
+def minmax_scaler_from_params(params):
+    scaler = MinMaxScaler()
+    scaler.min_ = np.asarray(params['min'])
+    scaler.scale_ = np.asarray(params['scale'])
+    scaler.data_min_ = np.asarray(params['data_min'])
+    scaler.data_max_ = np.asarray(params['data_max'])
+    scaler.data_range_ = np.asarray(params['data_range'])
+    scaler.n_samples_seen_ = int(params['n_samples_seen'])
+    scaler.n_features_in_ = len(scaler.min_)
+    return scaler
+
+# === On-disk cache ===
+
+class ArrayCache:
+    """
+    Content-addressed cache of named NumPy arrays. Each entry is a directory
+    of .npy files plus meta.json, written to a temporary directory and
+    renamed into place so readers never see a partial entry. Arrays are
+    returned memory-mapped. Entries are evicted least recently used first
+    once the cache grows past max_bytes.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def csv_hash(self, path):
+        """
+        file_sha256 memoized on (path, size, mtime), so a warm rerun does not
+        re-read an unchanged multi-GB CSV just to find its key.
+        """
+        stat = os.stat(path)
+        memo_path = os.path.join(self.root, 'hashes.json')
+        try:
+            with open(memo_path) as f:
+                memo = json.load(f)
+        except (OSError, ValueError):
+            memo = {}
+
+        path = os.path.abspath(path)
+        stamp = f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+        if stamp not in memo:
+            # Drop stamps of older versions of this file and of files that no longer exist
+            memo = {old: digest for old, digest in memo.items()
+                    if old.rsplit('|', 2)[0] != path and os.path.exists(old.rsplit('|', 2)[0])}
+            memo[stamp] = file_sha256(path)
+            tmp_path = f"{memo_path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(memo, f)
+            os.replace(tmp_path, memo_path)
+        return memo[stamp]
+
+    def load(self, key, mmap_mode='r'):
+        """Returns (arrays, meta) for a cached entry, or None on a miss."""
+        entry = self._entry_dir(key)
+        meta_path = os.path.join(entry, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in meta['arrays']}
+        os.utime(entry)  # mark as recently used
+        return arrays, meta['meta']
+
+    def save(self, key, arrays, meta=None):
+        """
+        Stores a dict of arrays (and JSON-serializable meta) under key. Keys
+        are content addresses, so an existing entry already holds the same
+        data and is left alone: other processes may have it memory-mapped.
+        """
+        entry = self._entry_dir(key)
+        if os.path.exists(os.path.join(entry, 'meta.json')):
+            return
+        tmp_entry = os.path.join(self.root, f".tmp-{key}-{uuid.uuid4().hex}")
+        os.makedirs(tmp_entry)
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_entry, f"{name}.npy"), np.asarray(array))
+            with open(os.path.join(tmp_entry, 'meta.json'), 'w') as f:
+                json.dump({'arrays': sorted(arrays), 'meta': meta or {}, 'created': time.time()}, f)
+            try:
+                os.replace(tmp_entry, entry)
+            except OSError:
+                if not os.path.exists(os.path.join(entry, 'meta.json')):
+                    raise
+                # Another process stored the same key first
+        finally:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict(keep=key)
+
+    def evict(self, keep=None):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or name.startswith('.tmp-'):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(path), name, size))
+            total += size
+
+        for _, name, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            total -= size
+            print(f"Evicted cache entry {name[:12]} ({size} bytes)")
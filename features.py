@@ -0,0 +1,186 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURATION ---
+TARGET_COL = 'Electricity:Facility [kW](Hourly)'
+EXCLUDE_COLS = ['Class', 'theft', '0']
+CHUNK_ROWS = 100_000   # Rows per CSV chunk when streaming
+CONTEXT_ROWS = 48      # History needed by the longest lag (lag_48)
+NPY_HEADER_BYTES = 128 # Fixed header size so it can be rewritten in place
+
+# === Feature definitions (shared by the in-memory and streaming paths) ===
+
+def add_features(df, row_offset=0):
+    """
+    Adds the time, lag, rolling, z-score, rate-of-change and peak columns.
+    row_offset is the position of df's first row in the full dataset, so the
+    hour/day features stay aligned when df is a chunk.
+    """
+    # Aggregate total electricity
+    energy_cols = [col for col in df.columns if 'Electricity' in col and 'Facility' not in col]
+    if len(energy_cols) > 0:
+        df['Total_Electricity'] = df[energy_cols].sum(axis=1)
+    else:
+        df['Total_Electricity'] = df[TARGET_COL]
+
+    # Time features
+    positions = np.arange(row_offset, row_offset + len(df))
+    df['HourOfDay'] = positions % 24
+    df['DayOfWeek'] = (positions // 24) % 7
+    df['is_weekend'] = (df['DayOfWeek'] >= 5).astype(int)
+    df['hour_sin'] = np.sin(2 * np.pi * df['HourOfDay'] / 24)
+    df['hour_cos'] = np.cos(2 * np.pi * df['HourOfDay'] / 24)
+
+    # Lag features
+    df['lag_1'] = df['Total_Electricity'].shift(1)
+    df['lag_24'] = df['Total_Electricity'].shift(24)
+    df['lag_48'] = df['Total_Electricity'].shift(48)
+
+    # Rolling stats
+    df['rolling_mean_24'] = df['Total_Electricity'].shift(1).rolling(window=24, min_periods=1).mean()
+    df['rolling_std_24'] = df['Total_Electricity'].rolling(24, min_periods=1).std().fillna(0)
+    df['zscore_24'] = (df['Total_Electricity'] - df['rolling_mean_24']) / (df['rolling_std_24'] + 1e-6) #to detect unusually high load
+
+    # Rate of change
+    df['roc_1'] = df['Total_Electricity'] - df['lag_1']
+    df['roc_24'] = df['Total_Electricity'] - df['lag_24']
+
+    # Peak flags
+    df['is_morning_peak'] = ((df['HourOfDay'] >= 7) & (df['HourOfDay'] <= 9)).astype(int)
+    df['is_evening_peak'] = ((df['HourOfDay'] >= 17) & (df['HourOfDay'] <= 19)).astype(int)
+    return df
+
+
+def feature_columns(df):
+    """Model inputs: every column except the excluded ones and the target."""
+    return [col for col in df.columns if col not in EXCLUDE_COLS and col != TARGET_COL]
+
+# === Incremental .npy writer ===
+
+def _npy_header(dtype, shape):
+    """Builds a version 1.0 .npy header padded to NPY_HEADER_BYTES."""
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   'fortran_order': False, 'shape': tuple(shape)})
+    prefix = b'\x93NUMPY\x01\x00'
+    body_len = NPY_HEADER_BYTES - len(prefix) - 2
+    header = header.ljust(body_len - 1) + '\n'
+    if len(header) != body_len:
+        raise ValueError(f"Shape {shape} does not fit in the .npy header")
+    return prefix + body_len.to_bytes(2, 'little') + header.encode('latin1')
+
+
+class NpyAppender:
+    """
+    Appends rows to a C-ordered .npy file. A placeholder header is written
+    first and patched with the final row count on close(), so the file can
+    be memory-mapped with np.load(mmap_mode='r') afterwards.
+    """
+
+    def __init__(self, path, row_shape=(), dtype=np.float64):
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self._file = open(path, 'wb')
+        self._file.write(_npy_header(self.dtype, (0,) + self.row_shape))
+
+    def append(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        if array.shape[1:] != self.row_shape:
+            raise ValueError(f"Expected rows of shape {self.row_shape}, got {array.shape[1:]}")
+        self._file.write(array.tobytes())
+        self.rows += len(array)
+
+    def close(self):
+        self._file.seek(0)
+        self._file.write(_npy_header(self.dtype, (self.rows,) + self.row_shape))
+        self._file.close()
+
+# === Streaming feature engine ===
+
+def _iter_feature_chunks(csv_path, chunksize):
+    """
+    Yields engineered feature chunks. The last CONTEXT_ROWS raw rows of the
+    previous chunk are prepended before computing lags and rolling windows,
+    then dropped again, so values at chunk boundaries match the full-file run.
+    """
+    context = None
+    row_offset = 0
+    for raw in pd.read_csv(csv_path, on_bad_lines='skip', chunksize=chunksize):
+        raw = raw.reset_index(drop=True)
+        n_context = 0 if context is None else len(context)
+        frame = raw if context is None else pd.concat([context, raw], ignore_index=True)
+        featured = add_features(frame.copy(), row_offset=row_offset - n_context)
+        yield featured.iloc[n_context:]
+        context = frame.iloc[-CONTEXT_ROWS:]
+        row_offset += len(raw)
+
+
+def stream_features_to_store(csv_path, store_dir, chunksize=CHUNK_ROWS):
+    """
+    Builds the engineered feature matrix and target out-of-core and writes
+    them to store_dir as features.npy, target.npy and columns.json.
+    Reproduces df.ffill().bfill().dropna() from the in-memory pipeline:
+    forward fill carries the last written row across chunks, and leading rows
+    are held back until every column has seen its first valid value.
+    Peak memory is bounded by chunksize rather than the file size.
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    features_writer = None
+    target_writer = None
+    feature_cols = None
+    last_row = None
+    pending = None
+
+    def write(filled):
+        features_writer.append(filled[feature_cols].to_numpy(dtype=np.float64))
+        target_writer.append(filled[TARGET_COL].to_numpy(dtype=np.float64))
+
+    try:
+        for chunk in _iter_feature_chunks(csv_path, chunksize):
+            if feature_cols is None:
+                feature_cols = feature_columns(chunk)
+                features_writer = NpyAppender(os.path.join(store_dir, 'features.npy'), (len(feature_cols),))
+                target_writer = NpyAppender(os.path.join(store_dir, 'target.npy'))
+
+            if last_row is not None:
+                filled = pd.concat([last_row, chunk]).ffill().iloc[1:]
+            else:
+                # Head of the file: wait until backfill has a value for every column
+                pending = chunk if pending is None else pd.concat([pending, chunk])
+                filled = pending.ffill().bfill()
+                if filled.isna().any().any():
+                    continue
+                pending = None
+
+            write(filled)
+            last_row = filled.iloc[[-1]]
+    finally:
+        if features_writer is not None:
+            features_writer.close()
+            target_writer.close()
+
+    # A column that is NaN everywhere makes dropna() remove every row, which
+    # is what an unresolved head means here: nothing was written.
+    with open(os.path.join(store_dir, 'columns.json'), 'w') as f:
+        json.dump({'feature_cols': feature_cols or [], 'target_col': TARGET_COL}, f)
+
+    rows = features_writer.rows if features_writer is not None else 0
+    print(f"Feature store written to {store_dir}: {rows} rows, {len(feature_cols or [])} features")
+    return feature_cols
+
+
+def load_feature_store(store_dir, mmap_mode='r'):
+    """Returns (X_raw, y_raw, feature_cols) memory-mapped from a feature store."""
+    with open(os.path.join(store_dir, 'columns.json')) as f:
+        meta = json.load(f)
+    X_raw = np.load(os.path.join(store_dir, 'features.npy'), mmap_mode=mmap_mode)
+    y_raw = np.load(os.path.join(store_dir, 'target.npy'), mmap_mode=mmap_mode)
+    return X_raw, y_raw, meta['feature_cols']
+
+
+def header_feature_columns(csv_path):
+    """feature_cols for a CSV, derived from its header without reading any rows."""
+    return feature_columns(add_features(pd.read_csv(csv_path, nrows=0)))
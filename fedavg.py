@@ -0,0 +1,225 @@
+import io
+import json
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+# --- CONFIGURATION ---
+LAYER_KEYS = ('W1', 'b1', 'W2', 'b2', 'W3', 'b3', 'W4', 'b4')
+ROUND_MIN_CLIENTS = 100   # Close the round once this many clients have reported...
+ROUND_SECONDS = 15 * 60   # ...or this long after the first update arrived
+OUTPUT_DTYPE = np.float32 # Same dtype as the student weights
+
+
+def weights_from_npz_bytes(data):
+    """Reads W1..b4 from an uploaded npz payload."""
+    with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+        return {key: npz[key] for key in LAYER_KEYS}
+
+
+def weights_to_npz_bytes(weights):
+    """Serializes W1..b4 to npz bytes for upload."""
+    buffer = io.BytesIO()
+    np.savez(buffer, **{key: weights[key] for key in LAYER_KEYS})
+    return buffer.getvalue()
+
+
+class FedAvgAggregator:
+    """
+    Streaming FedAvg. Each update is folded into a running float64 weighted
+    sum per layer as soon as it arrives, so memory is O(model size)
+    regardless of how many clients report. A round closes when
+    min_clients updates have arrived or round_seconds have passed since the
+    first one; the weighted mean is then handed to on_round_closed(weights,
+    summary) and the sums are reset for the next round.
+    A client that reports twice in one round is only counted once.
+
+    If on_round_closed raises, the error is logged and the closed round is
+    kept: every later add(), close() or close_if_expired() retries the
+    unpublished rounds, oldest first, until the callback succeeds.
+
+    save_state()/restore_state() checkpoint the open round (sums, clients
+    and elapsed time) and any unpublished rounds, so a restarted worker
+    carries on with them.
+    """
+
+    def __init__(self, min_clients=ROUND_MIN_CLIENTS, round_seconds=ROUND_SECONDS,
+                 on_round_closed=None, clock=time.monotonic):
+        self.min_clients = min_clients
+        self.round_seconds = round_seconds
+        self.on_round_closed = on_round_closed
+        self.clock = clock
+        self.round_id = 0
+        self._lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()  # Keeps an older snapshot from replacing a newer one
+        self._unpublished = []
+        self._reset()
+
+    def _reset(self):
+        self._sums = None
+        self._scratch = None
+        self._total_weight = 0.0
+        self._clients = set()
+        self._started = None
+
+    @property
+    def num_clients(self):
+        return len(self._clients)
+
+    @property
+    def num_unpublished(self):
+        """Closed rounds whose on_round_closed callback has not succeeded yet."""
+        return len(self._unpublished)
+
+    def add(self, weights, sample_weight=1.0, client_id=None):
+        """
+        Folds one client's W1..b4 into the round. Returns the closed round's
+        (weights, summary) if this update completed it, else None.
+        """
+        if not np.isfinite(sample_weight) or sample_weight <= 0:
+            raise ValueError(f"sample_weight must be positive and finite, got {sample_weight}")
+
+        result = None
+        with self._lock:
+            if client_id is None:
+                client_id = f"anonymous-{self.round_id}-{self.num_clients}"
+            if client_id in self._clients:
+                return None
+            if self._sums is None:
+                self._sums = {key: np.zeros(np.shape(weights[key]), dtype=np.float64) for key in LAYER_KEYS}
+                self._scratch = {key: np.empty_like(s) for key, s in self._sums.items()}
+                self._started = self.clock()
+
+            for key in LAYER_KEYS:
+                layer = weights[key]
+                if np.shape(layer) != self._sums[key].shape:
+                    raise ValueError(f"{key} has shape {np.shape(layer)}, expected {self._sums[key].shape}")
+            for key in LAYER_KEYS:
+                scratch = self._scratch[key]
+                np.multiply(weights[key], sample_weight, out=scratch)
+                self._sums[key] += scratch
+
+            self._total_weight += float(sample_weight)
+            self._clients.add(client_id)
+
+            if self.num_clients >= self.min_clients:
+                result = self._close()
+        return self._publish(result)
+
+    def add_npz_bytes(self, data, sample_weight=1.0, client_id=None):
+        return self.add(weights_from_npz_bytes(data), sample_weight, client_id)
+
+    def close_if_expired(self):
+        """Closes the round if its deadline has passed. Call periodically."""
+        result = None
+        with self._lock:
+            if self._started is not None and self.clock() - self._started >= self.round_seconds:
+                result = self._close()
+        return self._publish(result)
+
+    def close(self):
+        """Closes the round now, if any update has arrived."""
+        result = None
+        with self._lock:
+            if self._sums is not None:
+                result = self._close()
+        return self._publish(result)
+
+    def save_state(self, path):
+        """
+        Atomically writes the open round and the unpublished rounds to path,
+        or removes path if there are neither.
+        """
+        with self._checkpoint_lock:
+            with self._lock:
+                state = {'round_id': np.int64(self.round_id),
+                         'num_unpublished': np.int64(len(self._unpublished))}
+                for i, (weights, summary) in enumerate(self._unpublished):
+                    state.update({f"pending{i}_{key}": layer for key, layer in weights.items()})
+                    state[f"pending{i}_summary"] = np.array(json.dumps(summary))
+                if self._sums is not None:
+                    state.update({f"sum_{key}": s.copy() for key, s in self._sums.items()})
+                    state.update(total_weight=np.float64(self._total_weight),
+                                 elapsed_seconds=np.float64(self.clock() - self._started),
+                                 clients=np.array(sorted(self._clients), dtype=str))
+                elif not self._unpublished:
+                    state = None
+            if state is None:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                return
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **state)
+            os.replace(tmp_path, path)
+
+    def restore_state(self, path):
+        """
+        Resumes the rounds checkpointed by save_state(). The open round keeps
+        its elapsed time towards round_seconds; unpublished rounds are queued
+        for the next publish attempt. Returns False if there is no checkpoint.
+        """
+        try:
+            npz = np.load(path, allow_pickle=False)
+        except FileNotFoundError:
+            return False
+        with npz, self._lock:
+            for i in range(int(npz['num_unpublished'])):
+                weights = {key: npz[f"pending{i}_{key}"] for key in LAYER_KEYS}
+                self._unpublished.append((weights, json.loads(str(npz[f"pending{i}_summary"]))))
+            if 'total_weight' in npz.files:
+                self._sums = {key: npz[f"sum_{key}"].astype(np.float64) for key in LAYER_KEYS}
+                self._scratch = {key: np.empty_like(s) for key, s in self._sums.items()}
+                self._total_weight = float(npz['total_weight'])
+                self._clients = set(npz['clients'].tolist())
+                self._started = self.clock() - float(npz['elapsed_seconds'])
+            self.round_id = max(self.round_id, int(npz['round_id']))
+        return True
+
+    def _close(self):
+        weights = {key: (s / self._total_weight).astype(OUTPUT_DTYPE) for key, s in self._sums.items()}
+        self.round_id += 1
+        summary = {
+            'round_id': self.round_id,
+            'num_clients': self.num_clients,
+            'total_weight': self._total_weight,
+            'duration_seconds': self.clock() - self._started,
+        }
+        self._reset()
+        return weights, summary
+
+    def _publish(self, result=None):
+        """
+        Queues a newly closed round (if any) and hands the queued rounds to
+        on_round_closed in order. Runs outside the aggregation lock so a slow
+        upload does not block new updates; only one thread publishes at a
+        time, the others leave their rounds to it or to the next call.
+        """
+        with self._lock:
+            if result is not None and self.on_round_closed is not None:
+                self._unpublished.append(result)
+            if not self._unpublished or not self._publish_lock.acquire(blocking=False):
+                return result
+        try:
+            while True:
+                with self._lock:
+                    if not self._unpublished:
+                        break
+                    pending = self._unpublished[0]
+                try:
+                    self.on_round_closed(*pending)
+                except Exception:
+                    logging.exception(f"Publishing round {pending[1]['round_id']} failed; "
+                                      f"{len(self._unpublished)} round(s) kept for retry")
+                    break
+                with self._lock:
+                    self._unpublished.pop(0)
+        finally:
+            self._publish_lock.release()
+        return result
@@ -0,0 +1,404 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from windowing import WINDOW_SIZE, sliding_windows, fit_pooled_window_robust_scaler
+from fedavg import FedAvgAggregator, LAYER_KEYS
+from calibration import MedianCalibrator
+from mlp_inference import MLPStudent
+from npz_utils import load_npz
+from robust_aggregation import METHODS as ROBUST_METHODS, robust_aggregate, open_updates, check_krum_clients
+from models import forecast_metrics
+
+# --- CONFIGURATION ---
+FEDERATION_DIR = 'federated_runs'
+TEACHER_EPOCHS = 100
+LOCAL_EPOCHS = 5          # Student epochs per node per round
+FEDAVG_ROUNDS = 10
+BATCH_SIZE = 32
+SEED = 42                 # Shared so every node starts the student from the same initialization
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                   'TF_NUM_INTRAOP_THREADS')
+
+
+# === Data partitioning ===
+
+def partition_csv(csv_path, node_ids, out_dir):
+    """
+    Splits one CSV into contiguous, time-ordered row blocks, one per node,
+    written as <out_dir>/<node_id>.csv. Returns {node_id: csv_path}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    df = pd.read_csv(csv_path, on_bad_lines='skip')
+    paths = {}
+    for node_id, rows in zip(node_ids, np.array_split(np.arange(len(df)), len(node_ids))):
+        path = os.path.join(out_dir, f"{node_id}.csv")
+        df.iloc[rows].to_csv(path, index=False)
+        paths[node_id] = path
+    return paths
+
+
+def default_node_ids(num_nodes):
+    from backend_simulator import FEDERATED_NODES
+    if num_nodes <= len(FEDERATED_NODES):
+        return [node["id"] for node in FEDERATED_NODES[:num_nodes]]
+    return [f"node_{i:03d}" for i in range(num_nodes)]
+
+
+# === Worker processes ===
+
+def init_training_worker(threads, next_slot, cores):
+    """
+    Pool initializer: where the OS allows it, pins the worker to its own
+    slice of cores, and caps TensorFlow's thread pools. The math libraries'
+    thread counts come from the environment set up by training_pool().
+    """
+    if cores and hasattr(os, 'sched_setaffinity'):
+        with next_slot.get_lock():
+            slot = next_slot.value
+            next_slot.value += 1
+        start = slot * threads % len(cores)
+        os.sched_setaffinity(0, {cores[(start + i) % len(cores)] for i in range(threads)})
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+@contextlib.contextmanager
+def training_pool(workers, threads):
+    """
+    Spawn-based ProcessPoolExecutor whose workers run init_training_worker.
+    THREAD_ENV_VARS are set in this process for the pool's lifetime: spawned
+    workers inherit os.environ, and they import numpy (loading its BLAS)
+    while unpickling the initializer, i.e. before it could set them.
+    """
+    # spawn: TensorFlow is not fork-safe
+    context = multiprocessing.get_context('spawn')
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    env = {var: str(threads) for var in THREAD_ENV_VARS}
+    env.update(TF_NUM_INTEROP_THREADS='1', TF_CPP_MIN_LOG_LEVEL='2')
+    saved = {var: os.environ.get(var) for var in env}
+    os.environ.update(env)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_training_worker,
+                                 initargs=(threads, context.Value('i', 0), cores)) as pool:
+            yield pool
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def _node_dir(out_dir, node_id):
+    return os.path.join(out_dir, node_id)
+
+
+def _node_windows(data, scaler_X, window_size):
+    """window(start, stop, ...) over a node's cached dataset, as in train_local_model."""
+    from window_pipeline import window_dataset
+    base_X = data['features'][:-24]
+
+    def windows(start, stop, targets=None, flatten=False, shuffle=False, seed=None, batch_size=BATCH_SIZE):
+        return window_dataset(base_X, window_size, start, stop, targets=targets, scaler=scaler_X,
+                              flatten=flatten, shuffle=shuffle, batch_size=batch_size, seed=seed)
+    return windows
+
+
+def prepare_node_dataset(node_id, csv_path, window_size=WINDOW_SIZE):
+    """Worker task: Steps 1-5 for one node, so the driver can memory-map the cached dataset."""
+    from dataset import load_dataset
+
+    start = time.perf_counter()
+    load_dataset(csv_path, window_size)
+    return {'node_id': node_id, 'seconds': time.perf_counter() - start, 'pid': os.getpid()}
+
+
+def fit_federation_scalers(datasets, window_size=WINDOW_SIZE):
+    """
+    One (scaler_X, scaler_y) for the whole federation, so every node trains
+    on, and the global model is evaluated with, the same input and target
+    scaling. Fit as in prepare_dataset, but over the training windows and
+    log1p targets of all nodes' (data, meta) at once.
+    """
+    from sklearn.preprocessing import MinMaxScaler
+
+    scaler_X = fit_pooled_window_robust_scaler([(data['features'][:-24], meta['split1']) for data, meta in datasets],
+                                               window=window_size)
+    scaler_y = MinMaxScaler().fit(np.log1p(np.concatenate([data['y_train'] for data, _ in datasets])).reshape(-1, 1))
+    return scaler_X, scaler_y
+
+
+def _scaled_targets(scaler_y, y):
+    return scaler_y.transform(np.log1p(np.asarray(y)).reshape(-1, 1)).flatten()
+
+
+def train_node_teacher(node_id, csv_path, out_dir, params_path, window_size=WINDOW_SIZE, epochs=TEACHER_EPOCHS,
+                       seed=SEED):
+    """
+    Worker task: Steps 6-7a for one node. Trains the teacher on the node's
+    cached dataset scaled with the federation scalers at params_path, and
+    saves its soft labels for the train and validation windows. Returns
+    timing and sizes.
+    """
+    import tensorflow as tf
+    from dataset import load_dataset, dataset_scalers
+    from models import build_teacher, teacher_callbacks
+
+    start = time.perf_counter()
+    tf.keras.utils.set_random_seed(seed)
+    node_dir = _node_dir(out_dir, node_id)
+    os.makedirs(node_dir, exist_ok=True)
+
+    data, meta = load_dataset(csv_path, window_size)
+    split1, split2 = meta['split1'], meta['split2']
+    n_features = data['X_scaled'].shape[1]
+    scaler_X, scaler_y = dataset_scalers(load_npz(params_path))
+    windows = _node_windows(data, scaler_X, window_size)
+
+    teacher = build_teacher(window_size, n_features)
+    teacher.fit(windows(0, split1, _scaled_targets(scaler_y, data['y_train']), shuffle=True, seed=seed),
+                validation_data=windows(split1, split2, _scaled_targets(scaler_y, data['y_val'])),
+                epochs=epochs, callbacks=teacher_callbacks(), verbose=0)
+    np.save(os.path.join(node_dir, 'teacher_pred_train.npy'), teacher.predict(windows(0, split1), verbose=0).flatten())
+    np.save(os.path.join(node_dir, 'teacher_pred_val.npy'), teacher.predict(windows(split1, split2), verbose=0).flatten())
+    return {'node_id': node_id, 'n_train': int(split1), 'n_features': int(n_features),
+            'seconds': time.perf_counter() - start, 'pid': os.getpid()}
+
+
+def train_node_student(node_id, csv_path, out_dir, params_path, round_id, global_path=None, window_size=WINDOW_SIZE,
+                       epochs=LOCAL_EPOCHS, batch_size=BATCH_SIZE, seed=SEED):
+    """
+    Worker task: one FedAvg round of local distillation on one node. The
+    student starts from the global model at global_path (or, in the first
+    round, from the shared seeded initialization) and is trained on the
+    node's cached teacher soft labels. Returns the saved weights path.
+    """
+    import tensorflow as tf
+    from dataset import load_dataset, dataset_scalers
+    from models import build_student, set_mlp_weights, save_mlp_weights
+
+    start = time.perf_counter()
+    node_dir = _node_dir(out_dir, node_id)
+    data, meta = load_dataset(csv_path, window_size)
+    split1, split2 = meta['split1'], meta['split2']
+    scaler_X, _ = dataset_scalers(load_npz(params_path))
+    windows = _node_windows(data, scaler_X, window_size)
+    teacher_pred_train = np.load(os.path.join(node_dir, 'teacher_pred_train.npy'), mmap_mode='r')
+    teacher_pred_val = np.load(os.path.join(node_dir, 'teacher_pred_val.npy'), mmap_mode='r')
+
+    tf.keras.utils.set_random_seed(seed)
+    student = build_student(window_size * data['X_scaled'].shape[1])
+    if global_path is not None:
+        set_mlp_weights(student, load_npz(global_path))
+    tf.keras.utils.set_random_seed(seed + round_id)
+    student.fit(windows(0, split1, teacher_pred_train, flatten=True, shuffle=True, seed=seed + round_id,
+                        batch_size=batch_size),
+                validation_data=windows(split1, split2, teacher_pred_val, flatten=True, batch_size=batch_size),
+                epochs=epochs, verbose=0)
+
+    weights_path = os.path.join(node_dir, f"round_{round_id:03d}.npz")
+    save_mlp_weights(student, weights_path)
+    return {'node_id': node_id, 'weights_path': weights_path, 'n_train': int(split1),
+            'seconds': time.perf_counter() - start, 'pid': os.getpid()}
+
+
+# === Evaluation (NumPy, in the driver) ===
+
+def evaluate_node(weights_path, scalers_path, data, meta, window_size=WINDOW_SIZE):
+    """Steps 8-9 on a node's test windows for any W1..b4 file, using the federation scalers."""
+    student = MLPStudent(weights_path, scalers_path)
+    test_windows = sliding_windows(data['features'][:-24], window_size)[meta['split2']:]
+    y_test = np.asarray(data['y_test'])
+    y_pred = np.concatenate([student.predict(test_windows[i:i + student.max_batch])
+                             for i in range(0, len(test_windows), student.max_batch)])
+    y_final, _, _ = MedianCalibrator().calibrate(y_test, y_pred)
+    return forecast_metrics(y_test, y_final)
+
+
+def mean_metrics(per_node, weights):
+    """Sample-weighted mean of per-node metric dicts."""
+    total = sum(weights)
+    return {k: sum(m[k] * w for m, w in zip(per_node, weights)) / total for k in per_node[0]}
+
+
+# === Driver ===
+
+class FederatedTrainer:
+    """
+    Federated distillation across node datasets on one machine. Each node's
+    teacher and local student training runs in its own worker process with
+    a pinned thread count; FedAvg (fedavg.FedAvgAggregator, sample-weighted
+    by training windows) or a robust_aggregation method runs in the driver
+    over the W1..b4 npz files the workers write. Input and target scalers
+    are fit once for the federation, on the pooled training windows of all
+    nodes, so local updates are averaged in the same scaled space. After
+    each round the global model and every node's local model are evaluated
+    on each node's test split, so federated accuracy and per-phase
+    wall-clock scaling are reported together.
+    """
+
+    def __init__(self, node_csvs, out_dir=FEDERATION_DIR, workers=None, threads_per_worker=1,
+                 window_size=WINDOW_SIZE, seed=SEED, aggregation='fedavg'):
+        if aggregation != 'fedavg' and aggregation not in ROBUST_METHODS:
+            raise ValueError(f"Unknown aggregation {aggregation!r}")
+        self.node_csvs = dict(node_csvs)
+        if aggregation in ('krum', 'multi_krum'):
+            check_krum_clients(len(self.node_csvs))  # Fail now rather than after a full training round
+        self.aggregation = aggregation
+        self.out_dir = out_dir
+        self.workers = workers or max(1, min(len(self.node_csvs), (os.cpu_count() or 1) // threads_per_worker))
+        self.threads_per_worker = threads_per_worker
+        self.window_size = window_size
+        self.seed = seed
+        self.history = []
+        self._datasets = {}
+        os.makedirs(out_dir, exist_ok=True)
+
+    @property
+    def scalers_path(self):
+        """Federation scalers in MLPStudent's format, for evaluation and deployment."""
+        return os.path.join(self.out_dir, 'scalers.npz')
+
+    @property
+    def scaler_params_path(self):
+        """Federation scalers as dataset_scalers() parameters, for the workers."""
+        return os.path.join(self.out_dir, 'scaler_params.npz')
+
+    def fit_scalers(self):
+        from feature_cache import robust_scaler_params, minmax_scaler_params
+        from mlp_inference import save_scalers
+
+        datasets = [self._dataset(node_id) for node_id in self.node_csvs]
+        feature_cols = datasets[0][1]['feature_cols']
+        for node_id, (_, meta) in zip(self.node_csvs, datasets):
+            if list(meta['feature_cols']) != list(feature_cols):
+                raise ValueError(f"Node {node_id} has different feature columns than the other nodes")
+        scaler_X, scaler_y = fit_federation_scalers(datasets, self.window_size)
+        params = {f"scaler_X_{k}": v for k, v in robust_scaler_params(scaler_X).items()}
+        params.update({f"scaler_y_{k}": v for k, v in minmax_scaler_params(scaler_y).items()})
+        np.savez(self.scaler_params_path, **params)
+        save_scalers(self.scalers_path, scaler_X, scaler_y, self.window_size, feature_cols)
+
+    @staticmethod
+    def _phase_report(name, results, elapsed, workers):
+        busy = sum(r['seconds'] for r in results)
+        return {'phase': name, 'wall_seconds': elapsed, 'worker_seconds': busy,
+                'speedup': busy / elapsed if elapsed else 0.0,
+                'parallel_efficiency': busy / (elapsed * workers) if elapsed else 0.0}
+
+    def run(self, rounds=FEDAVG_ROUNDS, local_epochs=LOCAL_EPOCHS, teacher_epochs=TEACHER_EPOCHS):
+        phases = []
+        with training_pool(self.workers, self.threads_per_worker) as pool:
+            start = time.perf_counter()
+            futures = [pool.submit(prepare_node_dataset, node_id, csv, self.window_size)
+                       for node_id, csv in self.node_csvs.items()]
+            prepared = [f.result() for f in futures]
+            self.fit_scalers()
+            phases.append(self._phase_report('datasets', prepared, time.perf_counter() - start, self.workers))
+
+            start = time.perf_counter()
+            futures = [pool.submit(train_node_teacher, node_id, csv, self.out_dir, self.scaler_params_path,
+                                   self.window_size, teacher_epochs, self.seed)
+                       for node_id, csv in self.node_csvs.items()]
+            teachers = [f.result() for f in futures]
+            phases.append(self._phase_report('teachers', teachers, time.perf_counter() - start, self.workers))
+            print(f"Teachers trained on {len(teachers)} nodes in {phases[-1]['wall_seconds']:.1f}s "
+                  f"(speedup {phases[-1]['speedup']:.2f}x)")
+
+            global_path = None
+            for round_id in range(1, rounds + 1):
+                start = time.perf_counter()
+                futures = [pool.submit(train_node_student, node_id, csv, self.out_dir, self.scaler_params_path,
+                                       round_id, global_path, self.window_size, local_epochs, BATCH_SIZE, self.seed)
+                           for node_id, csv in self.node_csvs.items()]
+                updates = [f.result() for f in futures]
+                phases.append(self._phase_report(f"round_{round_id}", updates, time.perf_counter() - start,
+                                                 self.workers))
+                global_path = self.aggregate(round_id, updates)
+                self.history.append(self.evaluate(round_id, global_path, updates))
+                summary = self.history[-1]['global_mean']
+                print(f"Round {round_id}: global RMSE {summary['rmse']:.2f} kW, MAE {summary['mae']:.2f} kW, "
+                      f"sMAPE {summary['smape']:.2f}% ({phases[-1]['wall_seconds']:.1f}s)")
+
+        report = {'nodes': list(self.node_csvs), 'aggregation': self.aggregation, 'workers': self.workers,
+                  'threads_per_worker': self.threads_per_worker, 'phases': phases, 'rounds': self.history,
+                  'global_weights': global_path, 'scalers': self.scalers_path}
+        with open(os.path.join(self.out_dir, 'report.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+    def aggregate(self, round_id, updates):
+        if self.aggregation == 'fedavg':
+            # The round closes on the last node's update
+            aggregator = FedAvgAggregator(min_clients=len(updates), round_seconds=float('inf'))
+            for update in updates:
+                closed = aggregator.add(load_npz(update['weights_path']), sample_weight=update['n_train'],
+                                        client_id=update['node_id'])
+            weights, _ = closed
+        else:
+            weights, summary = robust_aggregate(open_updates([u['weights_path'] for u in updates]), self.aggregation,
+                                                sample_weights=[u['n_train'] for u in updates])
+            if 'selected' in summary:
+                print(f"  {self.aggregation} kept {[updates[i]['node_id'] for i in summary['selected']]}")
+        global_path = os.path.join(self.out_dir, f"global_round_{round_id:03d}.npz")
+        np.savez(global_path, **{key: weights[key] for key in LAYER_KEYS})
+        return global_path
+
+    def _dataset(self, node_id):
+        # Cached by the workers, so this only memory-maps the arrays
+        if node_id not in self._datasets:
+            from dataset import load_dataset
+            self._datasets[node_id] = load_dataset(self.node_csvs[node_id], self.window_size)
+        return self._datasets[node_id]
+
+    def evaluate(self, round_id, global_path, updates):
+        n_train = [u['n_train'] for u in updates]
+        global_metrics, local_metrics = [], []
+        for u in updates:
+            data, meta = self._dataset(u['node_id'])
+            global_metrics.append(evaluate_node(global_path, self.scalers_path, data, meta, self.window_size))
+            local_metrics.append(evaluate_node(u['weights_path'], self.scalers_path, data, meta, self.window_size))
+        return {
+            'round_id': round_id,
+            'global': {u['node_id']: m for u, m in zip(updates, global_metrics)},
+            'local': {u['node_id']: m for u, m in zip(updates, local_metrics)},
+            'global_mean': mean_metrics(global_metrics, n_train),
+            'local_mean': mean_metrics(local_metrics, n_train),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Federated distillation across node datasets in worker processes.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv", help="One CSV, partitioned into contiguous blocks per node")
+    source.add_argument("--node-csv", nargs="+", metavar="NODE=PATH", help="One CSV per node")
+    parser.add_argument("--nodes", type=int, default=5, help="Number of nodes when partitioning --csv")
+    parser.add_argument("--out", default=FEDERATION_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per node, up to the CPU count)")
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=FEDAVG_ROUNDS)
+    parser.add_argument("--local-epochs", type=int, default=LOCAL_EPOCHS)
+    parser.add_argument("--teacher-epochs", type=int, default=TEACHER_EPOCHS)
+    parser.add_argument("--aggregation", choices=('fedavg',) + ROBUST_METHODS, default='fedavg',
+                        help="FedAvg, or a Byzantine-robust method from robust_aggregation")
+    args = parser.parse_args()
+
+    if args.csv:
+        node_csvs = partition_csv(args.csv, default_node_ids(args.nodes), os.path.join(args.out, 'partitions'))
+    else:
+        node_csvs = dict(spec.split("=", 1) for spec in args.node_csv)
+
+    trainer = FederatedTrainer(node_csvs, args.out, args.workers, args.threads_per_worker,
+                               aggregation=args.aggregation)
+    report = trainer.run(args.rounds, args.local_epochs, args.teacher_epochs)
+    total = sum(phase['wall_seconds'] for phase in report['phases'])
+    print(f"Done in {total:.1f}s on {report['workers']} workers x {report['threads_per_worker']} threads; "
+          f"report: {os.path.join(args.out, 'report.json')}")
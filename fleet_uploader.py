@@ -0,0 +1,142 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from block_uploader import BlockUploader, AzureBlockTarget
+
+# --- CONFIGURATION ---
+FLEET_WORKERS = 32    # Devices uploading at the same time
+DEVICE_ATTEMPTS = 2   # A device whose upload fails is retried, resuming from its staged blocks
+MODEL_VERSION = "3.1.0"
+
+
+def create_session(pool_size):
+    """One requests.Session with a connection pool sized for the whole fleet."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class FleetUploader:
+    """
+    Drives many prosumer devices at once: each device's weight file goes
+    through a shared BlockUploader, then its notification is posted to the
+    frontend API over a shared connection pool. run() returns per-device
+    results plus throughput and tail-latency statistics.
+    """
+
+    def __init__(self, uploader, container, api_url=None, workers=FLEET_WORKERS, attempts=DEVICE_ATTEMPTS):
+        self.uploader = uploader
+        self.container = container
+        self.api_url = api_url
+        self.workers = workers
+        self.attempts = attempts
+        self.session = create_session(workers) if api_url else None
+
+    def send_device(self, device_id, file_path):
+        start = time.perf_counter()
+        sent = 0
+        for attempt in range(self.attempts):
+            try:
+                url, attempt_sent = self.uploader.upload(self.container, file_path, upload_id=device_id)
+                sent += attempt_sent
+                break
+            except Exception as e:
+                if attempt == self.attempts - 1:
+                    return {"device_id": device_id, "ok": False, "error": str(e),
+                            "latency": time.perf_counter() - start, "bytes_sent": sent}
+
+        if self.session is not None:
+            import requests
+            payload = {"deviceId": device_id, "modelVersion": MODEL_VERSION, "blobUrl": url}
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=30)
+                response.raise_for_status()
+            except requests.RequestException as e:
+                # The blob is uploaded; only the notification failed
+                return {"device_id": device_id, "ok": False, "blob_url": url, "error": f"notification failed: {e}",
+                        "latency": time.perf_counter() - start, "bytes_sent": sent, "attempts": attempt + 1}
+
+        return {"device_id": device_id, "ok": True, "blob_url": url,
+                "latency": time.perf_counter() - start, "bytes_sent": sent,
+                "attempts": attempt + 1}
+
+    def run(self, devices):
+        """devices is a list of (device_id, file_path). Returns (results, report)."""
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(lambda d: self.send_device(*d), devices))
+        return results, fleet_report(results, time.perf_counter() - start)
+
+
+def fleet_report(results, elapsed):
+    latencies = np.array([r["latency"] for r in results if r["ok"]])
+    total_bytes = sum(r["bytes_sent"] for r in results)
+    report = {
+        "devices": len(results),
+        "succeeded": int(sum(r["ok"] for r in results)),
+        "resumed": int(sum(r.get("attempts", 1) > 1 for r in results)),
+        "elapsed_seconds": elapsed,
+        "bytes_sent": total_bytes,
+        "throughput_mb_s": total_bytes / elapsed / 1e6 if elapsed else 0.0,
+        "devices_per_second": len(results) / elapsed if elapsed else 0.0,
+    }
+    if len(latencies):
+        for p in (50, 95, 99):
+            report[f"latency_p{p}_seconds"] = float(np.percentile(latencies, p))
+        report["latency_max_seconds"] = float(latencies.max())
+    return report
+
+
+def print_fleet_report(report):
+    print(f"Devices: {report['succeeded']}/{report['devices']} succeeded ({report['resumed']} resumed)")
+    print(f"Sent {report['bytes_sent'] / 1e6:.1f} MB in {report['elapsed_seconds']:.2f}s "
+          f"({report['throughput_mb_s']:.1f} MB/s, {report['devices_per_second']:.1f} devices/s)")
+    if "latency_p50_seconds" in report:
+        print(f"Latency p50 {report['latency_p50_seconds'] * 1000:.0f} ms, "
+              f"p95 {report['latency_p95_seconds'] * 1000:.0f} ms, "
+              f"p99 {report['latency_p99_seconds'] * 1000:.0f} ms, "
+              f"max {report['latency_max_seconds'] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload weight files for a fleet of prosumer devices.")
+    parser.add_argument("--local", action="store_true", help="Use the local blob-storage stand-in")
+    parser.add_argument("--connection-string", default=os.environ.get("STORAGE_CONNECTION_STRING"))
+    parser.add_argument("--container", default="model-weights")
+    parser.add_argument("--api-url", default=None)
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--size-kb", type=int, default=512, help="Synthetic weight file size per device")
+    parser.add_argument("--block-kb", type=int, default=128)
+    parser.add_argument("--workers", type=int, default=FLEET_WORKERS)
+    parser.add_argument("--latency", type=float, default=0.005, help="Local stand-in: seconds per request")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Local stand-in: fraction of failed blocks")
+    args = parser.parse_args()
+
+    if args.local:
+        from local_backend import LocalBlobStore
+        target = LocalBlobStore(root=tempfile.mkdtemp(prefix="fedgrid_blobs_"),
+                                latency_seconds=args.latency, failure_rate=args.failure_rate)
+    else:
+        target = AzureBlockTarget(args.connection_string, max_connections=args.workers * 2)
+
+    work_dir = tempfile.mkdtemp(prefix="fedgrid_fleet_")
+    rng = np.random.default_rng(0)
+    devices = []
+    for i in range(args.devices):
+        path = os.path.join(work_dir, f"local_model_weights_{i:05d}.npz")
+        with open(path, "wb") as f:
+            f.write(rng.bytes(args.size_kb * 1024))
+        devices.append((f"prosumer-{i:05d}", path))
+
+    uploader = BlockUploader(target, block_size=args.block_kb * 1024, workers=args.workers)
+    fleet = FleetUploader(uploader, args.container, api_url=args.api_url, workers=args.workers)
+    results, report = fleet.run(devices)
+    uploader.close()
+    print_fleet_report(report)
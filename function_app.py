@@ -1,11 +1,19 @@
 import logging
-import json
 import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import List
 import azure.functions as func
-from azure.storage.blob import BlobClient
-from azure.confidentialledger.client import ConfidentialLedgerClient
-from azure.confidentialledger.certificate import ConfidentialLedgerCertificateClient
-from azure.identity import ManagedIdentityCredential
+from azure_clients import AzureBackend
+from blob_cache import BlobCache, BLOB_CACHE_DIR, BLOB_CACHE_MAX_BYTES as DEFAULT_BLOB_CACHE_MAX_BYTES
+from fedavg import FedAvgAggregator, LAYER_KEYS, weights_from_npz_bytes
+from global_model_store import GlobalModelStore, LATEST_BLOB
+from merkle_anchor import LedgerAnchor, ANCHOR_INDEX_PATH
+from npz_utils import load_npz
+from notification_processor import process_batch
+from weight_codec import weights_sha256
 
 # This line initializes your Function App
 app = func.FunctionApp()
@@ -14,58 +22,184 @@ app = func.FunctionApp()
 # These are read from your Function App's "Configuration" settings
 LEDGER_ENDPOINT = os.environ.get("LEDGER_ENDPOINT")
 IDENTITY_CLIENT_ID = os.environ.get("IDENTITY_CLIENT_ID")
+# Container that receives the aggregated global model after each round
+GLOBAL_MODEL_CONTAINER_URL = os.environ.get("GLOBAL_MODEL_CONTAINER_URL")
+ROUND_MIN_CLIENTS = int(os.environ.get("ROUND_MIN_CLIENTS", "100"))
+ROUND_SECONDS = int(os.environ.get("ROUND_SECONDS", "900"))
+# Set to "local" to run against the offline stand-ins in local_backend.py
+FEDGRID_BACKEND = os.environ.get("FEDGRID_BACKEND", "azure")
+# "merkle" anchors batches of notifications as one Merkle root per ledger entry;
+# "per_entry" appends every notification to the ledger individually
+LEDGER_ANCHOR_MODE = os.environ.get("LEDGER_ANCHOR_MODE", "per_entry")
+ANCHOR_BATCH_SIZE = int(os.environ.get("ANCHOR_BATCH_SIZE", "256"))
+ANCHOR_FLUSH_SECONDS = int(os.environ.get("ANCHOR_FLUSH_SECONDS", "60"))
+# Delta uploads may reference any of the most recent global models
+GLOBAL_MODEL_HISTORY = int(os.environ.get("GLOBAL_MODEL_HISTORY", "4"))
+GLOBAL_MODEL_RETRY_SECONDS = 60  # Between attempts to load the latest global model after a cold start
+# Local disk cache of downloaded blobs (and of processed blob versions, for dedup); "0" disables it
+BLOB_CACHE_MAX_BYTES = int(os.environ.get("BLOB_CACHE_MAX_BYTES", str(DEFAULT_BLOB_CACHE_MAX_BYTES)))
+# Checkpoint of this instance's open round, rewritten after every batch. Point it at
+# persistent storage (e.g. /home/data/fedgrid) to also survive an instance recycle.
+AGGREGATOR_STATE_DIR = os.environ.get("AGGREGATOR_STATE_DIR", os.path.join(tempfile.gettempdir(), "fedgrid_aggregator"))
+AGGREGATOR_STATE_PATH = os.path.join(AGGREGATOR_STATE_DIR,
+                                     f"aggregator-{os.environ.get('WEBSITE_INSTANCE_ID', 'local')}.npz")
+
+
+def create_backend():
+    if FEDGRID_BACKEND == "local":
+        from local_backend import LocalBackend
+        return LocalBackend()
+    return AzureBackend(LEDGER_ENDPOINT, IDENTITY_CLIENT_ID)
+
+
+# Cached for the lifetime of the worker process: credentials, blob service
+# clients and the ledger client are reused across invocations.
+backend = create_backend()
+blob_cache = (BlobCache(os.environ.get("BLOB_CACHE_DIR", BLOB_CACHE_DIR), max_bytes=BLOB_CACHE_MAX_BYTES)
+              if BLOB_CACHE_MAX_BYTES > 0 else None)
+global_model_store = GlobalModelStore(backend, GLOBAL_MODEL_CONTAINER_URL) if GLOBAL_MODEL_CONTAINER_URL else None
+
+
+# Recent global models by hash, used as bases when decoding delta uploads
+global_models = OrderedDict()
+
+
+def remember_global_model(weights):
+    global_models[weights_sha256(weights)] = weights
+    while len(global_models) > GLOBAL_MODEL_HISTORY:
+        global_models.popitem(last=False)
+
+
+def load_latest_global_model():
+    """
+    Seeds the delta bases with the last published global model after a cold
+    start. Returns False if it could not be loaded (e.g. before the first round).
+    """
+    if not GLOBAL_MODEL_CONTAINER_URL:
+        return True
+    blob_url = global_model_store.blob_url(LATEST_BLOB)
+    try:
+        if blob_cache is not None:
+            weights = load_npz(blob_cache.fetch(backend, blob_url).path)
+            remember_global_model({key: weights[key] for key in LAYER_KEYS})
+        else:
+            remember_global_model(weights_from_npz_bytes(backend.download_blob(blob_url)))
+        return True
+    except Exception as e:
+        logging.warning(f"No global model loaded for delta decoding: {e}")
+        return False
+
+
+_global_model_lock = threading.Lock()
+_global_model_state = {'loaded': False, 'last_attempt': None}
+
+
+def ensure_global_model_loaded():
+    """
+    Loads the latest global model on the first invocation rather than at
+    import, so a cold start does not block on a blob download before the
+    host can serve triggers. A failed load is retried at most once every
+    GLOBAL_MODEL_RETRY_SECONDS; a round closed by this worker also counts.
+    """
+    with _global_model_lock:
+        state = _global_model_state
+        if state['loaded'] or global_models:
+            state['loaded'] = True
+            return
+        now = time.monotonic()
+        if state['last_attempt'] is not None and now - state['last_attempt'] < GLOBAL_MODEL_RETRY_SECONDS:
+            return
+        state['last_attempt'] = now
+        state['loaded'] = load_latest_global_model()
+
+
+def upload_global_model(weights, summary):
+    """
+    Writes the aggregated model for a closed round back to Blob Storage. The
+    round number is taken from the container (see GlobalModelStore), since
+    every worker's aggregator counts its own rounds from zero.
+    """
+    logging.info(f"Round closed with {summary['num_clients']} clients.")
+    remember_global_model(weights)
+    if global_model_store is None:
+        logging.error("GLOBAL_MODEL_CONTAINER_URL is not set; global model was not uploaded.")
+        return
+    round_id = global_model_store.publish(weights, summary)
+    logging.info(f"Uploaded global model for round {round_id}.")
+
+
+# Lives for the lifetime of the worker process, so partial sums survive between invocations;
+# the checkpoint carries the open round over a worker restart on the same instance
+aggregator = FedAvgAggregator(min_clients=ROUND_MIN_CLIENTS, round_seconds=ROUND_SECONDS,
+                              on_round_closed=upload_global_model)
+try:
+    if aggregator.restore_state(AGGREGATOR_STATE_PATH):
+        logging.info(f"Resumed open round with {aggregator.num_clients} clients from {AGGREGATOR_STATE_PATH}.")
+except Exception as e:
+    logging.error(f"Could not resume open round from {AGGREGATOR_STATE_PATH}: {e}", exc_info=True)
+
+
+def checkpoint_round():
+    """Saves the open round; updates since the last checkpoint are lost if the worker dies."""
+    try:
+        aggregator.save_state(AGGREGATOR_STATE_PATH)
+    except Exception as e:
+        logging.error(f"Failed to checkpoint the open round: {e}", exc_info=True)
+
+
+anchor = None
+if LEDGER_ANCHOR_MODE == "merkle":
+    anchor = LedgerAnchor(backend, batch_size=ANCHOR_BATCH_SIZE, flush_seconds=ANCHOR_FLUSH_SECONDS,
+                          index_path=os.environ.get("ANCHOR_INDEX_PATH", ANCHOR_INDEX_PATH))
 
 @app.iot_hub_trigger(
-    arg_name="event",
+    arg_name="events",
     event_hub_name="messages/events", # This is the default for IoT Hub
     connection="IoTHubConnectionString",
-    cardinality=func.Cardinality.ONE,
+    cardinality=func.Cardinality.MANY,
     consumer_group="$Default")
-def ReceiveAndStoreWeights(event: func.EventHubEvent):
+def ReceiveAndStoreWeights(events: List[func.EventHubEvent]):
     """
-    This function is triggered by a notification from IoT Hub.
-    It reads a blob URL from the message, downloads the weights file,
-    and records the notification to the Azure Confidential Ledger.
+    This function is triggered by a batch of notifications from IoT Hub.
+    For each message it reads the blob URL, downloads the weights file
+    (concurrently across the batch), folds it into the current FedAvg
+    round, and records the notification to the Azure Confidential Ledger.
     """
-    logging.info("Python IoT Hub trigger function processed a notification message.")
-    
-    try:
-        # 1. Parse the incoming notification message to get the blob URL
-        notification_body = event.get_body().decode('utf-8')
-        notification_json = json.loads(notification_body)
-        blob_url = notification_json.get("blob_url")
-        
-        if not blob_url:
-            logging.error("FATAL: No 'blob_url' found in the notification message.")
-            return
+    logging.info(f"Python IoT Hub trigger function received {len(events)} notification messages.")
 
-        logging.info(f"Received notification for blob at: {blob_url}")
-
-        # 2. Download the content of the weights file from Blob Storage
-        # This requires the function's identity to have the 'Storage Blob Data Reader' role.
-        credential = ManagedIdentityCredential(client_id=IDENTITY_CLIENT_ID)
-        blob_client = BlobClient.from_blob_url(blob_url, credential=credential)
-        
-        logging.info("Downloading weights file from Blob Storage...")
-        weights_data = blob_client.download_blob().readall()
-        # For now, we just confirm the download. In the future, you could parse this data.
-        logging.info(f"Successfully downloaded {len(weights_data)} bytes from blob.")
-        
-        # 3. Authenticate with the Confidential Ledger
-        if not LEDGER_ENDPOINT or not IDENTITY_CLIENT_ID:
-            logging.error("FATAL: LEDGER_ENDPOINT or IDENTITY_CLIENT_ID is not set in App Settings.")
-            return
-            
-        cert_client = ConfidentialLedgerCertificateClient(credential)
-        ledger_cert = cert_client.get_ledger_identity(ledger_id=LEDGER_ENDPOINT.split('.')[0])
-        ledger_client = ConfidentialLedgerClient(endpoint=LEDGER_ENDPOINT, credential=credential, ledger_certificate=ledger_cert)
-        
-        # 4. Write the original notification message to the ledger as proof
-        logging.info("Appending notification to Confidential Ledger...")
-        append_result = ledger_client.append_entry(entry=notification_body)
-        
-        transaction_id = append_result['transaction_id']
-        logging.info(f"Successfully appended entry to ledger with transaction ID: {transaction_id}")
+    if FEDGRID_BACKEND != "local" and (not LEDGER_ENDPOINT or not IDENTITY_CLIENT_ID):
+        logging.error("FATAL: LEDGER_ENDPOINT or IDENTITY_CLIENT_ID is not set in App Settings.")
+        return
 
+    try:
+        ensure_global_model_loaded()
+        bodies = [event.get_body().decode('utf-8') for event in events]
+        results = process_batch(bodies, backend, aggregator, anchor=anchor, bases=global_models,
+                                blob_cache=blob_cache)
+        checkpoint_round()
+        succeeded = sum(r is not None for r in results)
+        logging.info(f"Recorded {succeeded}/{len(bodies)} notifications "
+                     f"({aggregator.num_clients} clients in the current round).")
     except Exception as e:
         logging.error(f"An unexpected error occurred: {e}", exc_info=True)
+
+
+@app.timer_trigger(schedule="0 * * * * *", arg_name="timer", run_on_startup=False)
+def CloseAggregationRound(timer: func.TimerRequest):
+    """Closes the current FedAvg round once its deadline has passed."""
+    try:
+        aggregator.close_if_expired()
+        checkpoint_round()
+    except Exception as e:
+        logging.error(f"Failed to close aggregation round: {e}", exc_info=True)
+
+
+@app.timer_trigger(schedule="*/15 * * * * *", arg_name="timer", run_on_startup=False)
+def FlushLedgerAnchor(timer: func.TimerRequest):
+    """Anchors a partial Merkle batch once it has waited ANCHOR_FLUSH_SECONDS."""
+    if anchor is None:
+        return
+    try:
+        anchor.flush_if_due()
+    except Exception as e:
+        logging.error(f"Failed to anchor notification batch: {e}", exc_info=True)
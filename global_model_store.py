@@ -0,0 +1,80 @@
+import logging
+import re
+from fedavg import weights_to_npz_bytes
+
+# --- CONFIGURATION ---
+ROUND_BLOB_PREFIX = "global_model_round_"
+ROUND_BLOB_PATTERN = re.compile(r"global_model_round_(\d+)\.npz$")
+LATEST_BLOB = "global_model_latest.npz"
+MAX_PUBLISH_ATTEMPTS = 10  # Round numbers to try before giving up on a busy container
+
+
+class GlobalModelStore:
+    """
+    Publishes closed rounds to a container shared by every worker. Round
+    numbers come from the container, not from the worker's aggregator: each
+    round takes the next free global_model_round_NNNNN.npz with a
+    create-if-absent upload, so concurrent or restarted workers never
+    overwrite each other's history. global_model_latest.npz is only
+    replaced (conditionally on its etag) when no newer round exists, so it
+    never moves backwards.
+
+    The backend's upload_blob(url, data, overwrite, etag) must raise
+    FileExistsError when its write condition fails.
+    """
+
+    def __init__(self, backend, container_url, max_attempts=MAX_PUBLISH_ATTEMPTS):
+        self.backend = backend
+        self.container_url = container_url.rstrip('/')
+        self.max_attempts = max_attempts
+
+    def blob_url(self, blob_name):
+        return f"{self.container_url}/{blob_name}"
+
+    def latest_round(self):
+        """Highest published round number, or 0 before the first round."""
+        matches = (ROUND_BLOB_PATTERN.match(name)
+                   for name in self.backend.list_blobs(self.container_url, ROUND_BLOB_PREFIX))
+        return max((int(m.group(1)) for m in matches if m), default=0)
+
+    def publish(self, weights, summary):
+        """
+        Uploads a closed round and returns its storage round number. The
+        number is kept in summary['storage_round_id'], so retrying a publish
+        that failed after the history upload reuses it instead of writing the
+        same round twice.
+        """
+        data = weights_to_npz_bytes(weights)
+        round_id = summary.get('storage_round_id')
+        if round_id is None:
+            for _ in range(self.max_attempts):
+                candidate = self.latest_round() + 1
+                try:
+                    self.backend.upload_blob(self.blob_url(f"{ROUND_BLOB_PREFIX}{candidate:05d}.npz"), data,
+                                             overwrite=False)
+                except FileExistsError:
+                    continue  # Another worker took this number
+                round_id = summary['storage_round_id'] = candidate
+                break
+            else:
+                raise RuntimeError(f"No free round number after {self.max_attempts} attempts")
+        self._update_latest(data, round_id)
+        return round_id
+
+    def _update_latest(self, data, round_id):
+        latest_url = self.blob_url(LATEST_BLOB)
+        for _ in range(self.max_attempts):
+            etag = None
+            if self.backend.list_blobs(self.container_url, LATEST_BLOB):
+                etag = self.backend.blob_etag(latest_url)
+            newest = self.latest_round()
+            if newest > round_id:
+                logging.info(f"Round {newest} is already published; {LATEST_BLOB} left as is.")
+                return
+            try:
+                # Replace only the version read above, or create it if there was none
+                self.backend.upload_blob(latest_url, data, overwrite=etag is not None, etag=etag)
+                return
+            except FileExistsError:
+                continue  # Replaced concurrently; re-check whether this round is still the newest
+        raise RuntimeError(f"{LATEST_BLOB} kept changing; gave up after {self.max_attempts} attempts")
@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+
+# --- CONFIGURATION ---
+LOCAL_BLOB_ROOT = os.path.join(tempfile.gettempdir(), "fedgrid_local_blobs")
+LOCAL_BLOB_PREFIX = "local://"
+DOWNLOAD_CHUNK_BYTES = 1 << 20
+
+
+class LocalBlobStore:
+    """
+    Directory-backed stand-in for Blob Storage. Blob URLs look like
+    local://<container>/<blob>. An optional per-request latency simulates
+    network round trips, and failure_rate makes that fraction of staged
+    block requests fail like a dropped connection. Also implements the
+    block_uploader target interface: staged blocks live under
+    .blocks/<container>/<blob>/<upload id>/, so concurrent uploads of
+    identical content never share (or delete) each other's blocks.
+    """
+
+    def __init__(self, root=LOCAL_BLOB_ROOT, latency_seconds=0.0, failure_rate=0.0):
+        self.root = root
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self._write_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, blob_url):
+        if not blob_url.startswith(LOCAL_BLOB_PREFIX):
+            raise ValueError(f"Not a local blob URL: {blob_url}")
+        return os.path.join(self.root, *blob_url[len(LOCAL_BLOB_PREFIX):].split('/'))
+
+    def url(self, container, blob_name):
+        return f"{LOCAL_BLOB_PREFIX}{container}/{blob_name}"
+
+    def write(self, blob_url, data, overwrite=True, etag=None):
+        """
+        With overwrite=False the write fails if the blob exists; with etag it
+        fails unless the blob still has that etag. Either failure raises
+        FileExistsError, like a 409/412 from Blob Storage.
+        """
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        path = self._path(blob_url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        try:
+            if not overwrite:
+                os.link(tmp_path, path)  # Atomic create-if-absent
+            elif etag is not None:
+                with self._write_lock:
+                    try:
+                        current = self._etag(path)
+                    except FileNotFoundError:
+                        current = None
+                    if current != etag:
+                        raise FileExistsError(f"{blob_url} changed (etag {current}, expected {etag})")
+                    os.replace(tmp_path, path)
+            else:
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return blob_url
+
+    def list(self, container_url, prefix=''):
+        """Names of the blobs in a local://<container> URL that start with prefix."""
+        directory = self._path(container_url.rstrip('/'))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(name for name in os.listdir(directory)
+                      if name.startswith(prefix) and not name.endswith('.tmp'))
+
+    def upload(self, container, blob_name, data):
+        return self.write(self.url(container, blob_name), data)
+
+    def download(self, blob_url):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with open(self._path(blob_url), 'rb') as f:
+            return f.read()
+
+    def etag(self, blob_url):
+        """Changes whenever the blob is rewritten, like Blob Storage's ETag."""
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return self._etag(self._path(blob_url))
+
+    @staticmethod
+    def _etag(path):
+        stat = os.stat(path)
+        return f'"0x{stat.st_mtime_ns:X}{stat.st_size:X}"'
+
+    def download_to(self, blob_url, stream, etag=None, chunk_bytes=DOWNLOAD_CHUNK_BYTES):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with open(self._path(blob_url), 'rb') as f:
+            stat = os.fstat(f.fileno())
+            current = f'"0x{stat.st_mtime_ns:X}{stat.st_size:X}"'
+            if etag is not None and etag != current:
+                raise ValueError(f"{blob_url} changed (etag {current}, expected {etag})")
+            for block in iter(lambda: f.read(chunk_bytes), b''):
+                stream.write(block)
+        return current
+
+    # === Block staging (block_uploader target interface) ===
+
+    def _block_dir(self, container, blob_name, upload_id=None):
+        return os.path.join(self.root, '.blocks', container, blob_name, upload_id or 'default')
+
+    def ensure_container(self, container):
+        os.makedirs(os.path.join(self.root, container), exist_ok=True)
+
+    def staged_blocks(self, container, blob_name, upload_id=None):
+        block_dir = self._block_dir(container, blob_name, upload_id)
+        if not os.path.isdir(block_dir):
+            return {}
+        return {name: os.path.getsize(os.path.join(block_dir, name))
+                for name in os.listdir(block_dir) if not name.endswith('.tmp')}
+
+    def stage_block(self, container, blob_name, block_id, data, upload_id=None):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ConnectionError(f"Simulated dropped connection staging block {block_id}")
+        block_dir = self._block_dir(container, blob_name, upload_id)
+        os.makedirs(block_dir, exist_ok=True)
+        tmp_path = os.path.join(block_dir, f"{block_id}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(block_dir, block_id))
+
+    def commit_blocks(self, container, blob_name, block_ids, upload_id=None):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        block_dir = self._block_dir(container, blob_name, upload_id)
+        url = self.url(container, blob_name)
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as out:
+            for block_id in block_ids:
+                with open(os.path.join(block_dir, block_id), 'rb') as f:
+                    shutil.copyfileobj(f, out)
+        os.replace(tmp_path, path)
+        shutil.rmtree(block_dir, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(block_dir))  # Only once no other upload of this blob is staging
+        except OSError:
+            pass
+        return url
+
+
+class LocalLedger:
+    """In-process stand-in for ConfidentialLedgerClient.append_entry."""
+
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+        self.entries = []
+        self._lock = threading.Lock()
+
+    def append_entry(self, entry):
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            self.entries.append(entry)
+            return {'transaction_id': f"2.{len(self.entries)}"}
+
+
+class LocalBackend:
+    """Same interface as azure_clients.AzureBackend, backed by the local stand-ins."""
+
+    def __init__(self, blob_store=None, ledger=None):
+        self.blob_store = blob_store or LocalBlobStore()
+        self.ledger = ledger or LocalLedger()
+
+    def download_blob(self, blob_url):
+        return self.blob_store.download(blob_url)
+
+    def blob_etag(self, blob_url):
+        return self.blob_store.etag(blob_url)
+
+    def download_blob_to(self, blob_url, stream, etag=None):
+        return self.blob_store.download_to(blob_url, stream, etag)
+
+    def upload_blob(self, blob_url, data, overwrite=True, etag=None):
+        self.blob_store.write(blob_url, data, overwrite=overwrite, etag=etag)
+
+    def list_blobs(self, container_url, prefix=''):
+        return self.blob_store.list(container_url, prefix)
+
+    def append_ledger_entry(self, entry):
+        return self.ledger.append_entry(entry=entry)['transaction_id']
+
+
+def run_load_test(num_clients, batch_size, input_dim, latency, workers, merkle_batch=0, use_blob_cache=False,
+                  redeliver=0.0):
+    """
+    Uploads synthetic student weights and pushes their notifications through
+    process_batch. redeliver is the fraction of notifications sent a second
+    time, like IoT Hub retries.
+    """
+    from fedavg import FedAvgAggregator, weights_to_npz_bytes
+    from notification_processor import process_batch
+    from merkle_anchor import LedgerAnchor
+    from blob_cache import BlobCache
+
+    rng = np.random.default_rng(0)
+    shapes = {'W1': (input_dim, 32), 'b1': (32,), 'W2': (32, 16), 'b2': (16,),
+              'W3': (16, 8), 'b3': (8,), 'W4': (8, 1), 'b4': (1,)}
+    store = LocalBlobStore(latency_seconds=latency)
+    backend = LocalBackend(store, LocalLedger(latency_seconds=latency))
+    aggregator = FedAvgAggregator(min_clients=num_clients)
+    anchor = None
+    if merkle_batch:
+        index_path = os.path.join(tempfile.mkdtemp(), "anchor_index.sqlite")
+        anchor = LedgerAnchor(backend, batch_size=merkle_batch, index_path=index_path)
+    blob_cache = BlobCache(os.path.join(tempfile.mkdtemp(), "blob_cache")) if use_blob_cache else None
+
+    bodies = []
+    for i in range(num_clients):
+        weights = {key: rng.normal(size=shape).astype(np.float32) for key, shape in shapes.items()}
+        url = store.upload("model-weights", f"load-test-{i:05d}.npz", weights_to_npz_bytes(weights))
+        bodies.append(json.dumps({"blob_url": url, "device_id": f"prosumer-{i:05d}"}))
+    bodies += bodies[:int(num_clients * redeliver)]
+
+    start = time.perf_counter()
+    processed = 0
+    for i in range(0, len(bodies), batch_size):
+        results = process_batch(bodies[i:i + batch_size], backend, aggregator, max_workers=workers, anchor=anchor,
+                                blob_cache=blob_cache)
+        processed += sum(r is not None for r in results)
+    if anchor is not None:
+        anchor.flush()
+    elapsed = time.perf_counter() - start
+
+    print(f"Processed {processed}/{len(bodies)} notifications in {elapsed:.2f}s "
+          f"({processed / elapsed:.1f}/s), rounds closed: {aggregator.round_id}, "
+          f"ledger entries: {len(backend.ledger.entries)}")
+    if blob_cache is not None:
+        print(f"Blob cache: {blob_cache.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test of the weight notification path.")
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--input-dim", type=int, default=72 * 19)
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated seconds per blob/ledger request")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--merkle-batch", type=int, default=0, help="Anchor notifications in Merkle batches of this size")
+    parser.add_argument("--blob-cache", action="store_true", help="Stream downloads through a BlobCache and dedup redeliveries")
+    parser.add_argument("--redeliver", type=float, default=0.0, help="Fraction of notifications delivered twice")
+    args = parser.parse_args()
+    run_load_test(args.clients, args.batch_size, args.input_dim, args.latency, args.workers, args.merkle_batch,
+                  args.blob_cache, args.redeliver)
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# --- CONFIGURATION ---
+ANCHOR_BATCH_SIZE = 256        # Notifications per anchored Merkle root
+ANCHOR_FLUSH_SECONDS = 60      # Anchor a partial batch after this long
+# The temp dir is wiped when a Functions worker is recycled, taking proofs and queued leaves
+# with it: set ANCHOR_INDEX_PATH to persistent storage (e.g. under /home on App Service) in production
+ANCHOR_INDEX_PATH = os.path.join(tempfile.gettempdir(), "fedgrid_anchor_index.sqlite")
+
+LEAF_PREFIX = b'\x00'  # Domain separation so a leaf can never pose as an inner node
+NODE_PREFIX = b'\x01'
+
+
+def leaf_hash(data):
+    return hashlib.sha256(LEAF_PREFIX + data).digest()
+
+
+def node_hash(left, right):
+    return hashlib.sha256(NODE_PREFIX + left + right).digest()
+
+
+def leaf_bytes(notification_body, blob_sha256):
+    """Canonical leaf content: the notification plus the hash of the weights it points to."""
+    return json.dumps({"notification": notification_body, "blob_sha256": blob_sha256},
+                      sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def merkle_tree(leaves):
+    """
+    Returns (root, proofs) for a list of leaf hashes. proofs[i] is a list of
+    (sibling_hash, sibling_is_left) pairs from leaf i up to the root. An odd
+    node at the end of a level is promoted unchanged rather than duplicated.
+    """
+    if not leaves:
+        raise ValueError("Cannot build a Merkle tree with no leaves")
+    proofs = [[] for _ in leaves]
+    positions = list(range(len(leaves)))  # index of each leaf's ancestor in the current level
+    level = list(leaves)
+    while len(level) > 1:
+        next_level = []
+        for i in range(0, len(level) - 1, 2):
+            next_level.append(node_hash(level[i], level[i + 1]))
+        if len(level) % 2:
+            next_level.append(level[-1])
+
+        for leaf, pos in enumerate(positions):
+            sibling = pos ^ 1
+            if sibling < len(level):
+                proofs[leaf].append((level[sibling], sibling < pos))
+            positions[leaf] = pos // 2
+        level = next_level
+    return level[0], proofs
+
+
+def verify_proof(leaf, proof, root):
+    """Checks that leaf hash `leaf` is included under `root`."""
+    node = leaf
+    for sibling, sibling_is_left in proof:
+        node = node_hash(sibling, node) if sibling_is_left else node_hash(node, sibling)
+    return node == root
+
+
+class LedgerAnchor:
+    """
+    Collects notifications and weight-blob hashes, and anchors each batch
+    to the ledger as a single entry holding the Merkle root and batch
+    metadata. Every entry's inclusion proof is kept in a local SQLite index,
+    so a single upload can be verified against its anchored root.
+
+    `ledger` is any object with append_ledger_entry(entry) -> transaction id
+    (azure_clients.AzureBackend, or local_backend.LocalBackend in tests).
+
+    Queued leaves are written to the index too, so a batch that was not
+    anchored before a worker crash is picked up again by the next
+    LedgerAnchor opened on the same index_path. A crash between the ledger
+    append and the index commit anchors that batch a second time; nothing
+    is lost. Point index_path at persistent storage in production.
+    """
+
+    def __init__(self, ledger, batch_size=ANCHOR_BATCH_SIZE, flush_seconds=ANCHOR_FLUSH_SECONDS,
+                 index_path=ANCHOR_INDEX_PATH, clock=time.time):
+        self.ledger = ledger
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # entry id -> (notification body, blob sha256)
+        self._oldest = None
+        self._db = sqlite3.connect(index_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS batches (
+                batch_root TEXT PRIMARY KEY, transaction_id TEXT, entry_count INTEGER, anchored_at REAL)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                entry_id TEXT PRIMARY KEY, blob_sha256 TEXT, notification TEXT,
+                batch_root TEXT, leaf_index INTEGER, proof TEXT)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_blob ON entries (blob_sha256)")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS pending (
+                entry_id TEXT PRIMARY KEY, blob_sha256 TEXT, notification TEXT, queued_at REAL)""")
+        for entry_id, blob_sha256, notification, queued_at in self._db.execute(
+                "SELECT entry_id, blob_sha256, notification, queued_at FROM pending ORDER BY queued_at"):
+            self._pending[entry_id] = (notification, blob_sha256)
+            self._oldest = queued_at if self._oldest is None else self._oldest
+        if self._pending:
+            logging.info(f"Recovered {len(self._pending)} unanchored notifications from {index_path}")
+
+    def add(self, notification_body, blob_sha256):
+        """
+        Queues one notification for anchoring and returns its entry id (the
+        hex leaf hash). Flushes when the batch is full or overdue. A failed
+        flush is logged, not raised: the notification stays queued (and
+        persisted) and is anchored by a later flush.
+        """
+        entry_id = leaf_hash(leaf_bytes(notification_body, blob_sha256)).hex()
+        with self._lock:
+            if entry_id not in self._pending:
+                now = self.clock()
+                with self._db:
+                    self._db.execute("INSERT OR IGNORE INTO pending VALUES (?, ?, ?, ?)",
+                                     (entry_id, blob_sha256, notification_body, now))
+                self._pending[entry_id] = (notification_body, blob_sha256)
+                if self._oldest is None:
+                    self._oldest = now
+            due = len(self._pending) >= self.batch_size or self._overdue()
+        if due:
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Failed to anchor notification batch, will retry: {e}", exc_info=True)
+        return entry_id
+
+    def _overdue(self):
+        return self._oldest is not None and self.clock() - self._oldest >= self.flush_seconds
+
+    def flush_if_due(self):
+        with self._lock:
+            due = self._overdue()
+        return self.flush() if due else None
+
+    def flush(self):
+        """Anchors everything pending. Returns the ledger transaction id, or None if nothing was pending."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return None
+                batch = self._pending
+                self._pending = {}
+                self._oldest = None
+
+            entry_ids = list(batch)
+            root, proofs = merkle_tree([bytes.fromhex(e) for e in entry_ids])
+            anchored_at = self.clock()
+            entry = json.dumps({
+                "type": "fedgrid_merkle_batch",
+                "merkle_root": root.hex(),
+                "entry_count": len(entry_ids),
+                "anchored_at": anchored_at,
+            }, sort_keys=True)
+
+            try:
+                transaction_id = self.ledger.append_ledger_entry(entry)
+            except Exception:
+                # Put the batch back so the next flush retries it
+                with self._lock:
+                    batch.update(self._pending)
+                    self._pending = batch
+                    self._oldest = anchored_at if self._oldest is None else self._oldest
+                raise
+
+            with self._lock, self._db:
+                self._db.execute("INSERT OR REPLACE INTO batches VALUES (?, ?, ?, ?)",
+                                 (root.hex(), transaction_id, len(entry_ids), anchored_at))
+                self._db.executemany("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?, ?, ?)", [
+                    (entry_id, batch[entry_id][1], batch[entry_id][0], root.hex(), i,
+                     json.dumps([[sibling.hex(), is_left] for sibling, is_left in proofs[i]]))
+                    for i, entry_id in enumerate(entry_ids)])
+                self._db.executemany("DELETE FROM pending WHERE entry_id = ?", [(e,) for e in entry_ids])
+            logging.info(f"Anchored {len(entry_ids)} notifications under Merkle root {root.hex()} "
+                         f"(ledger transaction {transaction_id}).")
+            return transaction_id
+
+    def proof(self, entry_id):
+        """Returns the stored inclusion record for an entry, or None if it is not anchored yet."""
+        row = self._db.execute(
+            "SELECT e.notification, e.blob_sha256, e.batch_root, e.leaf_index, e.proof, b.transaction_id "
+            "FROM entries e JOIN batches b ON e.batch_root = b.batch_root WHERE e.entry_id = ?",
+            (entry_id,)).fetchone()
+        if row is None:
+            return None
+        notification, blob_sha256, root, leaf_index, proof, transaction_id = row
+        return {"entry_id": entry_id, "notification": notification, "blob_sha256": blob_sha256,
+                "merkle_root": root, "leaf_index": leaf_index, "proof": json.loads(proof),
+                "transaction_id": transaction_id}
+
+    def verify(self, notification_body, blob_sha256, anchored_root=None):
+        """
+        Recomputes the leaf for an upload and checks its stored proof.
+        Pass the root read back from the ledger as anchored_root to check
+        against the ledger rather than the local index.
+        """
+        entry_id = leaf_hash(leaf_bytes(notification_body, blob_sha256)).hex()
+        record = self.proof(entry_id)
+        if record is None:
+            return False
+        root = bytes.fromhex(anchored_root or record["merkle_root"])
+        proof = [(bytes.fromhex(sibling), is_left) for sibling, is_left in record["proof"]]
+        return verify_proof(bytes.fromhex(entry_id), proof, root)
@@ -0,0 +1,131 @@
+import os
+import sys
+import numpy as np
+from npz_utils import load_npz
+
+# --- CONFIGURATION ---
+WEIGHTS_PATH = "local_model_weights_mlp_2.npz"
+SCALERS_PATH = "local_model_scalers_mlp_2.npz"
+MAX_BATCH = 4096  # Rows per matmul block; sizes the preallocated buffers
+LAYERS = ('1', '2', '3', '4')
+PARITY_ATOL = 1e-5  # Max |Keras - NumPy| on scaled outputs; both run float32 matmuls
+
+
+class MLPStudent:
+    """
+    TensorFlow-free runtime for the distilled 32 -> 16 -> 8 -> 1 student.
+
+    Loads W1..W4/b1..b4 from the npz written by save_mlp_weights (optionally
+    memory-mapped) and runs the ReLU network as blocked float32 matmuls into
+    preallocated buffers, like Keras' Dense layers. If the scaler file from
+    Step 10 is given, predict() takes raw (n, window, features) windows,
+    applies the RobustScaler, and undoes the MinMaxScaler and log1p on the
+    output to return kW. Buffers are per instance: use one per thread.
+    """
+
+    def __init__(self, weights_path=WEIGHTS_PATH, scalers_path=None, mmap=False, max_batch=MAX_BATCH):
+        weights = load_npz(weights_path, mmap=mmap)
+        self.weights = [weights[f"W{i}"] for i in LAYERS]
+        self.biases = [weights[f"b{i}"] for i in LAYERS]
+        self.dtype = self.weights[0].dtype
+        self.n_inputs = self.weights[0].shape[0]
+        self.max_batch = max_batch
+        self._buffers = [np.empty((max_batch, W.shape[1]), dtype=self.dtype) for W in self.weights]
+
+        self.scalers = None
+        if scalers_path is not None:
+            self.scalers = load_npz(scalers_path)
+
+    def predict_scaled(self, X_flat):
+        """Raw network output for already scaled, flattened inputs (like model.predict)."""
+        X_flat = np.asarray(X_flat)
+        if X_flat.ndim != 2 or X_flat.shape[1] != self.n_inputs:
+            raise ValueError(f"Expected inputs of shape (n, {self.n_inputs}), got {X_flat.shape}")
+
+        out = np.empty(len(X_flat), dtype=self.dtype)
+        last = len(self.weights) - 1
+        for start in range(0, len(X_flat), self.max_batch):
+            block = X_flat[start:start + self.max_batch].astype(self.dtype, copy=False)
+            n = len(block)
+            h = block
+            for layer, (W, b, buf) in enumerate(zip(self.weights, self.biases, self._buffers)):
+                z = buf[:n]
+                np.matmul(h, W, out=z)
+                z += b
+                if layer != last:
+                    np.maximum(z, 0, out=z)
+                h = z
+            out[start:start + n] = h[:, 0]
+        return out
+
+    def scale_inputs(self, windows):
+        """Applies the saved RobustScaler to raw (n, window, features) windows and flattens them."""
+        windows = np.asarray(windows, dtype=np.float64)
+        scaled = (windows - self.scalers['x_center']) / self.scalers['x_scale']
+        return scaled.reshape(len(windows), -1)
+
+    def inverse_target(self, y_scaled):
+        """MinMaxScaler inverse followed by expm1, returning kW."""
+        y_log = (np.asarray(y_scaled, dtype=np.float64) - self.scalers['y_min']) / self.scalers['y_scale']
+        return np.expm1(y_log)
+
+    def predict(self, windows):
+        """24h-sum forecast in kW for raw (n, window, features) windows."""
+        if self.scalers is None:
+            raise ValueError("predict() needs the scaler file; pass scalers_path")
+        return self.inverse_target(self.predict_scaled(self.scale_inputs(windows)))
+
+
+def save_scalers(filename, scaler_X, scaler_y, window_size, feature_cols=None):
+    """
+    Writes the parameters MLPStudent needs to scale inputs and invert outputs,
+    plus the feature column order the online predictor rebuilds inputs in.
+    """
+    extra = {} if feature_cols is None else {'feature_cols': np.array(feature_cols, dtype=str)}
+    np.savez(filename,
+             x_center=scaler_X.center_, x_scale=scaler_X.scale_,
+             y_min=scaler_y.min_[0], y_scale=scaler_y.scale_[0],
+             window_size=window_size, **extra)
+    print(f"Scalers saved: {filename}")
+
+
+def check_parity(student, n_samples=1024, seed=0, atol=PARITY_ATOL):
+    """
+    Builds the Keras student with the same weights and compares predictions
+    on random inputs. Returns the max absolute difference, and raises
+    AssertionError if any prediction differs by more than atol.
+    """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, Dropout, Input
+
+    model = Sequential([
+        Input(shape=(student.n_inputs,)),
+        Dense(32, activation='relu'),
+        Dropout(0.3),
+        Dense(16, activation='relu'),
+        Dropout(0.3),
+        Dense(8, activation='relu'),
+        Dense(1, activation='linear')
+    ])
+    model.set_weights([np.asarray(a) for pair in zip(student.weights, student.biases) for a in pair])
+
+    X = np.random.default_rng(seed).normal(size=(n_samples, student.n_inputs)).astype(np.float32)
+    keras_pred = model.predict(X, verbose=0).flatten()
+    numpy_pred = student.predict_scaled(X)
+    np.testing.assert_allclose(numpy_pred, keras_pred, rtol=0, atol=atol,
+                               err_msg="NumPy student diverges from the Keras model")
+    return float(np.max(np.abs(keras_pred - numpy_pred)))
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else WEIGHTS_PATH
+    if not os.path.exists(path):
+        print(f"ERROR: '{path}' not found.")
+        sys.exit(1)
+    student = MLPStudent(path, mmap=True)
+    try:
+        max_diff = check_parity(student)
+    except AssertionError as e:
+        print(f"ERROR: parity check failed: {e}")
+        sys.exit(1)
+    print(f"Max |Keras - NumPy| over random inputs: {max_diff:.3e} (tolerance {PARITY_ATOL:.0e})")
@@ -0,0 +1,145 @@
+import os
+import numpy as np
+
+# TensorFlow is imported inside each function so that modules using these
+# builders (worker processes, NumPy-only tools) only pay for it when training.
+os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '0')
+
+# --- CONFIGURATION ---
+STUDENT_HIDDEN_UNITS = (32, 16, 8)  # Small MLP for blockchain compatibility
+STUDENT_DROPOUT = 0.3
+STUDENT_LEARNING_RATE = 1e-4
+TEACHER_LEARNING_RATE = 1e-3
+
+
+def build_teacher(window_size, n_features):
+    """LSTM-attention teacher (Step 6), compiled with the Huber loss."""
+    import tensorflow as tf
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.layers import Dense, LSTM, Dropout, Input, Attention, GlobalAveragePooling1D
+    from tensorflow.keras.optimizers import Adam
+
+    input_layer = Input(shape=(window_size, n_features))
+
+    # First LSTM layer with return_sequences=True for attention
+    lstm_out = LSTM(64, return_sequences=True)(input_layer)
+    lstm_out = Dropout(0.2)(lstm_out)
+
+    # Second LSTM layer
+    lstm_final = LSTM(32, return_sequences=True)(lstm_out)
+    lstm_final = Dropout(0.2)(lstm_final)
+
+    # Apply attention mechanism - use self-attention on the sequence
+    attention_out = Attention()([lstm_final, lstm_final])
+
+    # Global average pooling to reduce sequence dimension
+    pooled = GlobalAveragePooling1D()(attention_out)
+
+    # Dense layers
+    x = Dense(32, activation='relu')(pooled)
+    x = Dropout(0.2)(x)
+    output_layer = Dense(1, activation='linear')(x)
+
+    teacher_model = Model(inputs=input_layer, outputs=output_layer)
+    teacher_model.compile(
+        optimizer=Adam(TEACHER_LEARNING_RATE),
+        loss='huber',
+        metrics=['mae', tf.keras.metrics.MeanAbsolutePercentageError()]
+    )
+    return teacher_model
+
+
+def teacher_callbacks():
+    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+    return [
+        EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True),
+        ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6)
+    ]
+
+
+#  PEAK-WEIGHTED LOSS
+def peak_weighted_loss(y_true, y_pred):
+    import tensorflow as tf
+    diff = tf.abs(y_true - y_pred)
+    weights = 1.0 + tf.square(y_true) / (tf.reduce_max(tf.square(y_true)) + 1e-6)
+    return tf.reduce_mean(diff * weights)
+
+
+def smape_loss(y_true, y_pred):
+    import tensorflow as tf
+    epsilon = 0.1 # A small value to prevent division by zero
+    numerator = tf.abs(y_pred - y_true)
+    denominator = tf.keras.backend.maximum(tf.abs(y_true) + tf.abs(y_pred), epsilon)
+    return tf.reduce_mean(2.0 * numerator / denominator)
+
+
+STUDENT_LOSSES = {'smape': smape_loss, 'peak_weighted': peak_weighted_loss}
+
+
+def build_student(input_dim, hidden_units=STUDENT_HIDDEN_UNITS, dropout=STUDENT_DROPOUT,
+                  learning_rate=STUDENT_LEARNING_RATE, loss=smape_loss):
+    """
+    Distilled MLP student (Step 7): ReLU layers of hidden_units, dropout
+    after every hidden layer but the last, one linear output. The default
+    is the 32 -> 16 -> 8 -> 1 network.
+    """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, Dropout, Input
+    from tensorflow.keras.optimizers import Adam
+
+    layers = [Input(shape=(input_dim,))]
+    for i, units in enumerate(hidden_units):
+        layers.append(Dense(units, activation='relu'))
+        if dropout and i < len(hidden_units) - 1:
+            layers.append(Dropout(dropout))
+    layers.append(Dense(1, activation='linear'))
+
+    mlp_student = Sequential(layers)
+    mlp_student.compile(optimizer=Adam(learning_rate), loss=loss, metrics=['mae'])
+    return mlp_student
+
+
+def student_callbacks():
+    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+    return [
+        ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6),
+        EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
+    ]
+
+
+def mlp_weights(model):
+    """Dense kernels and biases of an MLP as {'W1': ..., 'b1': ..., ...}."""
+    weights = model.get_weights()
+    named = {}
+    for i in range(len(weights) // 2):
+        named[f"W{i + 1}"] = weights[2 * i]
+        named[f"b{i + 1}"] = weights[2 * i + 1]
+    return named
+
+
+def set_mlp_weights(model, weights):
+    """Loads {'W1': ..., 'b1': ..., ...} (e.g. an opened npz) into an MLP built by build_student."""
+    n_layers = len(model.get_weights()) // 2
+    model.set_weights([np.asarray(weights[f"{kind}{i + 1}"]) for i in range(n_layers) for kind in ('W', 'b')])
+
+
+def save_mlp_weights(model, filename):
+    np.savez(filename, **mlp_weights(model))
+    print(f"Saving MLP weights: {filename}")
+    print(f"MLP weights saved ({os.path.getsize(filename)} bytes)")
+
+
+# === Step 9 metrics ===
+
+def smape(a, f):
+    return 100 * np.mean(2 * np.abs(f - a) / (np.abs(a) + np.abs(f) + 1e-8))
+
+
+def forecast_metrics(y_true, y_pred):
+    """RMSE, MAE (kW) and sMAPE (%) of calibrated daily-total forecasts."""
+    error = np.asarray(y_pred, dtype=np.float64) - np.asarray(y_true, dtype=np.float64)
+    return {
+        'rmse': float(np.sqrt(np.mean(np.square(error)))),
+        'mae': float(np.mean(np.abs(error))),
+        'smape': float(smape(y_true, y_pred)),
+    }
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from weight_codec import decode_update
+from weight_validation import validate_update
+from profiling import profile_stage
+
+# --- CONFIGURATION ---
+DOWNLOAD_WORKERS = 16  # Concurrent blob downloads per batch
+
+
+def sample_weight_of(notification_json):
+    """The update's FedAvg weight: its 'num_samples' (default 1), or NaN if that is not a number."""
+    try:
+        return float(notification_json.get("num_samples", 1))
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def parse_notification(body):
+    """Returns the notification dict, or None if it has no 'blob_url'."""
+    notification_json = json.loads(body)
+    if not notification_json.get("blob_url"):
+        logging.error("No 'blob_url' found in the notification message.")
+        return None
+    return notification_json
+
+
+def process_notification(body, backend, aggregator, anchor=None, bases=None, blob_cache=None):
+    """
+    Downloads the weights for one notification, decodes them (plain npz or a
+    weight_codec delta/quantized upload against one of `bases`), folds them
+    into the FedAvg round if they pass weight_validation, and records the
+    notification with its validation report on the ledger. With an anchor
+    (merkle_anchor.LedgerAnchor) the notification and the weights' SHA-256
+    are queued for the next Merkle batch instead of appended one by one.
+    With a blob_cache (blob_cache.BlobCache) the blob is streamed to disk and
+    cached by URL and etag, and a notification for a blob version that was
+    already processed returns the earlier result without downloading it.
+    Returns the ledger transaction id (or anchor entry id), or None if the
+    notification was skipped.
+    """
+    notification_json = parse_notification(body)
+    if notification_json is None:
+        return None
+    blob_url = notification_json["blob_url"]
+
+    if blob_cache is None:
+        with profile_stage('notification.download') as stage:
+            weights_data = backend.download_blob(blob_url)
+            stage['bytes'] = len(weights_data)
+        logging.info(f"Downloaded {len(weights_data)} bytes from {blob_url}")
+        return record_update(notification_json, weights_data, None, backend, aggregator, anchor, bases)
+
+    etag = backend.blob_etag(blob_url)
+    with blob_cache.notification(blob_url, etag) as seen:
+        if seen['result'] is not None:
+            logging.info(f"Skipping duplicate notification for {blob_url} (etag {etag}): {seen['result']}")
+            return seen['result']
+        with profile_stage('notification.download') as stage:
+            blob = blob_cache.fetch(backend, blob_url, etag)
+            stage['bytes'] = blob.size
+        logging.info(f"{'Cached' if blob.hit else 'Downloaded'} {blob.size} bytes from {blob_url}")
+        seen['result'] = record_update(notification_json, blob.path, blob.sha256, backend, aggregator, anchor, bases)
+        return seen['result']
+
+
+def latest_base(bases):
+    """The most recently added global model in bases, or None."""
+    return next(reversed(bases.values()), None) if bases else None
+
+
+def ledger_entry(notification_json, validation):
+    """The notification with its validation report, as recorded on the ledger."""
+    return json.dumps(dict(notification_json, validation=validation), sort_keys=True)
+
+
+def record_update(notification_json, weights_data, blob_sha256, backend, aggregator, anchor, bases):
+    """
+    Decodes downloaded weights (bytes or a cached file path), validates them
+    and their num_samples weight against the latest global model, folds
+    valid ones into the round and records the notification with its
+    validation report. Rejected updates (including a NaN, infinite or
+    non-positive num_samples) are recorded too, but never aggregated.
+    blob_sha256 is computed from the bytes if not given.
+    """
+    blob_url = notification_json["blob_url"]
+    client_id = notification_json.get("device_id") or notification_json.get("deviceId") or blob_url
+    sample_weight = sample_weight_of(notification_json)
+    with profile_stage('notification.decode') as stage:
+        weights = stage['arrays'] = decode_update(weights_data, bases)
+    with profile_stage('notification.validate'):
+        validation = validate_update(weights, latest_base(bases), sample_weight=sample_weight)
+    if validation['valid']:
+        with profile_stage('notification.aggregate'):
+            aggregator.add(weights, sample_weight=sample_weight, client_id=client_id)
+    else:
+        logging.warning(f"Rejected update from {client_id} ({blob_url}): {'; '.join(validation['errors'])}")
+    entry = ledger_entry(notification_json, validation)
+
+    if anchor is not None:
+        entry_id = anchor.add(entry, blob_sha256 or hashlib.sha256(weights_data).hexdigest())
+        logging.info(f"Queued notification for {client_id} for ledger anchoring: {entry_id}")
+        return entry_id
+
+    with profile_stage('notification.ledger'):
+        transaction_id = backend.append_ledger_entry(entry)
+    logging.info(f"Appended notification for {client_id} to ledger: {transaction_id}")
+    return transaction_id
+
+
+def process_batch(bodies, backend, aggregator, max_workers=DOWNLOAD_WORKERS, anchor=None, bases=None,
+                  blob_cache=None):
+    """
+    Processes a batch of notification bodies concurrently. A failing
+    notification is logged and reported as None without affecting the rest.
+    Returns the per-notification results in input order.
+    """
+    def run(body):
+        try:
+            return process_notification(body, backend, aggregator, anchor, bases, blob_cache)
+        except Exception as e:
+            logging.error(f"Failed to process notification: {e}", exc_info=True)
+            return None
+
+    if len(bodies) <= 1:
+        return [run(body) for body in bodies]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(bodies))) as pool:
+        return list(pool.map(run, bodies))
@@ -0,0 +1,49 @@
+import zipfile
+import numpy as np
+
+# Size of the fixed part of a zip local file header
+ZIP_LOCAL_HEADER_BYTES = 30
+
+
+def _member_data_offset(f, zinfo):
+    """Offset of a member's data, read from its local header (extra field may differ from the central directory)."""
+    f.seek(zinfo.header_offset)
+    header = f.read(ZIP_LOCAL_HEADER_BYTES)
+    name_len = int.from_bytes(header[26:28], 'little')
+    extra_len = int.from_bytes(header[28:30], 'little')
+    return zinfo.header_offset + ZIP_LOCAL_HEADER_BYTES + name_len + extra_len
+
+
+def npz_memmap(path):
+    """
+    Memory-maps every array of an uncompressed .npz (as written by np.savez)
+    without reading the array data. np.load ignores mmap_mode for .npz files,
+    so the .npy headers are parsed here and each array is mapped in place.
+    Raises ValueError for compressed members; use np.load for those.
+    """
+    arrays = {}
+    with open(path, 'rb') as f, zipfile.ZipFile(f) as zf:
+        for zinfo in zf.infolist():
+            if not zinfo.filename.endswith('.npy'):
+                continue
+            if zinfo.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{zinfo.filename} is compressed and cannot be memory-mapped")
+            f.seek(_member_data_offset(f, zinfo))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(f"{zinfo.filename} holds Python objects and cannot be memory-mapped")
+            arrays[zinfo.filename[:-4]] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(),
+                                                    shape=shape, order='F' if fortran_order else 'C')
+    return arrays
+
+
+def load_npz(path, mmap=False):
+    """Returns a dict of arrays from an .npz, memory-mapped when mmap=True."""
+    if mmap:
+        return npz_memmap(path)
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}
@@ -0,0 +1,370 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from calibration import (CALIBRATION_WINDOW, MIN_HISTORY, LOCAL_CLIP, FALLBACK_CLIP, GLOBAL_CLIP,
+                         FALLBACK_THRESHOLD, FINAL_CLIP_FACTOR, EPSILON)
+from features import TARGET_COL, add_features, feature_columns
+from mlp_inference import MLPStudent, WEIGHTS_PATH, SCALERS_PATH
+from windowing import TARGET_OFFSET, TARGET_HORIZON
+
+# --- CONFIGURATION ---
+MAX_LAG = 48                   # Longest lag feature (lag_48)
+ROLLING_WINDOW = 24            # rolling_mean_24 / rolling_std_24
+RESOLVE_DELAY = TARGET_OFFSET + TARGET_HORIZON  # A forecast's 24h sum is complete this many readings later
+CALIBRATION_HISTORY = 30 * 24  # Resolved forecasts per meter behind the global boost (batch calibration uses all)
+BOOST_REFRESH = 24             # Recompute a meter's global boost every this many scored forecasts
+INITIAL_CAPACITY = 1024        # Meter slots allocated up front; doubled when full
+
+
+def engineered_columns():
+    """Names of the columns add_features derives, in the order it adds them."""
+    return [col for col in add_features(pd.DataFrame({TARGET_COL: []})).columns if col != TARGET_COL]
+
+
+def ring_median(values, filled):
+    """Row medians of ring buffers whose first `filled` slots hold data (NaN elsewhere); NaN if empty."""
+    out = np.full(len(values), np.nan)
+    full = filled >= values.shape[1]
+    if full.any():
+        out[full] = np.median(values[full], axis=1)
+    partial = ~full & (filled > 0)
+    if partial.any():
+        # np.sort puts the NaN slots last, so each row's data is its first k sorted values
+        ordered = np.sort(values[partial], axis=1)
+        k = filled[partial]
+        rows = np.arange(len(ordered))
+        out[partial] = (ordered[rows, (k - 1) // 2] + ordered[rows, k // 2]) / 2
+    return out
+
+
+def boost_factor(median_true, median_pred):
+    """MedianCalibrator._boost over arrays: the global factor, with the underprediction fallback."""
+    factor = median_true / (median_pred + EPSILON)
+    fallback = median_pred < FALLBACK_THRESHOLD * median_true
+    return np.where(fallback, np.clip(factor, *FALLBACK_CLIP), np.clip(factor, *GLOBAL_CLIP))
+
+
+class OnlinePredictor:
+    """
+    Streaming Steps 1, 3, 5 and 8 for many meters at once: each hourly
+    reading updates the meter's features and, once 120 readings (the
+    72-step window plus lag_48) have arrived, returns a calibrated 24h-sum
+    forecast from the exported student, in constant time per reading.
+
+    State is a set of preallocated arrays with one row per meter: ring
+    buffers of the last 49 totals (lags, rolling mean/std), the last 24
+    target readings (to score forecasts once their day has passed), the
+    RobustScaler-scaled 72 x features window, the forecasts awaiting their
+    actuals, and the rolling (51) and global (CALIBRATION_HISTORY) medians
+    of MedianCalibrator, refreshed whenever a forecast is scored. update()
+    processes a batch of meters with vectorized gathers and one MLP forward
+    pass.
+
+    Readings are rows of input_cols: the raw feature columns followed by
+    TARGET_COL. A missing (NaN) value repeats the meter's previous reading,
+    like the pipeline's forward fill. The pipeline back-fills leading gaps,
+    which a stream cannot do: readings before a meter's first one with
+    every column present are skipped (only advancing its position), so a
+    NaN never reaches the ring buffers or calibration state.
+
+    Meters must be registered with add_meter(meter_id, position) before
+    their first reading: hour and day features count readings from that
+    position, as add_features counts rows from the start of the file.
+    """
+
+    def __init__(self, weights_path=WEIGHTS_PATH, scalers_path=SCALERS_PATH, feature_cols=None,
+                 capacity=INITIAL_CAPACITY):
+        self.student = MLPStudent(weights_path, scalers_path)
+        scalers = self.student.scalers
+        self.window = int(scalers['window_size'])
+        if feature_cols is None:
+            if 'feature_cols' not in scalers:
+                raise ValueError(f"{scalers_path} has no feature_cols; re-export it or pass feature_cols")
+            feature_cols = [str(col) for col in scalers['feature_cols']]
+        self.feature_cols = list(feature_cols)
+        self.n_features = len(self.feature_cols)
+        if self.window * self.n_features != self.student.n_inputs:
+            raise ValueError(f"{self.window} x {self.n_features} features does not match the "
+                             f"student's {self.student.n_inputs} inputs")
+
+        engineered = engineered_columns()
+        missing = [col for col in engineered if col not in self.feature_cols]
+        if missing:
+            raise ValueError(f"feature_cols is missing engineered columns: {', '.join(missing)}")
+        self.raw_cols = [col for col in self.feature_cols if col not in engineered]
+        self.input_cols = self.raw_cols + [TARGET_COL]
+        self._raw_pos = np.array([self.feature_cols.index(col) for col in self.raw_cols], dtype=np.intp)
+        self._engineered_pos = {col: self.feature_cols.index(col) for col in engineered}
+        # Total_Electricity: the electricity sub-meters, or the facility meter itself if there are none
+        self._energy = [i for i, col in enumerate(self.raw_cols) if 'Electricity' in col and 'Facility' not in col]
+        self._target = len(self.raw_cols)
+        self._center = np.asarray(scalers['x_center'], dtype=np.float64)
+        self._scale = np.asarray(scalers['x_scale'], dtype=np.float64)
+
+        self.index = {}
+        self.meter_ids = []
+        self._state = {}
+        self._allocate(capacity)
+
+    # === Per-meter state ===
+
+    def _layout(self):
+        """name -> (per-meter shape, dtype, fill value) of every state array."""
+        return {
+            'count': ((), np.int64, 0),
+            'position': ((), np.int64, 0),
+            'last_input': ((len(self.input_cols),), np.float64, np.nan),
+            'totals': ((MAX_LAG + 1,), np.float64, np.nan),
+            'targets': ((TARGET_HORIZON,), np.float64, np.nan),
+            'scaled': ((self.window, self.n_features), np.float32, 0.0),
+            'pending': ((RESOLVE_DELAY,), np.float64, np.nan),
+            'recent_true': ((CALIBRATION_WINDOW + 1,), np.float64, np.nan),
+            'recent_pred': ((CALIBRATION_WINDOW + 1,), np.float64, np.nan),
+            'recent_n': ((), np.int64, 0),
+            'history_true': ((CALIBRATION_HISTORY,), np.float32, np.nan),
+            'history_calibrated': ((CALIBRATION_HISTORY,), np.float32, np.nan),
+            'history_n': ((), np.int64, 0),
+            'max_true': ((), np.float64, 0.0),
+            'local_factor': ((), np.float64, 1.0),
+            'boost': ((), np.float64, 1.0),
+        }
+
+    def _allocate(self, capacity):
+        for name, (shape, dtype, fill) in self._layout().items():
+            array = np.full((capacity,) + shape, fill, dtype=dtype)
+            old = self._state.get(name)
+            if old is not None:
+                array[:len(old)] = old
+            self._state[name] = array
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def add_meter(self, meter_id, position):
+        """
+        Registers a meter. position is the hour index of its first reading,
+        counted like the training file's rows (row 0 is midnight of day 0),
+        so HourOfDay, DayOfWeek and the peak flags line up with the clock.
+        """
+        if meter_id in self.index:
+            raise ValueError(f"Meter {meter_id!r} is already registered")
+        if len(self.meter_ids) == self.capacity:
+            self._allocate(self.capacity * 2)
+        row = len(self.meter_ids)
+        self.index[meter_id] = row
+        self.meter_ids.append(meter_id)
+        self.position[row] = position
+        return row
+
+    def rows(self, meter_ids):
+        """State rows for meter_ids, which must all be registered with add_meter."""
+        unknown = [m for m in meter_ids if m not in self.index]
+        if unknown:
+            raise ValueError(f"Unregistered meter(s) {', '.join(map(repr, unknown[:5]))}"
+                             f"{'...' if len(unknown) > 5 else ''}: call add_meter(meter_id, position) first")
+        rows = np.array([self.index[m] for m in meter_ids], dtype=np.intp)
+        if len(np.unique(rows)) != len(rows):
+            raise ValueError("A batch may hold at most one reading per meter")
+        return rows
+
+    def state_bytes(self):
+        return sum(array.nbytes for array in self._state.values())
+
+    # === Streaming update ===
+
+    def _features(self, rows, inputs, c):
+        """Step 1 for one reading per row: the add_features columns, from the ring buffers."""
+        n_totals = MAX_LAG + 1
+        total = inputs[:, self._energy].sum(axis=1) if self._energy else inputs[:, self._target]
+        self.totals[rows, c % n_totals] = total
+
+        def lag(k):
+            return np.where(c >= k, self.totals[rows, (c - k) % n_totals], np.nan)
+
+        # rolling_mean_24 over the previous 24 totals, rolling_std_24 (ddof=1) over the last 24 including this one
+        back = np.arange(ROLLING_WINDOW + 1)
+        ring = self.totals[rows[:, None], (c[:, None] - back) % n_totals]
+        seen = back <= c[:, None]
+        previous, previous_seen = ring[:, 1:], seen[:, 1:]
+        n_previous = previous_seen.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rolling_mean = np.where(previous_seen, previous, 0.0).sum(axis=1) / n_previous
+            current, current_seen = ring[:, :-1], seen[:, :-1]
+            n_current = current_seen.sum(axis=1)
+            current_mean = np.where(current_seen, current, 0.0).sum(axis=1) / n_current
+            squares = np.where(current_seen, (current - current_mean[:, None]) ** 2, 0.0).sum(axis=1)
+            rolling_std = np.where(n_current > 1, np.sqrt(squares / (n_current - 1)), 0.0)
+
+        hour = (self.position[rows] + c) % 24
+        day = ((self.position[rows] + c) // 24) % 7
+        lag_1, lag_24 = lag(1), lag(24)
+        return {
+            'Total_Electricity': total,
+            'HourOfDay': hour,
+            'DayOfWeek': day,
+            'is_weekend': (day >= 5).astype(np.float64),
+            'hour_sin': np.sin(2 * np.pi * hour / 24),
+            'hour_cos': np.cos(2 * np.pi * hour / 24),
+            'lag_1': lag_1,
+            'lag_24': lag_24,
+            'lag_48': lag(48),
+            'rolling_mean_24': rolling_mean,
+            'rolling_std_24': rolling_std,
+            'zscore_24': (total - rolling_mean) / (rolling_std + 1e-6),
+            'roc_1': total - lag_1,
+            'roc_24': total - lag_24,
+            'is_morning_peak': ((hour >= 7) & (hour <= 9)).astype(np.float64),
+            'is_evening_peak': ((hour >= 17) & (hour <= 19)).astype(np.float64),
+        }
+
+    def _resolve(self, rows, c):
+        """
+        Scores the forecasts made RESOLVE_DELAY readings ago against the 24h
+        sum that has now been observed, and feeds them to the calibration
+        state exactly like MedianCalibrator.update().
+        """
+        slot = c % RESOLVE_DELAY
+        predicted = self.pending[rows, slot]
+        done = ~np.isnan(predicted)
+        if not done.any():
+            return
+        rows, slot, predicted = rows[done], slot[done], predicted[done]
+        actual = self.targets[rows].sum(axis=1)
+        self.pending[rows, slot] = np.nan
+
+        n = self.recent_n[rows]
+        self.recent_true[rows, n % (CALIBRATION_WINDOW + 1)] = actual
+        self.recent_pred[rows, n % (CALIBRATION_WINDOW + 1)] = predicted
+        self.recent_n[rows] = n + 1
+        # Step 8.1: rolling median(true) / median(pred), once more than MIN_HISTORY forecasts are scored
+        n = n + 1
+        ready = n > MIN_HISTORY
+        if ready.any():
+            r = rows[ready]
+            ratio = ring_median(self.recent_true[r], n[ready]) / (ring_median(self.recent_pred[r], n[ready]) + EPSILON)
+            self.local_factor[r] = np.clip(ratio, *LOCAL_CLIP)
+        calibrated = predicted * self.local_factor[rows]
+
+        # Step 8.2: the global boost over the scored history. A month-long median barely
+        # moves per reading, so once the history is long it is refreshed every BOOST_REFRESH
+        n = self.history_n[rows]
+        self.history_true[rows, n % CALIBRATION_HISTORY] = actual
+        self.history_calibrated[rows, n % CALIBRATION_HISTORY] = calibrated
+        self.history_n[rows] = n + 1
+        self.max_true[rows] = np.maximum(self.max_true[rows], actual)
+        refresh = (n < BOOST_REFRESH) | ((n + 1) % BOOST_REFRESH == 0)
+        if refresh.any():
+            r, n = rows[refresh], n[refresh] + 1
+            self.boost[r] = boost_factor(ring_median(self.history_true[r], n),
+                                         ring_median(self.history_calibrated[r], n))
+
+    def calibrate(self, rows, predicted):
+        """
+        Steps 8.1-8.3 for new forecasts, with the factors from the forecasts
+        already scored for each meter (uncalibrated until the first is).
+        """
+        calibrated = predicted * self.local_factor[rows]
+        scored = self.history_n[rows] > 0
+        calibrated[scored] = np.clip(calibrated[scored] * self.boost[rows[scored]], 0,
+                                     self.max_true[rows[scored]] * FINAL_CLIP_FACTOR)
+        return np.maximum(calibrated, 0)
+
+    def update(self, meter_ids, readings):
+        """
+        Adds one reading per meter (rows of input_cols) and returns
+        (forecast, raw): the calibrated and uncalibrated 24h-sum forecasts
+        in kW for the 24 hours starting 25 hours after this reading, NaN for
+        meters still warming up.
+        """
+        all_rows = self.rows(meter_ids)
+        inputs = np.asarray(readings, dtype=np.float64).reshape(len(all_rows), len(self.input_cols))
+        inputs = np.where(np.isnan(inputs), self.last_input[all_rows], inputs)
+        self.last_input[all_rows] = inputs
+        forecast = np.full(len(all_rows), np.nan)
+        raw = np.full(len(all_rows), np.nan)
+
+        # Only a meter's leading readings can still have gaps after the forward fill
+        live = ~((self.count[all_rows] == 0) & np.isnan(inputs).any(axis=1))
+        self.position[all_rows[~live]] += 1
+        if not live.any():
+            return forecast, raw
+        forecast[live], raw[live] = self._update_rows(all_rows[live], inputs[live])
+        return forecast, raw
+
+    def _update_rows(self, rows, inputs):
+        """update() for rows whose inputs are complete."""
+        c = self.count[rows]
+
+        features = np.empty((len(rows), self.n_features))
+        features[:, self._raw_pos] = inputs[:, :self._target]
+        for col, values in self._features(rows, inputs, c).items():
+            features[:, self._engineered_pos[col]] = values
+        # Step 5: scale once on the way in, so windows are ready for the student as stored
+        self.scaled[rows, c % self.window] = (features - self._center) / self._scale
+        self.targets[rows, c % TARGET_HORIZON] = inputs[:, self._target]
+        self.count[rows] = c + 1
+
+        self._resolve(rows, c)
+
+        forecast = np.full(len(rows), np.nan)
+        raw = np.full(len(rows), np.nan)
+        ready = c + 1 >= self.window + MAX_LAG
+        if ready.any():
+            r, n = rows[ready], c[ready] + 1
+            order = (n[:, None] - self.window + np.arange(self.window)) % self.window
+            windows = self.scaled[r[:, None], order].reshape(len(r), -1)
+            raw[ready] = self.student.inverse_target(self.student.predict_scaled(windows))
+            self.pending[r, c[ready] % RESOLVE_DELAY] = raw[ready]
+            forecast[ready] = self.calibrate(r, raw[ready])
+        return forecast, raw
+
+    def scaled_window(self, meter_id):
+        """The meter's current scaled (window, features) input, oldest reading first."""
+        row = self.index[meter_id]
+        n = int(self.count[row])
+        return self.scaled[row, (n - self.window + np.arange(self.window)) % self.window]
+
+
+def replay_csv(predictor, csv_path, n_meters, seed=0):
+    """
+    Replays csv_path hour by hour for n_meters meters (each starting at a
+    random offset into the series) and reports throughput. Meter 0 starts at
+    row 0, so its final window is compared with the batch pipeline's.
+    """
+    df = pd.read_csv(csv_path, on_bad_lines='skip')
+    series = df[predictor.input_cols].to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    offsets = np.concatenate(([0], rng.integers(0, len(series), size=n_meters - 1)))
+    meter_ids = [f"meter-{i:05d}" for i in range(n_meters)]
+    for meter_id, offset in zip(meter_ids, offsets):
+        predictor.add_meter(meter_id, position=int(offset))
+
+    start = time.perf_counter()
+    forecasts = 0
+    for step in range(len(series)):
+        forecast, _ = predictor.update(meter_ids, series[(offsets + step) % len(series)])
+        forecasts += int(np.count_nonzero(~np.isnan(forecast)))
+    elapsed = time.perf_counter() - start
+    readings = len(series) * n_meters
+    print(f"Replayed {readings} readings ({n_meters} meters x {len(series)} hours) in {elapsed:.2f}s: "
+          f"{readings / elapsed:,.0f} readings/s, {forecasts} forecasts")
+    print(f"State: {predictor.state_bytes() / 2**20:.1f} MB ({predictor.state_bytes() / n_meters / 1024:.1f} KB/meter)")
+
+    # Parity with Steps 1 and 5 of the batch pipeline on meter 0's last window
+    featured = add_features(df.copy())
+    X_raw = featured[feature_columns(featured)].ffill().bfill()[predictor.feature_cols].to_numpy(dtype=np.float64)
+    expected = (X_raw[-predictor.window:] - predictor._center) / predictor._scale
+    max_diff = float(np.max(np.abs(predictor.scaled_window(meter_ids[0]) - expected)))
+    print(f"Feature parity with add_features (max abs diff, scaled): {max_diff:.3e}")
+    return max_diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a CSV through the streaming per-meter predictor.")
+    parser.add_argument("--csv", required=True)
+    parser.add_argument("--meters", type=int, default=1000)
+    parser.add_argument("--weights", default=WEIGHTS_PATH)
+    parser.add_argument("--scalers", default=SCALERS_PATH)
+    args = parser.parse_args()
+
+    replay_csv(OnlinePredictor(args.weights, args.scalers, capacity=args.meters), args.csv, args.meters)
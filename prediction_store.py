@@ -0,0 +1,103 @@
+import json
+import os
+import re
+from collections import deque
+from datetime import datetime
+
+# --- CONFIGURATION ---
+MANIFEST_NAME = "latest.json"
+HISTORY_DIR = "history"
+RECENT_RECORDS = 50                     # Records kept in the manifest's rolling window
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024    # Rotate the NDJSON segment beyond this size
+SEGMENT_PATTERN = re.compile(r"predictions-(\d{6})\.ndjson$")
+
+
+def atomic_write_json(path, payload):
+    """Writes JSON to a temporary file and renames it over path, so readers never see a partial file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+class PredictionStore:
+    """
+    Output of the simulator for the dashboard:
+
+    - latest.json: atomically replaced manifest with the newest prediction
+      id, the newest record and a rolling window of recent records, so the
+      dashboard needs a single request for the current state.
+    - history/predictions-NNNNNN.ndjson: compact append-only log of every
+      record, rotated once a segment passes segment_max_bytes.
+
+    manifest_every > 1 rewrites the manifest only every N records (and on
+    flush/close), which keeps bulk runs from being bound by manifest writes.
+    """
+
+    def __init__(self, output_dir, recent=RECENT_RECORDS, segment_max_bytes=SEGMENT_MAX_BYTES, manifest_every=1):
+        self.output_dir = output_dir
+        self.history_dir = os.path.join(output_dir, HISTORY_DIR)
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.segment_max_bytes = segment_max_bytes
+        self.manifest_every = manifest_every
+        os.makedirs(self.history_dir, exist_ok=True)
+
+        self.recent = deque(maxlen=recent)
+        self.count = 0
+        self._since_manifest = 0
+        self._load_manifest()
+
+        segments = sorted(int(m.group(1)) for m in map(SEGMENT_PATTERN.match, os.listdir(self.history_dir)) if m)
+        self._segment_seq = segments[-1] if segments else 1
+        self._segment = None
+        self._open_segment()
+
+    def _load_manifest(self):
+        """Resumes the rolling window and count from an existing manifest."""
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.recent.extend(manifest.get("recent", []))
+        self.count = manifest.get("count", len(self.recent))
+
+    def _segment_path(self, seq):
+        return os.path.join(self.history_dir, f"predictions-{seq:06d}.ndjson")
+
+    def _open_segment(self):
+        self._segment = open(self._segment_path(self._segment_seq), "a", encoding="utf-8")
+
+    def _rotate_if_needed(self):
+        if self._segment.tell() >= self.segment_max_bytes:
+            self._segment.close()
+            self._segment_seq += 1
+            self._open_segment()
+
+    def append(self, record):
+        self._segment.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self._segment.write("\n")
+        self.recent.append(record)
+        self.count += 1
+        self._since_manifest += 1
+        self._rotate_if_needed()
+        if self._since_manifest >= self.manifest_every:
+            self.flush()
+
+    def flush(self):
+        """Flushes the current segment and atomically replaces the manifest."""
+        self._segment.flush()
+        latest = self.recent[-1] if self.recent else None
+        atomic_write_json(self.manifest_path, {
+            "latest_id": latest["prediction_id"] if latest else None,
+            "latest": latest,
+            "recent": list(self.recent),
+            "count": self.count,
+            "current_segment": os.path.relpath(self._segment_path(self._segment_seq), self.output_dir).replace(os.sep, "/"),
+            "updated_utc": datetime.utcnow().isoformat() + "Z",
+        })
+        self._since_manifest = 0
+
+    def close(self):
+        self.flush()
+        self._segment.close()
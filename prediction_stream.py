@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+
+# --- CONFIGURATION ---
+STREAM_HOST = "127.0.0.1"
+STREAM_PORT = 8765
+REPLAY_RECORDS = 1000         # Records kept for replay to reconnecting clients
+CLIENT_QUEUE_RECORDS = 256    # Records buffered per client before it is dropped as too slow
+HEARTBEAT_SECONDS = 15        # Keeps idle connections (and proxies) alive
+RETRY_MILLISECONDS = 1000     # Reconnect delay suggested to EventSource clients
+LISTEN_BACKLOG = 1024         # Pending connections, so a burst of dashboards reconnecting is not refused
+
+
+def sse_event(record):
+    """Encodes a prediction record as one Server-Sent Event, with its prediction_id as the event id."""
+    data = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+    return f"id: {record['prediction_id']}\nevent: prediction\ndata: {data}\n\n".encode("utf-8")
+
+
+class PredictionBroadcaster:
+    """
+    Fans prediction records out to any number of subscribers. Each record is
+    encoded once and the same bytes are queued for every client. A client
+    whose queue fills up (it reads slower than records arrive) is dropped
+    instead of slowing the producer or growing memory; it reconnects with
+    its last prediction_id and catches up from the replay buffer.
+    """
+
+    def __init__(self, replay=REPLAY_RECORDS, queue_records=CLIENT_QUEUE_RECORDS):
+        self.replay = deque(maxlen=replay)   # (prediction_id, record, event bytes)
+        self.queue_records = queue_records
+        self.subscribers = set()
+        self.dropped = 0
+
+    @property
+    def latest(self):
+        return self.replay[-1][1] if self.replay else None
+
+    def publish(self, record):
+        event = sse_event(record)
+        self.replay.append((record["prediction_id"], record, event))
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Replace the oldest queued event with the sentinel that stops the client's writer
+                self.subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+                self.dropped += 1
+
+    def subscribe(self, last_id=None):
+        """
+        Registers a client and returns its queue, pre-filled with the records
+        after last_id. An unknown last_id (older than the replay buffer)
+        replays the whole buffer; None starts with the latest record only.
+        """
+        replay = list(self.replay)
+        if last_id is None:
+            backlog = replay[-1:]
+        else:
+            ids = [prediction_id for prediction_id, _, _ in replay]
+            backlog = replay[ids.index(last_id) + 1:] if last_id in ids else replay
+
+        queue = asyncio.Queue(maxsize=max(self.queue_records, len(backlog) + 1))
+        for _, _, event in backlog:
+            queue.put_nowait(event)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+
+async def read_request(reader):
+    """Returns (method, path, query, headers) of one HTTP/1.1 request."""
+    request_line = (await reader.readline()).decode("latin-1").strip()
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line:
+            break
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    method, target, _ = request_line.split(" ", 2)
+    url = urlsplit(target)
+    return method, url.path, parse_qs(url.query), headers
+
+
+def http_response(status, body, content_type="application/json", extra_headers=""):
+    return (f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Access-Control-Allow-Origin: *\r\nCache-Control: no-store\r\nConnection: close\r\n"
+            f"{extra_headers}\r\n").encode("latin-1") + body
+
+
+class PredictionStreamServer:
+    """
+    Minimal asyncio HTTP server for the dashboard:
+
+    - GET /stream: Server-Sent Events, one `prediction` event per record.
+      Replays from the Last-Event-ID header (sent automatically by a
+      reconnecting EventSource) or the ?last_id= query parameter.
+    - GET /latest: the newest record as JSON.
+
+    Writes to each client are awaited with drain(), so a slow socket only
+    stalls that client's own writer task.
+    """
+
+    def __init__(self, broadcaster, host=STREAM_HOST, port=STREAM_PORT, heartbeat_seconds=HEARTBEAT_SECONDS):
+        self.broadcaster = broadcaster
+        self.host = host
+        self.port = port
+        self.heartbeat_seconds = heartbeat_seconds
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port, backlog=LISTEN_BACKLOG)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.info(f"Prediction stream listening on http://{self.host}:{self.port}/stream")
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            method, path, query, headers = await read_request(reader)
+            if method == "OPTIONS":
+                writer.write(http_response("204 No Content", b"", "text/plain",
+                                           "Access-Control-Allow-Headers: Last-Event-ID\r\n"))
+            elif method != "GET":
+                writer.write(http_response("405 Method Not Allowed", b'{"error":"method not allowed"}'))
+            elif path == "/stream":
+                last_id = headers.get("last-event-id") or query.get("last_id", [None])[0]
+                await self._stream(writer, last_id)
+            elif path == "/latest":
+                writer.write(http_response("200 OK", json.dumps(self.broadcaster.latest).encode("utf-8")))
+            else:
+                writer.write(http_response("404 Not Found", b'{"error":"not found"}'))
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, writer, last_id):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-store\r\n"
+                     b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\n"
+                     + f"retry: {RETRY_MILLISECONDS}\n\n".encode("ascii"))
+        queue = self.broadcaster.subscribe(last_id)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    event = b": heartbeat\n\n"
+                if event is None:
+                    break
+                writer.write(event)
+                await writer.drain()
+        finally:
+            self.broadcaster.unsubscribe(queue)
+
+
+async def serve(records, host=STREAM_HOST, port=STREAM_PORT, store=None):
+    """
+    Publishes each record from the async iterable `records` to stream
+    clients (and to a prediction_store.PredictionStore when given) and keeps
+    serving until cancelled.
+    """
+    broadcaster = PredictionBroadcaster()
+    server = await PredictionStreamServer(broadcaster, host, port).start()
+    print(f"Streaming predictions on http://{server.host}:{server.port}/stream")
+    try:
+        async for record in records:
+            if store is not None:
+                store.append(record)
+            broadcaster.publish(record)
+            print(f"Published {record['prediction_id']} to {len(broadcaster.subscribers)} client(s)")
+        await asyncio.Event().wait()
+    finally:
+        if store is not None:
+            store.close()
+        await server.close()
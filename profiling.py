@@ -0,0 +1,135 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# --- CONFIGURATION ---
+# Set FEDGRID_PROFILE=<path.json> to record every instrumented stage and write the report at exit
+PROFILE_ENV = 'FEDGRID_PROFILE'
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process so far (0 where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_rss_bytes():
+    """Current resident set size (0 where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def array_bytes(obj):
+    """Total nbytes of the NumPy arrays in obj (an array, or dicts/lists/tuples of them)."""
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(array_bytes(v) for v in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(array_bytes(v) for v in obj)
+    return 0
+
+
+class Profiler:
+    """
+    Records wall time, RSS and array bytes per named stage. Repeated stages
+    (one per notification, per upload, per chunk) are aggregated into call
+    count, total/mean/max seconds, the highest peak RSS and the largest
+    array footprint seen, so the report stays small on long runs.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the block. The yielded dict accepts an 'arrays' entry (any
+        object for array_bytes) and/or a 'bytes' count describing what the
+        stage produced.
+        """
+        if not self.enabled:
+            yield {}
+            return
+        info = {}
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self._record(name, time.perf_counter() - start, rss_before,
+                         array_bytes(info.get('arrays')) + info.get('bytes', 0))
+
+    def _record(self, name, seconds, rss_before, n_array_bytes):
+        rss_after = current_rss_bytes()
+        with self._lock:
+            s = self.stages.setdefault(name, {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                                              'peak_rss_bytes': 0, 'max_rss_growth_bytes': 0,
+                                              'max_array_bytes': 0})
+            s['calls'] += 1
+            s['total_seconds'] += seconds
+            s['max_seconds'] = max(s['max_seconds'], seconds)
+            s['peak_rss_bytes'] = max(s['peak_rss_bytes'], peak_rss_bytes())
+            s['max_rss_growth_bytes'] = max(s['max_rss_growth_bytes'], rss_after - rss_before)
+            s['max_array_bytes'] = max(s['max_array_bytes'], n_array_bytes)
+
+    def report(self):
+        with self._lock:
+            stages = {name: dict(s, mean_seconds=s['total_seconds'] / s['calls']) for name, s in self.stages.items()}
+        return {'pid': os.getpid(), 'started_unix': self._started, 'wall_seconds': time.time() - self._started,
+                'peak_rss_bytes': peak_rss_bytes(), 'stages': stages}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+
+def print_profile(report):
+    print(f"{'Stage':<34}{'Calls':>7}{'Total s':>10}{'Mean s':>10}{'Max s':>10}{'Peak RSS MB':>13}{'Arrays MB':>11}")
+    for name, s in sorted(report['stages'].items(), key=lambda item: -item[1]['total_seconds']):
+        print(f"{name:<34}{s['calls']:>7}{s['total_seconds']:>10.3f}{s['mean_seconds']:>10.4f}{s['max_seconds']:>10.4f}"
+              f"{s['peak_rss_bytes'] / 2**20:>13.1f}{s['max_array_bytes'] / 2**20:>11.1f}")
+
+
+# Process-wide profiler used by the instrumented modules; a no-op unless FEDGRID_PROFILE is set
+profiler = Profiler(enabled=bool(os.environ.get(PROFILE_ENV)))
+if profiler.enabled:
+    atexit.register(profiler.save, os.environ[PROFILE_ENV])
+
+
+def profile_stage(name):
+    """Context manager recording one stage on the process-wide profiler."""
+    return profiler.stage(name)
+
+
+def profiled(name):
+    """Decorator form of profile_stage; the return value is counted as the stage's arrays."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return fn(*args, **kwargs)
+            with profiler.stage(name) as info:
+                result = fn(*args, **kwargs)
+                info['arrays'] = result
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,245 @@
+import argparse
+import time
+import numpy as np
+from fedavg import LAYER_KEYS, OUTPUT_DTYPE
+from npz_utils import npz_memmap, load_npz
+
+# --- CONFIGURATION ---
+CHUNK_BYTES = 64 * 1024**2  # Size of one (clients x parameters) float32 block; bounds peak memory
+TRIM_RATIO = 0.1            # Trimmed mean drops this fraction of values from each end, per coordinate
+BYZANTINE_FRACTION = 0.1    # Krum's assumed share of faulty clients (f) when not given
+METHODS = ('mean', 'median', 'trimmed_mean', 'krum', 'multi_krum')
+SELECTIONS = ('partition', 'sort')
+
+
+def open_update(path):
+    """W1..b4 of a client npz, memory-mapped when stored uncompressed (np.savez)."""
+    try:
+        return npz_memmap(path)
+    except ValueError:
+        return load_npz(path)
+
+
+def open_updates(paths):
+    return [open_update(path) for path in paths]
+
+
+def check_shapes(updates):
+    """Raises ValueError unless every update has W1..b4 with the first update's shapes."""
+    if not updates:
+        raise ValueError("No updates to aggregate")
+    shapes = {key: np.shape(updates[0][key]) for key in LAYER_KEYS}
+    for i, update in enumerate(updates):
+        for key in LAYER_KEYS:
+            if key not in update:
+                raise ValueError(f"Update {i} has no {key}")
+            if np.shape(update[key]) != shapes[key]:
+                raise ValueError(f"Update {i}: {key} has shape {np.shape(update[key])}, expected {shapes[key]}")
+    return shapes
+
+
+def layer_blocks(updates, key, chunk_bytes=CHUNK_BYTES):
+    """
+    Yields (start, stop, block) over the flattened layer `key`, where block
+    is a (stop - start, clients) float32 array: one row per coordinate, so
+    the order statistics below run over contiguous rows. The buffer is
+    reused between chunks and may be reordered in place by the caller, so
+    only one chunk of the stacked layer is ever resident.
+    """
+    # Plain ndarray views of memory-mapped layers: slicing np.memmap itself costs a subclass object per client
+    flats = [np.ravel(np.asarray(update[key])) for update in updates]
+    size = flats[0].size
+    step = max(1, min(size, chunk_bytes // (len(updates) * 4)))
+    buffer = np.empty((step, len(updates)), dtype=np.float32)
+    for start in range(0, size, step):
+        stop = min(start + step, size)
+        block = buffer[:stop - start]
+        for i, flat in enumerate(flats):
+            block[:, i] = flat[start:stop]
+        yield start, stop, block
+
+# === Coordinate-wise kernels: (params, clients) block -> (params,) ===
+# NumPy only has a vectorized selection kernel for a single kth along a
+# contiguous axis; several kths in one call fall back to a much slower
+# path. 'partition' therefore places one rank per call and reads any
+# neighbouring statistic off the partitioned halves.
+
+def median_block(block, selection='partition'):
+    """Coordinate-wise median. 'partition' places only the middle order statistic (O(n) per coordinate)."""
+    n = block.shape[1]
+    lo, hi = (n - 1) // 2, n // 2
+    if selection == 'partition':
+        block.partition(hi, axis=1)
+        lower = block[:, :hi].max(axis=1) if lo != hi else block[:, hi]
+    else:
+        block.sort(axis=1)
+        lower = block[:, lo]
+    return (lower.astype(np.float64) + block[:, hi]) / 2
+
+
+def trimmed_mean_block(block, trim_ratio=TRIM_RATIO, selection='partition'):
+    """
+    Coordinate-wise mean of the values left after dropping the k = trim_ratio * n
+    smallest and largest. Partitioning at rank n - k moves the k largest to
+    the end, and partitioning the rest at rank k moves the k smallest to the
+    front, leaving exactly the kept values in block[:, k:n-k].
+    """
+    n = block.shape[1]
+    k = int(trim_ratio * n)
+    if 2 * k >= n:
+        raise ValueError(f"trim_ratio {trim_ratio} leaves no values out of {n} clients")
+    if k:
+        if selection == 'partition':
+            block.partition(n - k, axis=1)
+            block[:, :n - k].partition(k, axis=1)
+        else:
+            block.sort(axis=1)
+    return block[:, k:n - k].mean(axis=1, dtype=np.float64)
+
+
+def mean_block(block, sample_weights=None):
+    """Coordinate-wise (optionally sample-weighted) mean: plain FedAvg, for comparison."""
+    if sample_weights is None:
+        return block.mean(axis=1, dtype=np.float64)
+    return block @ np.asarray(sample_weights, dtype=np.float64) / np.sum(sample_weights)
+
+# === Krum ===
+
+def pairwise_sq_distances(updates, chunk_bytes=CHUNK_BYTES):
+    """
+    (clients, clients) squared L2 distances between the flattened updates,
+    accumulated chunk by chunk as a Gram matrix. Each chunk is centered on
+    its coordinate mean first (distances are unchanged) so the float64
+    |x|^2 + |y|^2 - 2 x.y does not cancel catastrophically when updates
+    are close to each other.
+    """
+    n = len(updates)
+    gram = np.zeros((n, n))
+    for key in LAYER_KEYS:
+        for _, _, block in layer_blocks(updates, key, chunk_bytes // 2):
+            centered = block - block.mean(axis=1, dtype=np.float64, keepdims=True)
+            gram += centered.T @ centered
+    sq = np.diag(gram)
+    distances = np.maximum(sq[:, None] + sq[None, :] - 2 * gram, 0)
+    np.fill_diagonal(distances, 0)
+    return distances
+
+
+def default_byzantine(n):
+    return int(BYZANTINE_FRACTION * n)
+
+
+def check_krum_clients(n, byzantine=None):
+    """Raises ValueError unless n > 2f + 2, the bound under which Krum tolerates f faulty clients."""
+    byzantine = default_byzantine(n) if byzantine is None else byzantine
+    if n <= 2 * byzantine + 2:
+        raise ValueError(f"Krum needs more than 2f + 2 clients (n={n}, f={byzantine})")
+    return byzantine
+
+
+def krum_scores(distances, byzantine, selection='partition'):
+    """Krum score per client: the sum of squared distances to its n - f - 2 nearest other clients."""
+    n = len(distances)
+    check_krum_clients(n, byzantine)
+    neighbours = n - byzantine - 2
+    others = distances + np.diag(np.full(n, np.inf))
+    if selection == 'partition':
+        nearest = np.partition(others, neighbours - 1, axis=1)[:, :neighbours]
+    else:
+        nearest = np.sort(others, axis=1)[:, :neighbours]
+    return nearest.sum(axis=1)
+
+
+def krum_select(scores, num_selected, selection='partition'):
+    """Indices of the num_selected lowest scores, best first."""
+    if selection == 'partition' and num_selected < len(scores):
+        chosen = np.argpartition(scores, num_selected - 1)[:num_selected]
+    else:
+        chosen = np.arange(len(scores))
+    return chosen[np.argsort(scores[chosen], kind='stable')][:num_selected]
+
+
+def mean_of(updates, indices, sample_weights=None):
+    """Per-layer (optionally sample-weighted) mean of the selected updates, one client at a time."""
+    weights = np.ones(len(updates)) if sample_weights is None else np.asarray(sample_weights, dtype=np.float64)
+    total = float(weights[indices].sum())
+    out = {}
+    for key in LAYER_KEYS:
+        acc = np.zeros(np.shape(updates[indices[0]][key]))
+        for i in indices:
+            acc += weights[i] * np.asarray(updates[i][key], dtype=np.float64)
+        out[key] = (acc / total).astype(OUTPUT_DTYPE)
+    return out
+
+
+def robust_aggregate(updates, method='median', selection='partition', trim_ratio=TRIM_RATIO, byzantine=None,
+                     num_selected=None, sample_weights=None, chunk_bytes=CHUNK_BYTES):
+    """
+    Aggregates a list of W1..b4 dicts (see open_updates) with one of METHODS
+    and returns (weights, summary).
+
+    mean, median and trimmed_mean run layer by layer over blocks of at most
+    chunk_bytes. krum returns the single update with the lowest Krum score,
+    given `byzantine` (f) faulty clients; multi_krum averages the
+    num_selected (default n - f) best-scoring updates. sample_weights only
+    affect mean and multi_krum: order statistics are unweighted, so one
+    client cannot buy influence by claiming a large sample count.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown aggregation method {method!r}; expected one of {', '.join(METHODS)}")
+    if selection not in SELECTIONS:
+        raise ValueError(f"Unknown selection {selection!r}; expected one of {', '.join(SELECTIONS)}")
+    shapes = check_shapes(updates)
+    n = len(updates)
+    start = time.perf_counter()
+    summary = {'method': method, 'selection': selection, 'num_clients': n}
+
+    if method in ('krum', 'multi_krum'):
+        byzantine = check_krum_clients(n, byzantine)
+        if method == 'krum':
+            num_selected = 1
+        elif num_selected is None:
+            num_selected = n - byzantine
+        scores = krum_scores(pairwise_sq_distances(updates, chunk_bytes), byzantine, selection)
+        selected = krum_select(scores, num_selected, selection)
+        weights = mean_of(updates, selected, sample_weights)
+        summary.update(byzantine=byzantine, selected=[int(i) for i in selected],
+                       scores=[float(s) for s in scores])
+    else:
+        weights = {}
+        for key in LAYER_KEYS:
+            flat = np.empty(int(np.prod(shapes[key])), dtype=OUTPUT_DTYPE)
+            for lo, hi, block in layer_blocks(updates, key, chunk_bytes):
+                if method == 'median':
+                    flat[lo:hi] = median_block(block, selection)
+                elif method == 'trimmed_mean':
+                    flat[lo:hi] = trimmed_mean_block(block, trim_ratio, selection)
+                else:
+                    flat[lo:hi] = mean_block(block, sample_weights)
+            weights[key] = flat.reshape(shapes[key])
+        if method == 'trimmed_mean':
+            summary['trimmed_per_side'] = int(trim_ratio * n)
+
+    summary['seconds'] = time.perf_counter() - start
+    return weights, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Byzantine-robust aggregation of client weight files.")
+    parser.add_argument("paths", nargs="+", help="Client W1..b4 .npz files")
+    parser.add_argument("--method", choices=METHODS, default='median')
+    parser.add_argument("--selection", choices=SELECTIONS, default='partition')
+    parser.add_argument("--trim-ratio", type=float, default=TRIM_RATIO)
+    parser.add_argument("--byzantine", type=int, default=None, help="Assumed faulty clients for Krum (default: 10%%)")
+    parser.add_argument("--num-selected", type=int, default=None, help="Updates averaged by multi-Krum (default: n - f)")
+    parser.add_argument("--out", default="global_model_robust.npz")
+    args = parser.parse_args()
+
+    weights, summary = robust_aggregate(open_updates(args.paths), args.method, args.selection, args.trim_ratio,
+                                        args.byzantine, args.num_selected)
+    np.savez(args.out, **weights)
+    print(f"{summary['method']} ({summary['selection']}) over {summary['num_clients']} clients "
+          f"in {summary['seconds']:.3f}s")
+    if 'selected' in summary:
+        print(f"Selected clients: {[args.paths[i] for i in summary['selected']]}")
+    print(f"Saved: {args.out}")
@@ -1,9 +1,10 @@
 import numpy as np
 import json
 import os
-import uuid
 import requests # This library is for sending the web request
-from azure.storage.blob import BlobServiceClient
+from block_uploader import BlockUploader, AzureBlockTarget
+from weight_codec import encode_update, decode_update, weights_sha256, compression_report, print_compression_report
+from profiling import profiled
 
 # --- CONFIGURATION ---
 # The URL of your frontend's API endpoint
@@ -14,42 +15,105 @@ STORAGE_CONNECTION_STRING = "ADD_CONNECTION_STRING"
 
 CONTAINER_NAME = "model-weights"
 NPZ_FILE_PATH = "local_model_weights_mlp_2.npz"
+# Container the Function App publishes global models to (its GLOBAL_MODEL_CONTAINER_URL)
+GLOBAL_MODEL_CONTAINER = "global-models"
+GLOBAL_MODEL_BLOB = "global_model_latest.npz"
+# Local copy of the latest global model, refreshed before every upload; only the delta against it is sent
+GLOBAL_MODEL_PATH = "global_model_latest.npz"
+# "float32" sends the delta unquantized; "float16" or "int8" (per-tensor scale) are optional and lossy
+UPLOAD_MODE = "float32"
+ENCODED_FILE_PATH = "local_model_update_mlp_2.npz"
 
-def upload_weights_to_blob(storage_conn_str, container_name, file_path):
-    """Uploads the NPZ file to Azure Blob Storage and returns its URL."""
+@profiled('send_weights.fetch_global_model')
+def fetch_global_model(storage_conn_str, container_name, blob_name, path):
+    """
+    Refreshes the local copy of the latest global model, downloading it only
+    when its etag differs from the one saved next to the file. Returns path,
+    or None if the current global model could not be confirmed: a delta
+    against a stale model is rejected once the server no longer keeps it.
+    """
+    from azure.core import MatchConditions
+    etag_path = f"{path}.etag"
     try:
-        blob_service_client = BlobServiceClient.from_connection_string(storage_conn_str)
-        
-        # Create a container if it doesn't exist
-        try:
-            container_client = blob_service_client.get_container_client(container_name)
-            container_client.create_container()
-            print(f"Container '{container_name}' created.")
-        except Exception:
-            print(f"Container '{container_name}' already exists.")
+        blob_client = get_block_uploader(storage_conn_str).target.service.get_blob_client(
+            container=container_name, blob=blob_name)
+        etag = blob_client.get_blob_properties().etag
+        if os.path.exists(path) and os.path.exists(etag_path):
+            with open(etag_path) as f:
+                if f.read() == etag:
+                    print(f"Global model '{path}' is current.")
+                    return path
+        print(f"Downloading global model {container_name}/{blob_name}...")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            blob_client.download_blob(etag=etag, match_condition=MatchConditions.IfNotModified).readinto(f)
+        os.replace(tmp_path, path)
+        with open(etag_path, "w") as f:
+            f.write(etag)
+        return path
+    except Exception as e:
+        print(f"Could not fetch the global model ({e}); sending full weights.")
+        return None
 
-        # Create a unique name for the blob to avoid overwriting
-        blob_name = f"{os.path.basename(file_path).split('.')[0]}-{uuid.uuid4()}.npz"
-        
-        print(f"Uploading {file_path} to container '{container_name}' as blob '{blob_name}'...")
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        
-        with open(file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
-            
-        print("Upload complete.")
-        return blob_client.url
+@profiled('send_weights.encode')
+def encode_weights_file(npz_path, global_model_path, mode, out_path):
+    """
+    Writes the compressed delta upload for npz_path against the global model
+    and prints the savings per layer. Without a global model (first round,
+    or the fetch failed) npz_path itself is returned and sent as plain npz.
+    """
+    if global_model_path is None or not os.path.exists(global_model_path):
+        print("No global model, sending the full weights as plain npz.")
+        return npz_path
+    with np.load(npz_path) as data:
+        weights = {key: data[key] for key in data.files}
+    with np.load(global_model_path) as data:
+        base = {key: data[key] for key in data.files}
+    print(f"Encoding delta against global model {weights_sha256(base)[:12]} ({mode})...")
+
+    encoded = encode_update(weights, base=base, mode=mode)
+    bases = {weights_sha256(base): base}
+    print_compression_report(compression_report(weights, encoded, decode_update(encoded, bases)), len(encoded))
+
+    with open(out_path, "wb") as f:
+        f.write(encoded)
+    return out_path
+
+# Cached per connection string: one connection pool and one container check per process
+_block_uploaders = {}
+
+def get_block_uploader(storage_conn_str):
+    if storage_conn_str not in _block_uploaders:
+        _block_uploaders[storage_conn_str] = BlockUploader(AzureBlockTarget(storage_conn_str))
+    return _block_uploaders[storage_conn_str]
+
+@profiled('send_weights.upload')
+def upload_weights_to_blob(storage_conn_str, container_name, file_path):
+    """
+    Uploads the NPZ file to Azure Blob Storage as parallel staged blocks and
+    returns its URL. The blob name is derived from the file content, so
+    running again after a dropped connection resumes the same upload.
+    """
+    try:
+        uploader = get_block_uploader(storage_conn_str)
+        print(f"Uploading {file_path} to container '{container_name}'...")
+        blob_url, bytes_sent = uploader.upload(container_name, file_path)
+        print(f"Upload complete ({bytes_sent} bytes sent).")
+        return blob_url
     except Exception as e:
-        print(f"Error uploading to blob storage: {e}")
+        print(f"Error uploading to blob storage (rerun to resume): {e}")
         return None
 
+# Reuses the HTTPS connection across calls
+session = requests.Session()
+
 def send_to_frontend_api(payload):
     """Sends a payload directly to the frontend's API endpoint."""
     headers = { "Content-Type": "application/json" }
     
     try:
         print(f"Sending data directly to frontend API at {API_URL}...")
-        response = requests.post(API_URL, json=payload, headers=headers)
+        response = session.post(API_URL, json=payload, headers=headers)
         response.raise_for_status()
         print(f"API response: {response.status_code} - {response.json()}")
         print("Data sent to frontend successfully!")
@@ -60,8 +124,11 @@ if __name__ == "__main__":
     if not os.path.exists(NPZ_FILE_PATH):
         print(f"ERROR: '{NPZ_FILE_PATH}' not found.")
     else:
-        # 1. Upload the large file to Blob Storage
-        blob_file_url = upload_weights_to_blob(STORAGE_CONNECTION_STRING, CONTAINER_NAME, NPZ_FILE_PATH)
+        # 1. Refresh the global model, compress the update against it, then upload it to Blob Storage
+        global_model_path = fetch_global_model(STORAGE_CONNECTION_STRING, GLOBAL_MODEL_CONTAINER,
+                                               GLOBAL_MODEL_BLOB, GLOBAL_MODEL_PATH)
+        upload_path = encode_weights_file(NPZ_FILE_PATH, global_model_path, UPLOAD_MODE, ENCODED_FILE_PATH)
+        blob_file_url = upload_weights_to_blob(STORAGE_CONNECTION_STRING, CONTAINER_NAME, upload_path)
         
         if blob_file_url:
             # 2. Create the JSON payload with the URL
@@ -6,29 +6,62 @@ import ChatBot from "./chatbot";
 // --- PREDICTION DATA SERVICE ---
 const fetchLatestPrediction = async () => {
   try {
-    // Try to find the latest prediction file by checking in reverse order
-    for (let i = 100; i >= 1; i--) {
-      const fileNumber = i.toString().padStart(3, "0");
-      try {
-        const fileResponse = await fetch(
-          `/frontend_data/prediction_${fileNumber}.json`
-        );
-        if (fileResponse.ok) {
-          return await fileResponse.json();
-        }
-      } catch (e) {
-        // File doesn't exist, continue to next
-        continue;
-      }
+    // The simulator atomically rewrites latest.json after every prediction,
+    // so a single request returns the newest record.
+    const response = await fetch("/frontend_data/latest.json", {
+      cache: "no-store",
+    });
+    if (!response.ok) {
+      return null;
     }
-
-    return null;
+    const manifest = await response.json();
+    return manifest.latest || null;
   } catch (error) {
     console.error("Error fetching prediction data:", error);
     return null;
   }
 };
 
+// Keeps whichever record is newer by timestamp_utc, so a slow latest.json
+// fetch that resolves after a pushed record cannot overwrite it.
+const newerPrediction = (current, incoming) => {
+  if (!current) {
+    return incoming;
+  }
+  return Date.parse(incoming.timestamp_utc) >= Date.parse(current.timestamp_utc)
+    ? incoming
+    : current;
+};
+
+// Live predictions pushed by `python backend_simulator.py --serve`
+const PREDICTION_STREAM_URL =
+  import.meta.env.VITE_PREDICTION_STREAM_URL ||
+  "http://localhost:8765/stream";
+
+// Calls onPrediction for every record pushed by the simulator. EventSource
+// reconnects on its own and resumes from the last received prediction_id.
+// If the stream server is not running at all, the dashboard keeps the data
+// from latest.json. Returns an unsubscribe function.
+const subscribeToPredictions = (onPrediction) => {
+  if (typeof EventSource === "undefined") {
+    return () => {};
+  }
+  const source = new EventSource(PREDICTION_STREAM_URL);
+  let connected = false;
+  source.onopen = () => {
+    connected = true;
+  };
+  source.addEventListener("prediction", (event) => {
+    onPrediction(JSON.parse(event.data));
+  });
+  source.onerror = () => {
+    if (!connected) {
+      source.close();
+    }
+  };
+  return () => source.close();
+};
+
 // --- Third-party Library Imports for Local Development ---
 import { Line, Bar } from "react-chartjs-2";
 import {
@@ -1287,18 +1320,22 @@ const UserView = ({ user, supabase }) => {
   const [lastUpdate, setLastUpdate] = useState(null);
   const [showChat, setShowChat] = useState(false);
 
-  // Fetch live prediction data - STATIC VERSION (no polling)
+  // Fetch live prediction data once, then follow pushed updates (no polling)
   useEffect(() => {
+    const applyPrediction = (data) => {
+      setLiveData((current) => newerPrediction(current, data));
+      const updated = new Date(data.timestamp_utc);
+      setLastUpdate((current) => (current && current > updated ? current : updated));
+    };
     const fetchData = async () => {
       const data = await fetchLatestPrediction();
       if (data) {
-        setLiveData(data);
-        setLastUpdate(new Date(data.timestamp_utc));
+        applyPrediction(data);
       }
     };
 
-    // Only fetch once on component mount
     fetchData();
+    return subscribeToPredictions(applyPrediction);
   }, []);
 
   const handleSimulate = () => {
@@ -1825,18 +1862,20 @@ const OperatorView = ({ user, supabase }) => {
   //   }
   // }, [insightQueue]);
 
-  // Fetch live prediction data for operator view - STATIC VERSION (no polling)
+  // Fetch live prediction data for operator view once, then follow pushed updates (no polling)
   useEffect(() => {
     const fetchData = async () => {
       const data = await fetchLatestPrediction();
       if (data) {
-        setLiveData(data);
+        setLiveData((current) => newerPrediction(current, data));
       }
     };
 
-    // Only fetch once on component mount
     fetchData();
-  }, []); // No dependencies to prevent re-fetching
+    return subscribeToPredictions((data) =>
+      setLiveData((current) => newerPrediction(current, data)),
+    );
+  }, []); // No dependencies to prevent re-subscribing
 
   // Random operational insights timer - shows insights every minute for demo
   useEffect(() => {
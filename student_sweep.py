@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import as_completed
+import numpy as np
+from federated_training import training_pool
+from models import STUDENT_HIDDEN_UNITS, STUDENT_DROPOUT, STUDENT_LEARNING_RATE
+from train_local_model import RUN_DIR, CSV_PATH, BATCH_SIZE, STUDENT_EPOCHS, STUDENT_LOSS, TrainingPipeline
+
+# --- CONFIGURATION ---
+SWEEP_DIR = 'student_sweep'
+SEED = 42
+METRICS = ('rmse', 'mae', 'smape')
+# Default grid around the deployed 32 -> 16 -> 8 -> 1 student (dropout 0.3, lr 1e-4, batch 32)
+DEFAULT_GRID = {
+    'hidden_units': [(8, 4), (16, 8), (16, 8, 4), list(STUDENT_HIDDEN_UNITS), (64, 32, 16)],
+    'dropout': [0.0, STUDENT_DROPOUT],
+    'learning_rate': [STUDENT_LEARNING_RATE, 1e-3],
+    'batch_size': [BATCH_SIZE, 128],
+    'loss': [STUDENT_LOSS],
+    'epochs': [STUDENT_EPOCHS],
+}
+
+
+def expand_grid(grid):
+    """Every combination of the grid's value lists, as config dicts."""
+    keys = list(grid)
+    configs = []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        config = dict(zip(keys, values))
+        config['hidden_units'] = [int(u) for u in config['hidden_units']]
+        configs.append(config)
+    return configs
+
+
+def config_id(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def labels_provenance(pipeline):
+    """Which soft labels and dataset a result was scored against: the soft_labels run token and dataset stamp."""
+    marker = pipeline.read_marker('soft_labels')
+    return {'soft_labels': marker['run_token'] if marker else None, 'dataset': pipeline.dataset_stamp()}
+
+
+def train_config(config, run_dir, csv_path, out_dir, seed=SEED):
+    """
+    Worker task: trains one student configuration on the cached teacher soft
+    labels and scores it with Steps 8-9. The dataset (ArrayCache) and soft
+    labels are opened memory-mapped, so every worker shares the same page
+    cache instead of holding its own copy; windows are cut and scaled per
+    batch by the tf.data pipeline.
+    """
+    import tensorflow as tf
+    from models import build_student, student_callbacks, STUDENT_LOSSES, mlp_weights
+    from train_local_model import calibrated_metrics
+
+    start = time.perf_counter()
+    tf.keras.utils.set_random_seed(seed)
+    pipeline = TrainingPipeline(run_dir, csv_path)
+    teacher_pred_train, teacher_pred_val = pipeline.soft_labels()
+
+    student = build_student(pipeline.window * pipeline.n_features, config['hidden_units'], config['dropout'],
+                            config['learning_rate'], STUDENT_LOSSES[config['loss']])
+    history = student.fit(
+        **pipeline.fit_inputs(teacher_pred_train, teacher_pred_val, flatten=True, batch_size=config['batch_size']),
+        epochs=config['epochs'],
+        callbacks=student_callbacks(),
+        verbose=0
+    )
+
+    weights = mlp_weights(student)
+    weights_path = os.path.join(out_dir, f"{config_id(config)}.npz")
+    np.savez(weights_path, **weights)
+
+    split2 = pipeline.meta['split2']
+    n_sequences = split2 + len(pipeline.data['y_test'])
+    y_pred_scaled = student.predict(pipeline.windows(split2, n_sequences, flatten=True), verbose=0).flatten()
+    _, calibration_factor, _, metrics = calibrated_metrics(y_pred_scaled, pipeline.data)
+
+    result = {
+        'config_id': config_id(config),
+        'config': config,
+        'provenance': labels_provenance(pipeline),
+        'metrics': metrics,
+        'calibration_factor': float(calibration_factor),
+        'parameters': int(sum(w.size for w in weights.values())),
+        'weight_bytes': os.path.getsize(weights_path),
+        'epochs_run': len(history.history['loss']),
+        'seconds': time.perf_counter() - start,
+        'pid': os.getpid(),
+    }
+    with open(os.path.join(out_dir, f"{result['config_id']}.json"), 'w') as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+def pareto_front(results, metric='rmse'):
+    """config_ids not dominated in (metric, weight_bytes): nothing else is both smaller and more accurate."""
+    front = set()
+    best = float('inf')
+    for r in sorted(results, key=lambda r: (r['weight_bytes'], r['metrics'][metric])):
+        if r['metrics'][metric] < best:
+            best = r['metrics'][metric]
+            front.add(r['config_id'])
+    return front
+
+
+def sweep_report(results, metric='rmse'):
+    front = pareto_front(results, metric)
+    ranked = sorted(results, key=lambda r: r['metrics'][metric])
+    for rank, r in enumerate(ranked, start=1):
+        r['rank'] = rank
+        r['pareto'] = r['config_id'] in front
+    return {'metric': metric, 'configs': len(ranked), 'pareto': [r for r in ranked if r['pareto']],
+            'results': ranked}
+
+
+def print_sweep_report(report):
+    metric = report['metric']
+    print(f"{'Rank':>4} {'Hidden':<14}{'Drop':>6}{'LR':>9}{'Batch':>7}{'Params':>9}{'Bytes':>9}"
+          f"{'RMSE':>10}{'MAE':>10}{'sMAPE':>8}  Pareto ({metric} vs size)")
+    for r in report['results']:
+        c, m = r['config'], r['metrics']
+        hidden = 'x'.join(str(u) for u in c['hidden_units'])
+        print(f"{r['rank']:>4} {hidden:<14}{c['dropout']:>6.2f}{c['learning_rate']:>9.0e}{c['batch_size']:>7}"
+              f"{r['parameters']:>9}{r['weight_bytes']:>9}{m['rmse']:>10.2f}{m['mae']:>10.2f}{m['smape']:>8.2f}"
+              f"  {'*' if r['pareto'] else ''}")
+
+
+class StudentSweep:
+    """
+    Trains many student configurations concurrently in a spawned process
+    pool with pinned thread counts (see federated_training), all reading the
+    soft labels of one TrainingPipeline run. Finished configurations are
+    stored as <out_dir>/<config_id>.json and skipped on a rerun, unless the
+    teacher's soft labels or the dataset have changed since they were scored.
+    """
+
+    def __init__(self, run_dir=RUN_DIR, csv_path=CSV_PATH, out_dir=SWEEP_DIR, workers=None, threads_per_worker=1):
+        self.run_dir = run_dir
+        self.csv_path = csv_path
+        self.out_dir = out_dir
+        self.workers = workers or max(1, (os.cpu_count() or 1) // threads_per_worker)
+        self.threads_per_worker = threads_per_worker
+        os.makedirs(out_dir, exist_ok=True)
+
+    def completed(self, config, provenance):
+        """The stored result for config, or None if there is none or it was scored against other soft labels."""
+        try:
+            with open(os.path.join(self.out_dir, f"{config_id(config)}.json")) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return result if result.get('provenance') == provenance else None
+
+    def run(self, configs, metric='rmse'):
+        pipeline = TrainingPipeline(self.run_dir, self.csv_path)
+        if not pipeline.is_complete('soft_labels'):
+            raise RuntimeError(f"No current soft labels in {self.run_dir}; "
+                               f"run `python train_local_model.py --to-stage soft_labels` first")
+        pipeline.data  # Make sure the ArrayCache entry exists before the workers open it
+
+        provenance = labels_provenance(pipeline)
+        done = [self.completed(c, provenance) for c in configs]
+        results = [r for r in done if r is not None]
+        pending = [c for c, r in zip(configs, done) if r is None]
+        print(f"Sweep: {len(configs)} configs ({len(results)} already done) on {self.workers} workers "
+              f"x {self.threads_per_worker} threads")
+
+        start = time.perf_counter()
+        if pending:
+            with training_pool(self.workers, self.threads_per_worker) as pool:
+                futures = [pool.submit(train_config, c, self.run_dir, self.csv_path, self.out_dir) for c in pending]
+                for future in as_completed(futures):
+                    r = future.result()
+                    results.append(r)
+                    print(f"  {r['config_id']} {r['config']['hidden_units']}: {metric} "
+                          f"{r['metrics'][metric]:.2f}, {r['weight_bytes']} bytes ({r['seconds']:.0f}s)")
+
+        report = sweep_report(results, metric)
+        report['wall_seconds'] = time.perf_counter() - start
+        with open(os.path.join(self.out_dir, 'report.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel student hyperparameter sweep on cached soft labels.")
+    parser.add_argument("--run-dir", default=RUN_DIR, help="TrainingPipeline run with a soft_labels checkpoint")
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--out", default=SWEEP_DIR)
+    parser.add_argument("--grid", default=None, help="JSON file mapping config keys to value lists")
+    parser.add_argument("--metric", choices=METRICS, default='rmse')
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    args = parser.parse_args()
+
+    grid = dict(DEFAULT_GRID)
+    if args.grid:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+
+    sweep = StudentSweep(args.run_dir, args.csv, args.out, args.workers, args.threads_per_worker)
+    report = sweep.run(expand_grid(grid), args.metric)
+    print_sweep_report(report)
+    print(f"Report: {os.path.join(args.out, 'report.json')}")
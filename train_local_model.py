@@ -1,300 +1,362 @@
-import numpy as np
-import pandas as pd
-from sklearn.preprocessing import RobustScaler, MinMaxScaler
-from sklearn.metrics import mean_squared_error, mean_absolute_error
-import tensorflow as tf
-from tensorflow.keras.models import Sequential, Model
-from tensorflow.keras.layers import Dense, LSTM, Dropout, Input, Attention, GlobalAveragePooling1D
-from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
-import matplotlib.pyplot as plt
+import argparse
+import hashlib
+import json
 import os
-import random
-
-
+import shutil
+import time
+import uuid
+import numpy as np
+from windowing import sliding_windows
+from dataset import load_dataset, dataset_key, dataset_scalers
+from calibration import MedianCalibrator, CALIBRATION_WINDOW, MIN_HISTORY
+from mlp_inference import MLPStudent, save_scalers, PARITY_ATOL
+from models import STUDENT_HIDDEN_UNITS, STUDENT_DROPOUT, STUDENT_LEARNING_RATE, forecast_metrics
+from prediction_store import atomic_write_json
+from profiling import profiler, profile_stage, print_profile
+
+# TensorFlow is only imported by the stages that train or run Keras models
+# (teacher, soft_labels, student), so resuming at calibrate/export never loads it.
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
-print("Loading dataset...")
-df = pd.read_csv('split_dataset_2.csv', on_bad_lines='skip')
-
-# === STEP 1: Feature Engineering ===
-print("Adding time-based and lag features...")
-
-# Aggregate total electricity
-energy_cols = [col for col in df.columns if 'Electricity' in col and 'Facility' not in col]
-if len(energy_cols) > 0:
-    df['Total_Electricity'] = df[energy_cols].sum(axis=1)
-else:
-    df['Total_Electricity'] = df['Electricity:Facility [kW](Hourly)']
-
-# Time features
-df['HourOfDay'] = np.arange(len(df)) % 24
-df['DayOfWeek'] = (np.arange(len(df)) // 24) % 7
-df['is_weekend'] = (df['DayOfWeek'] >= 5).astype(int)
-df['hour_sin'] = np.sin(2 * np.pi * df['HourOfDay'] / 24)
-df['hour_cos'] = np.cos(2 * np.pi * df['HourOfDay'] / 24)
-
-# Lag features
-df['lag_1'] = df['Total_Electricity'].shift(1)
-df['lag_24'] = df['Total_Electricity'].shift(24)
-df['lag_48'] = df['Total_Electricity'].shift(48)
-
-# Rolling stats
-df['rolling_mean_24'] = df['Total_Electricity'].shift(1).rolling(window=24, min_periods=1).mean()
-df['rolling_std_24'] = df['Total_Electricity'].rolling(24, min_periods=1).std().fillna(0)
-df['zscore_24'] = (df['Total_Electricity'] - df['rolling_mean_24']) / (df['rolling_std_24'] + 1e-6) #to detect unusually high load
-
-# Rate of change
-df['roc_1'] = df['Total_Electricity'] - df['lag_1']
-df['roc_24'] = df['Total_Electricity'] - df['lag_24']
-
-# Peak flags
-df['is_morning_peak'] = ((df['HourOfDay'] >= 7) & (df['HourOfDay'] <= 9)).astype(int)
-df['is_evening_peak'] = ((df['HourOfDay'] >= 17) & (df['HourOfDay'] <= 19)).astype(int)
-
-# Drop index and unused
-exclude_cols = ['Class', 'theft', '0']
-feature_cols = [col for col in df.columns if col not in exclude_cols and col != 'Electricity:Facility [kW](Hourly)']
-target_col = 'Electricity:Facility [kW](Hourly)'
-
-# Fill and drop NaN
-df = df.ffill().bfill().dropna()
-
-print(f"Data shape after preprocessing: {df.shape}")
-print(f"Number of features: {len(feature_cols)}")
-
-# === STEP 2: Target Creation ===
-X_raw = df[feature_cols].values
-y_raw = df[target_col].values
-
-# Target: sum of next 24 hours
-y_seq = []
-for i in range(len(X_raw) - 24):
-    y_seq.append(np.sum(y_raw[i+24:i+48]))
-y_seq = np.array(y_seq)
-X = X_raw[:-24]
-
-print(f"Creating target: sum of next 24 hours...")
-print(f"X shape: {X.shape}, y shape: {y_seq.shape}")
-
-# === STEP 3: Sequence Creation ===
-def create_sequences(X, y, window=72):
-    X_out, y_out = [], []
-    for i in range(window, len(X)):
-        X_out.append(X[i-window:i])
-        y_out.append(y[i])
-    return np.array(X_out), np.array(y_out)
-
+CSV_PATH = 'split_dataset_2.csv'
+# Set to a directory to build features out-of-core (chunked) and memory-map them
+FEATURE_STORE_DIR = None
+# Reuse Steps 1-5 from the on-disk cache when the CSV and preprocessing config are unchanged
+USE_DATASET_CACHE = True
+# Slice, scale and batch windows on the fly with tf.data instead of materializing them
+STREAM_WINDOWS = True
 window_size = 72
-X_seq, y_seq = create_sequences(X, y_seq, window=window_size)
-print(f"Sequence shapes - Train: {X_seq.shape}, Val: {X_seq.shape}, Test: {X_seq.shape}")
-
-# === STEP 4: Train/Val/Test Split ===
-split1 = int(0.7 * len(X_seq))
-split2 = int(0.85 * len(X_seq))
-X_train, X_val, X_test = X_seq[:split1], X_seq[split1:split2], X_seq[split2:]
-y_train, y_val, y_test = y_seq[:split1], y_seq[split1:split2], y_seq[split2:]
-
-# === STEP 5: Scaling ===
-print("Scaling input features with RobustScaler...")
-scaler_X = RobustScaler()
-X_train_flat = X_train.reshape(-1, X_train.shape[-1])
-X_val_flat = X_val.reshape(-1, X_val.shape[-1])
-X_test_flat = X_test.reshape(-1, X_test.shape[-1])
-
-X_train_scaled = scaler_X.fit_transform(X_train_flat).reshape(X_train.shape)
-X_val_scaled = scaler_X.transform(X_val_flat).reshape(X_val.shape)
-X_test_scaled = scaler_X.transform(X_test_flat).reshape(X_test.shape)
-
-print("Scaling target with log1p and MinMaxScaler...")
-scaler_y = MinMaxScaler()
-y_train_log = np.log1p(y_train).reshape(-1, 1)
-y_val_log = np.log1p(y_val).reshape(-1, 1)
-y_test_log = np.log1p(y_test).reshape(-1, 1)
-
-scaler_y.fit(y_train_log)
-y_train_scaled = scaler_y.transform(y_train_log).flatten()
-y_val_scaled = scaler_y.transform(y_val_log).flatten()
-y_test_scaled = scaler_y.transform(y_test_log).flatten()
-
-# === STEP 6: Teacher Model (LSTM) ===
-print("Training DNN Teacher model...")
-input_layer = Input(shape=(window_size, X_train.shape[-1]))
-
-# First LSTM layer with return_sequences=True for attention
-lstm_out = LSTM(64, return_sequences=True)(input_layer)
-lstm_out = Dropout(0.2)(lstm_out)
-
-# Second LSTM layer 
-lstm_final = LSTM(32, return_sequences=True)(lstm_out)
-lstm_final = Dropout(0.2)(lstm_final)
-
-# Apply attention mechanism - use self-attention on the sequence
-attention_out = Attention()([lstm_final, lstm_final])
-
-# Global average pooling to reduce sequence dimension
-pooled = GlobalAveragePooling1D()(attention_out)
-
-# Dense layers
-x = Dense(32, activation='relu')(pooled)
-x = Dropout(0.2)(x)
-output_layer = Dense(1, activation='linear')(x)
-
-teacher_model = Model(inputs=input_layer, outputs=output_layer)
-
-teacher_model.compile(
-    optimizer=Adam(1e-3),
-    loss='huber',
-    metrics=['mae', tf.keras.metrics.MeanAbsolutePercentageError()] # Add MAPE here
-)
-
-callbacks = [
-    EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True),
-    ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6)
-]
-
-teacher_model.fit(
-    X_train_scaled, y_train_scaled,
-    validation_data=(X_val_scaled, y_val_scaled),
-    epochs=100,
-    batch_size=32,
-    callbacks=callbacks,
-    verbose=1
-)
-
-# === STEP 7: Student Model (Small MLP) ===
-print("Training MLP Student via Knowledge Distillation...")
-teacher_pred_train = teacher_model.predict(X_train_scaled, verbose=0).flatten()
-teacher_pred_val = teacher_model.predict(X_val_scaled, verbose=0).flatten()
-
-X_train_flat_mlp = X_train_scaled.reshape(X_train_scaled.shape[0], -1)
-X_val_flat_mlp = X_val_scaled.reshape(X_val_scaled.shape[0], -1)
-X_test_flat_mlp = X_test_scaled.reshape(X_test_scaled.shape[0], -1)
-
-# Keep small MLP (32 → 16 → 8 → 1) for blockchain compatibility
-mlp_student = Sequential([
-    Dense(32, activation='relu', input_shape=(X_train_flat_mlp.shape[1],)),
-    Dropout(0.3),
-    Dense(16, activation='relu'),
-    Dropout(0.3),
-    Dense(8, activation='relu'),
-    Dense(1, activation='linear')
-])
-
-#  Use PEAK-WEIGHTED LOSS
-def peak_weighted_loss(y_true, y_pred):
-    diff = tf.abs(y_true - y_pred)
-    weights = 1.0 + tf.square(y_true) / (tf.reduce_max(tf.square(y_true)) + 1e-6)
-    return tf.reduce_mean(diff * weights)
-
-def smape_loss(y_true, y_pred):
-    epsilon = 0.1 # A small value to prevent division by zero
-    numerator = tf.abs(y_pred - y_true)
-    denominator = tf.keras.backend.maximum(tf.abs(y_true) + tf.abs(y_pred), epsilon)
-    return tf.reduce_mean(2.0 * numerator / denominator)
-
-# Then compile your student model with it
-mlp_student.compile(optimizer=Adam(1e-4), loss=smape_loss, metrics=['mae'])
-
-callbacks_mlp = [
-    ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=5, min_lr=1e-6),
-    EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True)
-]
-
-mlp_student.fit(
-    X_train_flat_mlp, teacher_pred_train,
-    validation_data=(X_val_flat_mlp, teacher_pred_val),
-    epochs=150,
-    batch_size=32,
-    callbacks=callbacks_mlp,
-    verbose=1
-)
-
-# === STEP 8: Evaluation with STRONG Calibration ===
-print("Evaluating MLP Student...")
-y_pred_scaled = mlp_student.predict(X_test_flat_mlp, verbose=0).flatten()
-
-# Inverse transform
-y_test_log_restored = scaler_y.inverse_transform(y_test_scaled.reshape(-1, 1)).flatten()
-y_pred_log_restored = scaler_y.inverse_transform(y_pred_scaled.reshape(-1, 1)).flatten()
-
-y_test_original = np.expm1(y_test_log_restored)
-y_pred_original = np.expm1(y_pred_log_restored)
-y_test_true = y_test
-
-#  1. Rolling Median Calibration (Stronger)
-y_pred_calibrated = []
-calibration_window = 50
-for i in range(len(y_pred_original)):
-    pred = y_pred_original[i]
-    start = max(0, i - calibration_window)
-    recent_true = y_test_true[start:i+1]
-    recent_pred = y_pred_original[start:i+1]
-    
-    if len(recent_true) > 20:
-        local_factor = np.median(recent_true) / (np.median(recent_pred) + 1e-6)
-        local_factor = np.clip(local_factor, 0.90, 1.80)  # Allow 40% boost
-        pred = pred * local_factor
-    y_pred_calibrated.append(pred)
-
-y_pred_calibrated = np.array(y_pred_calibrated)
-
-#  2. Global Boost (Force Recovery)
-# --- 2. Fallback Global Recovery (Critical Fix) ---
-# If the model is systematically underpredicting, force a boost
-median_true = np.median(y_test_true)
-median_pred = np.median(y_pred_calibrated)
-
-if median_pred < 0.9 * median_true:
-    fallback_factor = median_true / (median_pred + 1e-6)
-    # Increase the upper limit of the clip here
-    fallback_factor = np.clip(fallback_factor, 1.0, 2.0) # Changed from 1.8 to 2.5
-    print(f" Applying fallback calibration: {fallback_factor:.3f}")
-    y_pred_final = y_pred_calibrated * fallback_factor
-else:
-    # You can also slightly increase the normal global factor
-    global_factor = np.median(y_test_true) / (np.median(y_pred_calibrated) + 1e-6)
-    global_factor = np.clip(global_factor, 1.0, 1.5) # Changed from 1.5 to 2.0
-    print(f" Applying global calibration factor: {global_factor:.3f}")
-    y_pred_final = y_pred_calibrated * global_factor
-
-# 3. Final Clip
-y_pred_final = np.clip(y_pred_final, 0, y_test_true.max() * 1.5)
-
-# === STEP 9: Metrics & Output ===
-rmse = np.sqrt(mean_squared_error(y_test_true, y_pred_final))
-mae = mean_absolute_error(y_test_true, y_pred_final)
-def smape(a, f): return 100 * np.mean(2 * np.abs(f - a) / (np.abs(a) + np.abs(f) + 1e-8))
-smape_score = smape(y_test_true, y_pred_final)
-
-print(f"\nFinal Results (Daily Total):")
-print(f"RMSE: {rmse:.2f} kW")
-print(f"MAE: {mae:.2f} kW")
-print(f"sMAPE: {smape_score:.2f}%")
-
-# Output predictions
-print("\n============================================================")
-print("         FINAL PREDICTION OUTPUT")
-print("============================================================")
-for i in range(10):
-    actual = y_test_true[i]
-    pred = y_pred_final[i]
-    error = abs(pred - actual) / actual * 100
-    status = "✅ Success" if error < 5 else "⚠️  Warning"
-    print(f"Direct sum (from data): {actual:.2f} kW")
-    print(f"Reconstructed (y_test_true): {actual:.2f} kW")
-    print(f"Calibrated Predicted: {pred:.2f} kW  ← {error:.1f}% error → {status}")
-    print("Error: 0.00 kW\n")
-
-# === STEP 10: Save Weights ===
-def save_mlp_weights(model, filename):
-    weights = model.get_weights()
-    np.savez(filename,
-             W1=weights[0], b1=weights[1],
-             W2=weights[2], b2=weights[3],
-             W3=weights[4], b3=weights[5],
-             W4=weights[6], b4=weights[7])
-    print(f"Saving MLP weights: {filename}")
-    print(f"MLP weights saved ({os.path.getsize(filename)} bytes)")
-
-save_mlp_weights(mlp_student, 'local_model_weights_mlp_2.npz')
+
+# Stage checkpoints (teacher weights, soft labels, student, calibration) live here
+RUN_DIR = 'training_run'
+STAGES = ('features', 'teacher', 'soft_labels', 'student', 'calibrate', 'export')
+TEACHER_EPOCHS = 100
+STUDENT_EPOCHS = 150
+STUDENT_LOSS = 'smape'          # 'smape' or 'peak_weighted'
+WEIGHTS_PATH = 'local_model_weights_mlp_2.npz'
+SCALERS_PATH = 'local_model_scalers_mlp_2.npz'
+PARITY_SAMPLES = 1024
+BATCH_SIZE = 32
+
+
+def calibrated_metrics(y_pred_scaled, data):
+    """
+    Steps 8-9 for student outputs on the test windows: undo the target
+    scaling, calibrate with MedianCalibrator and score against y_test.
+    Returns (y_pred_final, calibration_factor, is_fallback, metrics).
+    """
+    _, scaler_y = dataset_scalers(data)
+    y_test_true = np.asarray(data['y_test'])
+
+    # Inverse transform
+    y_pred_log_restored = scaler_y.inverse_transform(np.asarray(y_pred_scaled).reshape(-1, 1)).flatten()
+    y_pred_original = np.expm1(y_pred_log_restored)
+
+    #  1. Rolling Median Calibration, 2. Global Boost (Force Recovery), 3. Final Clip
+    # MedianCalibrator computes all sliding-window medians in one vectorized pass
+    calibrator = MedianCalibrator()
+    y_pred_final, calibration_factor, is_fallback = calibrator.calibrate(y_test_true, y_pred_original)
+    return y_pred_final, calibration_factor, is_fallback, forecast_metrics(y_test_true, y_pred_final)
+
+
+class TrainingPipeline:
+    """
+    The local training script as named stages:
+
+        features -> teacher -> soft_labels -> student -> calibrate -> export
+
+    Each stage writes its outputs to RUN_DIR/<stage>/ and, last, a
+    stage.json marker holding a fingerprint of the stage's config and of
+    the upstream run it consumed. A stage whose marker matches is skipped,
+    so changing only the student config retrains the student (and what
+    follows) from the cached teacher soft labels; rerunning a stage
+    invalidates everything downstream of it.
+    """
+
+    def __init__(self, run_dir=RUN_DIR, csv_path=CSV_PATH, window=window_size):
+        self.run_dir = run_dir
+        self.csv_path = csv_path
+        self.window = window
+        self._data = None
+        self._meta = None
+        self._windows_fn = None
+        self._dataset_stamp = None
+
+    # --- Checkpoints ---
+
+    def stage_dir(self, stage):
+        path = os.path.join(self.run_dir, stage)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def stage_path(self, stage, filename):
+        return os.path.join(self.stage_dir(stage), filename)
+
+    def stage_config(self, stage):
+        """What a stage's outputs depend on besides its upstream stage."""
+        return {
+            'features': {'dataset': self.dataset_stamp(), 'window': self.window,
+                         'feature_store': bool(FEATURE_STORE_DIR)},
+            'teacher': {'epochs': TEACHER_EPOCHS, 'stream_windows': STREAM_WINDOWS},
+            'soft_labels': {},
+            'student': {'epochs': STUDENT_EPOCHS, 'loss': STUDENT_LOSS, 'hidden_units': list(STUDENT_HIDDEN_UNITS),
+                        'dropout': STUDENT_DROPOUT, 'learning_rate': STUDENT_LEARNING_RATE},
+            'calibrate': {'window': CALIBRATION_WINDOW, 'min_history': MIN_HISTORY},
+            'export': {'weights': WEIGHTS_PATH, 'scalers': SCALERS_PATH},
+        }[stage]
+
+    def dataset_stamp(self):
+        """Identifies the input data: its cache key, or the CSV's size and mtime without the cache."""
+        if self._dataset_stamp is None:
+            if USE_DATASET_CACHE:
+                self._dataset_stamp = dataset_key(self.csv_path, self.window)
+            else:
+                stat = os.stat(self.csv_path)
+                self._dataset_stamp = f"{os.path.abspath(self.csv_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        return self._dataset_stamp
+
+    def read_marker(self, stage):
+        try:
+            with open(os.path.join(self.run_dir, stage, 'stage.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def fingerprint(self, stage):
+        index = STAGES.index(stage)
+        upstream = self.read_marker(STAGES[index - 1]) if index else None
+        payload = {'stage': stage, 'config': self.stage_config(stage),
+                   'upstream': upstream['run_token'] if upstream else None}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def is_complete(self, stage):
+        marker = self.read_marker(stage)
+        return marker is not None and marker['fingerprint'] == self.fingerprint(stage)
+
+    def _mark_complete(self, stage, summary, seconds, run_token=None):
+        atomic_write_json(os.path.join(self.stage_dir(stage), 'stage.json'), {
+            'stage': stage,
+            'fingerprint': self.fingerprint(stage),
+            # Identifies this run of the stage; downstream fingerprints include it
+            'run_token': run_token or uuid.uuid4().hex,
+            'seconds': seconds,
+            'summary': summary,
+        })
+
+    def run(self, from_stage=None, to_stage=None):
+        """
+        Runs every stage up to to_stage, skipping completed ones. Stages from
+        from_stage on are rerun even if their checkpoint is current.
+        """
+        last = STAGES.index(to_stage) if to_stage else len(STAGES) - 1
+        first_forced = STAGES.index(from_stage) if from_stage else len(STAGES)
+        for index, stage in enumerate(STAGES[:last + 1]):
+            if index < first_forced and self.is_complete(stage):
+                print(f"[{stage}] checkpoint is current, skipping")
+                continue
+            print(f"[{stage}] running...")
+            start = time.perf_counter()
+            with profile_stage(f"train.{stage}") as info:
+                result = getattr(self, f"run_{stage}")()
+                info['bytes'] = self.output_bytes(stage)
+            summary, run_token = result if isinstance(result, tuple) else (result, None)
+            seconds = time.perf_counter() - start
+            self._mark_complete(stage, summary, seconds, run_token)
+            print(f"[{stage}] done in {seconds:.1f}s")
+
+    def output_bytes(self, stage):
+        """Size of the arrays a stage produced: the dataset for features, the checkpoint files otherwise."""
+        if stage == 'features':
+            return sum(int(np.asarray(v).nbytes) for v in self.data.values())
+        stage_dir = self.stage_dir(stage)
+        return sum(os.path.getsize(os.path.join(stage_dir, name)) for name in os.listdir(stage_dir)
+                   if name.endswith(('.npy', '.npz', '.h5')))
+
+    # --- Shared inputs ---
+
+    def _load(self):
+        if self._data is None:
+            self._data, self._meta = load_dataset(self.csv_path, self.window, USE_DATASET_CACHE, FEATURE_STORE_DIR)
+
+    @property
+    def data(self):
+        self._load()
+        return self._data
+
+    @property
+    def meta(self):
+        self._load()
+        return self._meta
+
+    @property
+    def n_features(self):
+        return self.data['X_scaled'].shape[1]
+
+    def windows(self, start, stop, targets=None, flatten=False, shuffle=False, batch_size=BATCH_SIZE):
+        """Model inputs for sequences [start, stop): a tf.data pipeline, or materialized arrays."""
+        if STREAM_WINDOWS:
+            if self._windows_fn is None:
+                from window_pipeline import window_dataset
+                # Windows are cut from the unscaled base rows (memory-mapped when cached)
+                base_X = self.data['features'][:-24]
+                scaler_X, _ = dataset_scalers(self.data)
+                self._windows_fn = lambda *args, **kwargs: window_dataset(base_X, self.window, *args,
+                                                                          scaler=scaler_X, **kwargs)
+            return self._windows_fn(start, stop, targets=targets, flatten=flatten, shuffle=shuffle,
+                                    batch_size=batch_size)
+
+        X = sliding_windows(self.data['X_scaled'], self.window)[start:stop]
+        if flatten:
+            X = X.reshape(X.shape[0], -1)
+        return X if targets is None else (X, np.asarray(targets))
+
+    def fit_inputs(self, train_targets, val_targets, flatten=False, batch_size=BATCH_SIZE):
+        split1, split2 = self.meta['split1'], self.meta['split2']
+        train = self.windows(0, split1, train_targets, flatten=flatten, shuffle=True, batch_size=batch_size)
+        val = self.windows(split1, split2, val_targets, flatten=flatten, batch_size=batch_size)
+        if STREAM_WINDOWS:
+            return dict(x=train, validation_data=val)
+        return dict(x=train[0], y=train[1], validation_data=val, batch_size=batch_size)
+
+    def load_teacher(self):
+        from models import build_teacher
+        teacher_model = build_teacher(self.window, self.n_features)
+        teacher_model.load_weights(self.stage_path('teacher', 'teacher.weights.h5'))
+        return teacher_model
+
+    def soft_labels(self):
+        """Cached teacher predictions for the train and validation windows, memory-mapped."""
+        return (np.load(self.stage_path('soft_labels', 'teacher_pred_train.npy'), mmap_mode='r'),
+                np.load(self.stage_path('soft_labels', 'teacher_pred_val.npy'), mmap_mode='r'))
+
+    # --- Stages ---
+
+    def run_features(self):
+        # === STEPS 1-5: Features, target, sequences, split, scaling (see dataset.py) ===
+        # The ArrayCache entry is this stage's checkpoint. Its token is the data stamp,
+        # so re-running the stage on unchanged data keeps the later checkpoints valid.
+        data, meta = self.data, self.meta
+        summary = {'rows': int(len(data['features'])), 'n_features': int(self.n_features),
+                   'split1': int(meta['split1']), 'split2': int(meta['split2'])}
+        return summary, self.dataset_stamp()
+
+    def run_teacher(self):
+        # === STEP 6: Teacher Model (LSTM) ===
+        from models import build_teacher, teacher_callbacks
+        print("Training DNN Teacher model...")
+        teacher_model = build_teacher(self.window, self.n_features)
+        history = teacher_model.fit(
+            **self.fit_inputs(self.data['y_train_scaled'], self.data['y_val_scaled']),
+            epochs=TEACHER_EPOCHS,
+            callbacks=teacher_callbacks(),
+            verbose=1
+        )
+        teacher_model.save_weights(self.stage_path('teacher', 'teacher.weights.h5'))
+        return {'epochs_run': len(history.history['loss']), 'best_val_loss': float(min(history.history['val_loss']))}
+
+    def run_soft_labels(self):
+        # === STEP 7a: Teacher soft labels for distillation ===
+        print("Computing teacher soft labels...")
+        teacher_model = self.load_teacher()
+        split1, split2 = self.meta['split1'], self.meta['split2']
+        teacher_pred_train = teacher_model.predict(self.windows(0, split1), verbose=0).flatten()
+        teacher_pred_val = teacher_model.predict(self.windows(split1, split2), verbose=0).flatten()
+        np.save(self.stage_path('soft_labels', 'teacher_pred_train.npy'), teacher_pred_train)
+        np.save(self.stage_path('soft_labels', 'teacher_pred_val.npy'), teacher_pred_val)
+        return {'n_train': int(len(teacher_pred_train)), 'n_val': int(len(teacher_pred_val))}
+
+    def run_student(self):
+        # === STEP 7b: Student Model (Small MLP) ===
+        from models import build_student, student_callbacks, STUDENT_LOSSES, mlp_weights
+        print("Training MLP Student via Knowledge Distillation...")
+        teacher_pred_train, teacher_pred_val = self.soft_labels()
+
+        # Keep small MLP (32 → 16 → 8 → 1) for blockchain compatibility
+        mlp_student = build_student(self.window * self.n_features, loss=STUDENT_LOSSES[STUDENT_LOSS])
+        history = mlp_student.fit(
+            **self.fit_inputs(teacher_pred_train, teacher_pred_val, flatten=True),
+            epochs=STUDENT_EPOCHS,
+            callbacks=student_callbacks(),
+            verbose=1
+        )
+        np.savez(self.stage_path('student', 'student_weights.npz'), **mlp_weights(mlp_student))
+
+        # Keras predictions on the test windows, for calibration and the export parity check
+        split2 = self.meta['split2']
+        n_sequences = split2 + len(self.data['y_test'])
+        y_pred_scaled = mlp_student.predict(self.windows(split2, n_sequences, flatten=True), verbose=0).flatten()
+        np.save(self.stage_path('student', 'student_pred_test.npy'), y_pred_scaled)
+        return {'epochs_run': len(history.history['loss']), 'best_val_loss': float(min(history.history['val_loss']))}
+
+    def run_calibrate(self):
+        # === STEP 8: Evaluation with STRONG Calibration ===
+        print("Evaluating MLP Student...")
+        y_pred_scaled = np.load(self.stage_path('student', 'student_pred_test.npy'))
+        y_test_true = np.asarray(self.data['y_test'])
+        y_pred_final, calibration_factor, is_fallback, metrics = calibrated_metrics(y_pred_scaled, self.data)
+        if is_fallback:
+            print(f" Applying fallback calibration: {calibration_factor:.3f}")
+        else:
+            print(f" Applying global calibration factor: {calibration_factor:.3f}")
+        np.save(self.stage_path('calibrate', 'y_pred_final.npy'), y_pred_final)
+
+        # === STEP 9: Metrics & Output ===
+        print(f"\nFinal Results (Daily Total):")
+        print(f"RMSE: {metrics['rmse']:.2f} kW")
+        print(f"MAE: {metrics['mae']:.2f} kW")
+        print(f"sMAPE: {metrics['smape']:.2f}%")
+
+        # Output predictions
+        print("\n============================================================")
+        print("         FINAL PREDICTION OUTPUT")
+        print("============================================================")
+        for i in range(min(10, len(y_test_true))):
+            actual = y_test_true[i]
+            pred = y_pred_final[i]
+            error = abs(pred - actual) / actual * 100
+            status = "✅ Success" if error < 5 else "⚠️  Warning"
+            print(f"Direct sum (from data): {actual:.2f} kW")
+            print(f"Reconstructed (y_test_true): {actual:.2f} kW")
+            print(f"Calibrated Predicted: {pred:.2f} kW  ← {error:.1f}% error → {status}")
+            print("Error: 0.00 kW\n")
+        return dict(metrics, calibration_factor=float(calibration_factor), is_fallback=bool(is_fallback))
+
+    def run_export(self):
+        # === STEP 10: Save Weights ===
+        shutil.copyfile(self.stage_path('student', 'student_weights.npz'), WEIGHTS_PATH)
+        print(f"Saving MLP weights: {WEIGHTS_PATH}")
+        print(f"MLP weights saved ({os.path.getsize(WEIGHTS_PATH)} bytes)")
+
+        scaler_X, scaler_y = dataset_scalers(self.data)
+        save_scalers(SCALERS_PATH, scaler_X, scaler_y, self.window, self.meta['feature_cols'])
+
+        # Parity check: the TensorFlow-free runtime must reproduce the Keras student
+        y_pred_scaled = np.load(self.stage_path('student', 'student_pred_test.npy'), mmap_mode='r')
+        student_runtime = MLPStudent(WEIGHTS_PATH, SCALERS_PATH)
+        split2 = self.meta['split2']
+        parity_n = min(PARITY_SAMPLES, len(y_pred_scaled))
+        raw_test_windows = sliding_windows(self.data['features'][:-24], self.window)[split2:split2 + parity_n]
+        runtime_pred = student_runtime.predict_scaled(student_runtime.scale_inputs(raw_test_windows))
+        max_diff = float(np.max(np.abs(runtime_pred - y_pred_scaled[:parity_n])))
+        print(f"NumPy runtime parity (max abs diff vs Keras): {max_diff:.3e}")
+        np.testing.assert_allclose(runtime_pred, y_pred_scaled[:parity_n], rtol=0, atol=PARITY_ATOL,
+                                   err_msg="NumPy runtime does not reproduce the Keras student's test predictions")
+        return {'weights_bytes': os.path.getsize(WEIGHTS_PATH), 'parity_max_abs_diff': max_diff}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the local teacher and distilled student in checkpointed stages.")
+    parser.add_argument("--from-stage", choices=STAGES, default=None,
+                        help="Rerun this stage and everything after it even if checkpointed")
+    parser.add_argument("--to-stage", choices=STAGES, default=None, help="Stop after this stage")
+    parser.add_argument("--run-dir", default=RUN_DIR)
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--profile", default=None, help="Write per-stage wall time, peak RSS and array bytes to this JSON file")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.enabled = True
+    TrainingPipeline(args.run_dir, args.csv).run(args.from_stage, args.to_stage)
+    if args.profile:
+        print_profile(profiler.report())
+        print(f"Profile: {profiler.save(args.profile)}")
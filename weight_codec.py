@@ -0,0 +1,148 @@
+import hashlib
+import io
+import json
+import zipfile
+import numpy as np
+from npz_utils import npz_memmap
+
+# --- CONFIGURATION ---
+LAYER_KEYS = ('W1', 'b1', 'W2', 'b2', 'W3', 'b3', 'W4', 'b4')
+FORMAT_KEY = '__format__'
+CODEC_VERSION = 1
+MODES = ('float32', 'float16', 'int8')
+INT8_MAX = 127
+
+
+def weights_sha256(weights):
+    """Identifies a model by hashing its float32 layers in W1..b4 order."""
+    digest = hashlib.sha256()
+    for key in LAYER_KEYS:
+        layer = np.ascontiguousarray(weights[key], dtype=np.float32)
+        digest.update(key.encode('ascii'))
+        digest.update(str(layer.shape).encode('ascii'))
+        digest.update(layer.tobytes())
+    return digest.hexdigest()
+
+
+def _quantize(tensor, mode):
+    """Returns (stored array, scale or None)."""
+    if mode == 'float32':
+        return tensor.astype(np.float32), None
+    if mode == 'float16':
+        return tensor.astype(np.float16), None
+    # Symmetric per-tensor int8
+    max_abs = float(np.max(np.abs(tensor))) if tensor.size else 0.0
+    scale = max_abs / INT8_MAX if max_abs > 0 else 1.0
+    q = np.clip(np.rint(tensor / scale), -INT8_MAX, INT8_MAX).astype(np.int8)
+    return q, np.float32(scale)
+
+
+def encode_update(weights, base=None, mode='float32'):
+    """
+    Encodes W1..b4 for upload as a zlib-compressed npz. With a base (the
+    last global model) only the delta weights - base is sent. Each tensor
+    is stored as float32 (the default, no quantization), or lossy float16
+    or int8 plus a per-tensor float32 scale.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    arrays = {}
+    for key in LAYER_KEYS:
+        tensor = np.asarray(weights[key], dtype=np.float32)
+        if base is not None:
+            tensor = tensor - np.asarray(base[key], dtype=np.float32)
+        arrays[key], scale = _quantize(tensor, mode)
+        if scale is not None:
+            arrays[f"{key}__scale"] = scale
+
+    header = {'version': CODEC_VERSION, 'mode': mode, 'delta': base is not None,
+              'base_sha256': weights_sha256(base) if base is not None else None}
+    arrays[FORMAT_KEY] = np.frombuffer(json.dumps(header).encode('utf-8'), dtype=np.uint8)
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def read_header(npz):
+    """Codec header of an opened npz, or None for a plain save_mlp_weights file."""
+    if FORMAT_KEY not in npz.files:
+        return None
+    return json.loads(npz[FORMAT_KEY].tobytes().decode('utf-8'))
+
+
+def decode_update(data, bases=None):
+    """
+    Rebuilds full-precision float32 W1..b4 from an encoded upload, given as
+    bytes or as a file path. Plain npz files (as written by save_mlp_weights)
+    are returned unchanged, memory-mapped rather than read when given as a
+    path; missing layers are left out for the caller to reject. bases maps
+    base_sha256 -> global model weights for delta uploads.
+    """
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(data)
+    else:
+        source = data
+        try:
+            arrays = npz_memmap(data)
+        except (ValueError, zipfile.BadZipFile):
+            arrays = None  # Compressed codec upload (or not an npz): np.load below decides
+        if arrays is not None and FORMAT_KEY not in arrays:
+            return {key: arrays[key] for key in LAYER_KEYS if key in arrays}
+
+    with np.load(source, allow_pickle=False) as npz:
+        header = read_header(npz)
+        if header is None:
+            return {key: npz[key] for key in LAYER_KEYS if key in npz.files}
+        if header['version'] != CODEC_VERSION:
+            raise ValueError(f"Unsupported weight codec version {header['version']}")
+
+        base = None
+        if header['delta']:
+            base = (bases or {}).get(header['base_sha256'])
+            if base is None:
+                raise ValueError(f"Delta upload against unknown base model {header['base_sha256']}")
+
+        weights = {}
+        for key in LAYER_KEYS:
+            if key not in npz.files or (header['mode'] == 'int8' and f"{key}__scale" not in npz.files):
+                continue  # Left for structure_errors to report, as for plain npz uploads
+            tensor = npz[key].astype(np.float32)
+            if header['mode'] == 'int8':
+                tensor *= npz[f"{key}__scale"]
+            if base is not None:
+                tensor += np.asarray(base[key], dtype=np.float32)
+            weights[key] = tensor
+        return weights
+
+
+def compression_report(weights, encoded, decoded):
+    """
+    Per-layer raw float32 bytes, compressed bytes on the wire, and
+    reconstruction error of decoded against the original weights.
+    """
+    with zipfile.ZipFile(io.BytesIO(encoded)) as zf:
+        compressed = {info.filename[:-4]: info.compress_size for info in zf.infolist()}
+
+    rows = []
+    for key in LAYER_KEYS:
+        original = np.asarray(weights[key], dtype=np.float32)
+        error = decoded[key] - original
+        rows.append({
+            'layer': key,
+            'raw_bytes': original.nbytes,
+            'encoded_bytes': compressed.get(key, 0) + compressed.get(f"{key}__scale", 0),
+            'max_abs_error': float(np.max(np.abs(error))) if error.size else 0.0,
+            'rmse': float(np.sqrt(np.mean(np.square(error, dtype=np.float64)))) if error.size else 0.0,
+        })
+    return rows
+
+
+def print_compression_report(rows, total_bytes):
+    raw_total = sum(row['raw_bytes'] for row in rows)
+    print(f"{'Layer':<6}{'Raw':>12}{'Encoded':>12}{'Max err':>12}{'RMSE':>12}")
+    for row in rows:
+        print(f"{row['layer']:<6}{row['raw_bytes']:>12}{row['encoded_bytes']:>12}"
+              f"{row['max_abs_error']:>12.2e}{row['rmse']:>12.2e}")
+    print(f"Total: {raw_total} raw bytes -> {total_bytes} bytes uploaded "
+          f"({100 * (1 - total_bytes / raw_total):.1f}% saved)")
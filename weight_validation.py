@@ -0,0 +1,106 @@
+import numpy as np
+from fedavg import LAYER_KEYS, OUTPUT_DTYPE
+from models import STUDENT_HIDDEN_UNITS
+
+# --- CONFIGURATION ---
+ALLOWED_DTYPES = (np.dtype(OUTPUT_DTYPE),)  # Student weights (and decoded codec uploads) are float32
+MAX_UPDATE_NORM = None  # Reject updates whose global L2 norm exceeds this; None records the norm only
+
+
+def expected_shapes(n_inputs, hidden_units=STUDENT_HIDDEN_UNITS):
+    """W1..b4 shapes of the n_inputs -> hidden_units -> 1 student."""
+    units = (n_inputs,) + tuple(hidden_units) + (1,)
+    shapes = {}
+    for i in range(1, len(units)):
+        shapes[f"W{i}"] = (units[i - 1], units[i])
+        shapes[f"b{i}"] = (units[i],)
+    return shapes
+
+
+def structure_errors(weights, reference=None, hidden_units=STUDENT_HIDDEN_UNITS):
+    """
+    Missing keys and wrong shapes or dtypes. Shapes must match the reference
+    model if one is given, otherwise the student architecture for whatever
+    input width W1 has. Only array headers are inspected, no data is read.
+    """
+    missing = [key for key in LAYER_KEYS if key not in weights]
+    if missing:
+        return [f"missing arrays: {', '.join(missing)}"]
+    errors = []
+    if reference is not None:
+        shapes = {key: np.shape(reference[key]) for key in LAYER_KEYS}
+    else:
+        shapes = expected_shapes(np.shape(weights['W1'])[0] if np.ndim(weights['W1']) == 2 else -1, hidden_units)
+    for key in LAYER_KEYS:
+        layer = weights[key]
+        if np.shape(layer) != tuple(shapes[key]):
+            errors.append(f"{key} has shape {np.shape(layer)}, expected {tuple(shapes[key])}")
+        if np.asarray(layer).dtype not in ALLOWED_DTYPES:
+            errors.append(f"{key} has dtype {np.asarray(layer).dtype}, expected one of "
+                          f"{', '.join(str(d) for d in ALLOWED_DTYPES)}")
+    return errors
+
+
+def sample_weight_errors(sample_weight):
+    """The update's FedAvg weight (its num_samples) must be a positive, finite number."""
+    if sample_weight is None or (np.isfinite(sample_weight) and sample_weight > 0):
+        return []
+    return [f"sample weight {sample_weight!r} is not a positive finite number"]
+
+
+def update_statistics(weights, reference=None):
+    """
+    Per-layer L2 norms plus, against the reference (current global) model,
+    the cosine distance and L2 distance of the whole flattened update. Each
+    layer is upcast to float64 once, one layer at a time, and every sum is
+    accumulated in float64; the L2 distance is the norm of update - reference
+    itself rather than an expansion of it, which cancels for nearby models.
+    A NaN or Inf anywhere makes x.x non-finite; only then are the bad values
+    counted.
+    """
+    layer_norms = {}
+    non_finite = {}
+    sq_total = dot_total = ref_sq_total = dist_sq_total = 0.0
+    for key in LAYER_KEYS:
+        flat = np.ravel(weights[key]).astype(np.float64)
+        sq = float(np.dot(flat, flat))
+        if not np.isfinite(sq):
+            non_finite[key] = int(flat.size - np.count_nonzero(np.isfinite(flat)))
+        layer_norms[key] = float(np.sqrt(sq))
+        sq_total += sq
+        if reference is not None and not non_finite:
+            ref = np.ravel(reference[key]).astype(np.float64)
+            dot_total += float(np.dot(flat, ref))
+            ref_sq_total += float(np.dot(ref, ref))
+            np.subtract(flat, ref, out=flat)
+            dist_sq_total += float(np.dot(flat, flat))
+
+    stats = {'norm': float(np.sqrt(sq_total)), 'layer_norms': layer_norms}
+    if non_finite:
+        stats['non_finite'] = non_finite
+    if reference is not None and not non_finite:
+        denominator = np.sqrt(sq_total) * np.sqrt(ref_sq_total)
+        stats['cosine_distance'] = float(1.0 - dot_total / denominator) if denominator > 0 else None
+        stats['l2_distance'] = float(np.sqrt(dist_sq_total))
+    return stats
+
+
+def validate_update(weights, reference=None, max_norm=MAX_UPDATE_NORM, hidden_units=STUDENT_HIDDEN_UNITS,
+                    sample_weight=None):
+    """
+    Checks a received W1..b4 update (a dict of arrays, e.g. from npz_memmap
+    or decode_update) and the sample_weight it will be aggregated with, and
+    returns a JSON-serializable report:
+    {'valid', 'errors', 'norm', 'layer_norms', 'cosine_distance', ...}.
+    Statistics are only computed once the structure is valid.
+    """
+    errors = structure_errors(weights, reference, hidden_units)
+    if errors:
+        return {'valid': False, 'errors': errors + sample_weight_errors(sample_weight)}
+    errors = sample_weight_errors(sample_weight)
+    report = update_statistics(weights, reference)
+    if report.get('non_finite'):
+        errors.append("non-finite values in " + ", ".join(f"{key} ({n})" for key, n in report['non_finite'].items()))
+    if max_norm is not None and report['norm'] > max_norm:
+        errors.append(f"update norm {report['norm']:.4g} exceeds {max_norm:.4g}")
+    return dict(report, valid=not errors, errors=errors)
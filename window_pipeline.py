@@ -0,0 +1,64 @@
+import numpy as np
+import tensorflow as tf
+
+# --- CONFIGURATION ---
+BATCH_SIZE = 32
+PARALLEL_CALLS = tf.data.AUTOTUNE
+
+
+def _gather_windows(base, center, scale, window, flatten):
+    """Returns a numpy function mapping a batch of window starts to scaled windows."""
+    offsets = np.arange(window)
+
+    def gather(starts):
+        # (batch, window, features) straight from the (possibly memory-mapped) base rows
+        windows = np.asarray(base[starts[:, None] + offsets], dtype=np.float64)
+        windows = (windows - center) / scale
+        if flatten:
+            windows = windows.reshape(len(starts), -1)
+        return windows.astype(np.float32)
+
+    return gather
+
+
+def window_dataset(base, window, start, stop, targets=None, scaler=None,
+                   flatten=False, shuffle=False, batch_size=BATCH_SIZE, seed=None):
+    """
+    tf.data pipeline over windows base[j:j+window] for j in [start, stop).
+    Windows are sliced from the base feature matrix, scaled with the fitted
+    RobustScaler's center/scale and batched on the fly, so only the base
+    matrix (not n * window copies of it) is ever held in memory. With
+    flatten=True each window is reshaped to (window * features,) for the MLP.
+    targets, if given, holds one label per window in [start, stop).
+    """
+    n_features = base.shape[1]
+    center = np.zeros(n_features) if scaler is None else np.asarray(scaler.center_)
+    scale = np.ones(n_features) if scaler is None else np.asarray(scaler.scale_)
+    gather = _gather_windows(base, center, scale, window, flatten)
+    x_shape = [None, window * n_features] if flatten else [None, window, n_features]
+
+    ds = tf.data.Dataset.range(start, stop)
+    if shuffle:
+        # Only window indices are shuffled, matching Keras' per-epoch shuffle of arrays
+        ds = ds.shuffle(stop - start, seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+
+    if targets is None:
+        def load(starts):
+            x = tf.numpy_function(gather, [starts], tf.float32)
+            x.set_shape(x_shape)
+            return x
+    else:
+        targets = np.asarray(targets, dtype=np.float32)
+
+        def gather_targets(starts):
+            return targets[starts - start]
+
+        def load(starts):
+            x = tf.numpy_function(gather, [starts], tf.float32)
+            y = tf.numpy_function(gather_targets, [starts], tf.float32)
+            x.set_shape(x_shape)
+            y.set_shape([None])
+            return x, y
+
+    return ds.map(load, num_parallel_calls=PARALLEL_CALLS, deterministic=True).prefetch(tf.data.AUTOTUNE)
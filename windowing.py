@@ -0,0 +1,144 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.preprocessing import RobustScaler
+
+# --- CONFIGURATION ---
+TARGET_OFFSET = 24    # Target window starts 24 hours after the current step
+TARGET_HORIZON = 24   # ...and sums the following 24 hours
+WINDOW_SIZE = 72      # Hours of history in each input sequence
+SPLIT_RATIOS = (0.7, 0.85)
+
+
+def next_day_sum_target(y, offset=TARGET_OFFSET, horizon=TARGET_HORIZON):
+    """
+    Returns target[i] = sum(y[i+offset : i+offset+horizon]) for every i in
+    range(len(y) - offset), using one cumulative sum instead of a Python loop.
+    Like the original slice-based loop, windows near the end are truncated.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y) - offset
+    if n <= 0:
+        return np.empty(0, dtype=np.float64)
+    csum = np.concatenate(([0.0], np.cumsum(y)))
+    start = np.arange(n) + offset
+    stop = np.minimum(start + horizon, len(y))
+    return csum[stop] - csum[start]
+
+
+def sliding_windows(X, window=WINDOW_SIZE):
+    """
+    Returns a read-only (n - window, window, features) view of X where
+    windows[j] == X[j:j+window]. No data is copied.
+    """
+    X = np.asarray(X)
+    n_windows = max(len(X) - window, 0)
+    # sliding_window_view puts the window axis last: (n, features, window)
+    view = sliding_window_view(X, window, axis=0)[:n_windows]
+    return view.swapaxes(1, 2)
+
+
+def create_sequences(X, y, window=WINDOW_SIZE):
+    """
+    Zero-copy equivalent of the original list-based create_sequences:
+    X_out[j] = X[j:j+window] and y_out[j] = y[j+window].
+    """
+    return sliding_windows(X, window), np.asarray(y)[window:len(X)]
+
+
+def split_points(n, ratios=SPLIT_RATIOS):
+    """Returns the (train_end, val_end) indices for a chronological split."""
+    return int(ratios[0] * n), int(ratios[1] * n)
+
+
+def window_row_counts(n_windows, window=WINDOW_SIZE):
+    """
+    Number of times each base row appears in the first n_windows windows.
+    Row r is covered by windows max(0, r-window+1) .. min(r, n_windows-1).
+    """
+    rows = np.arange(n_windows + window - 1)
+    return np.minimum(rows, n_windows - 1) - np.maximum(0, rows - window + 1) + 1
+
+
+def _order_statistics(sorted_values, cum_counts, ranks):
+    """Values at the given 0-based ranks of a sorted, run-length encoded sample."""
+    return sorted_values[np.searchsorted(cum_counts, ranks, side='right')]
+
+
+def _weighted_percentile(sorted_values, cum_counts, q):
+    """
+    np.percentile(..., method='linear') of the expanded sample, computed
+    with numpy's virtual-index and lerp formulas so results match.
+    """
+    total = int(cum_counts[-1])
+    quantile = q / 100
+    virtual = (total - 1) * quantile  # numpy's 'linear' method (alpha = beta = 1)
+    previous = int(np.floor(virtual))
+    lower, upper = _order_statistics(sorted_values, cum_counts, [previous, min(previous + 1, total - 1)])
+    gamma = virtual - previous
+    diff = upper - lower
+    if gamma >= 0.5:
+        return upper - diff * (1 - gamma)
+    return lower + diff * gamma
+
+
+def fit_window_robust_scaler(X, n_windows, window=WINDOW_SIZE, quantile_range=(25.0, 75.0)):
+    """
+    Fits a RobustScaler exactly as if it had been fit on
+    sliding_windows(X, window)[:n_windows].reshape(-1, features), but works on
+    the base rows weighted by how many windows contain them, so the repeated
+    (n_windows * window, features) matrix is never built.
+    """
+    return fit_pooled_window_robust_scaler([(X, n_windows)], window, quantile_range)
+
+
+def fit_pooled_window_robust_scaler(series, window=WINDOW_SIZE, quantile_range=(25.0, 75.0)):
+    """
+    fit_window_robust_scaler over the first n_windows windows of several
+    (X, n_windows) series at once, as if all their flattened windows had been
+    stacked. No window spans two series.
+    """
+    bases, weights = [], []
+    for X, n_windows in series:
+        if n_windows <= 0:
+            raise ValueError(f"Need at least one window to fit the scaler, got n_windows={n_windows}")
+        counts = window_row_counts(n_windows, window)
+        bases.append(np.asarray(X[:len(counts)], dtype=np.float64))
+        weights.append(counts)
+    base = np.concatenate(bases)
+    counts = np.concatenate(weights)
+    total = int(counts.sum())
+
+    center = np.empty(base.shape[1])
+    scale = np.empty(base.shape[1])
+    for col in range(base.shape[1]):
+        order = np.argsort(base[:, col], kind='stable')
+        values = base[order, col]
+        cum_counts = np.cumsum(counts[order])
+
+        # np.median: middle element, or mean of the two middle elements
+        if total % 2:
+            center[col] = _order_statistics(values, cum_counts, [total // 2])[0]
+        else:
+            pair = _order_statistics(values, cum_counts, [total // 2 - 1, total // 2])
+            center[col] = np.mean(pair)
+
+        q_low = _weighted_percentile(values, cum_counts, quantile_range[0])
+        q_high = _weighted_percentile(values, cum_counts, quantile_range[1])
+        scale[col] = q_high - q_low
+
+    # Same zero-scale handling as sklearn
+    scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+
+    scaler = RobustScaler(quantile_range=quantile_range)
+    scaler.center_ = center
+    scaler.scale_ = scale
+    scaler.n_features_in_ = base.shape[1]
+    return scaler
+
+
+def scaled_windows(scaler, X, window=WINDOW_SIZE):
+    """
+    Scales the base rows once and returns windows over the result. Since the
+    scalers are per-feature and elementwise, this equals scaling every window.
+    """
+    return sliding_windows(scaler.transform(np.asarray(X, dtype=np.float64)), window)